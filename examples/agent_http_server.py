@@ -0,0 +1,305 @@
+# %% [markdown]
+# # HTTP Serving Layer for the LangGraph Chat Agent
+#
+# Exposes the compiled graph from `agent_stateful_chat_langgraph.py` over HTTP:
+# - `POST /chat` with `{"session_id": ..., "message": ..., "stream": false}`
+#   returns `{"session_id": ..., "content": ...}`; with `"stream": true` it
+#   returns Server-Sent Events (`data: {"token": ...}` then `event: done`)
+# - `DELETE /sessions/{session_id}` drops a session's history
+# - `GET /healthz` reports in-flight turns (503 while draining)
+#
+# Back-pressure: at most `MAX_UPSTREAM_CALLS` turns call the endpoint at once,
+# at most `MAX_PENDING_TURNS` wait behind them (beyond that: 429), and a slow
+# SSE reader pauses token production instead of buffering without bound.
+# On SIGTERM/SIGINT new turns are refused and in-flight turns are drained for
+# up to `DRAIN_TIMEOUT_SECONDS`.
+#
+#     python agent_http_server.py  # listens on http://0.0.0.0:8000
+
+# %%
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from agent_stateful_chat_langgraph import app as graph, MAX_UPSTREAM_CALLS, TURN_BUDGET_SECONDS
+from message_store import CompactMessages
+from turn_deadline import new_deadline
+
+# --- Configuration ---
+HOST = os.environ.get('AGENT_HOST', '0.0.0.0')
+PORT = int(os.environ.get('AGENT_PORT', '8000'))
+MAX_PENDING_TURNS = int(os.environ.get('MAX_PENDING_TURNS', '64'))
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', '10000'))  # Least recently used sessions are evicted
+DRAIN_TIMEOUT_SECONDS = float(os.environ.get('DRAIN_TIMEOUT_SECONDS', str(TURN_BUDGET_SECONDS + 5)))
+STREAM_BUFFER_TOKENS = 64  # Tokens buffered per SSE stream before the producer waits
+
+
+class ChatRequest(BaseModel):
+    session_id: Optional[str] = None
+    message: str
+    stream: bool = False
+
+
+class Session:
+    def __init__(self):
+        self.history = CompactMessages()
+        self.lock = asyncio.Lock()  # One turn at a time per session
+        self.closed = False
+
+    def close(self):
+        """Drop the history now, or when the turn holding the lock is done with it."""
+        self.closed = True
+        if not self.lock.locked():
+            self.history.close()
+
+    def unlock(self):
+        if self.closed:
+            self.history.close()
+        self.lock.release()
+
+
+class Admission:
+    """A reserved turn slot, released exactly once: by the turn once it started, else by the request."""
+
+    def __init__(self, service):
+        self.service = service
+        self.turn_started = False
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.service.release()
+
+
+class AgentService:
+    """Sessions, admission control and drain bookkeeping for the server."""
+
+    def __init__(self):
+        self.sessions = OrderedDict()
+        self.upstream = asyncio.Semaphore(MAX_UPSTREAM_CALLS)
+        # Graph turns run on their own pool, sized to the upstream bound
+        self.executor = ThreadPoolExecutor(max_workers=MAX_UPSTREAM_CALLS, thread_name_prefix="agent-turn")
+        self.inflight = 0
+        self.draining = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session()
+            while len(self.sessions) > MAX_SESSIONS:
+                _, evicted = self.sessions.popitem(last=False)
+                evicted.close()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def admit(self):
+        """Reserve a turn slot and return its Admission, or raise 503 (draining) / 429 (overloaded)."""
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Server is shutting down.")
+        if self.inflight >= MAX_UPSTREAM_CALLS + MAX_PENDING_TURNS:
+            raise HTTPException(status_code=429, detail="Too many turns in flight.", headers={"Retry-After": "1"})
+        self.inflight += 1
+        self.idle.clear()
+        return Admission(self)
+
+    def release(self):
+        self.inflight -= 1
+        if self.inflight == 0:
+            self.idle.set()
+
+    async def drain(self):
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=DRAIN_TIMEOUT_SECONDS)
+            print("All in-flight turns drained.")
+        except asyncio.TimeoutError:
+            print(f"Drain timed out with {self.inflight} turns still in flight.")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+service = None
+
+
+@asynccontextmanager
+async def lifespan(api):
+    global service
+    service = AgentService()
+    print(f"Agent server ready (max upstream calls: {MAX_UPSTREAM_CALLS}, max pending: {MAX_PENDING_TURNS})")
+    yield
+    await service.drain()
+
+
+api = FastAPI(title="SageMaker LangGraph Agent", lifespan=lifespan)
+
+
+async def _begin_turn(session, message, work, admission):
+    """Lock the session, take an upstream slot and run `work(history)` on the executor.
+
+    From then on the turn owns the admission. Everything is released by a
+    done-callback when the turn finishes, so a client that disconnects mid-turn
+    can't unlock the session (or close its history) while the turn still uses it.
+    """
+    acquired = []
+    try:
+        await session.lock.acquire()
+        acquired.append(session.unlock)
+        await service.upstream.acquire()
+        acquired.append(service.upstream.release)
+        if session.closed:  # Deleted or evicted while this turn was queued
+            raise HTTPException(status_code=404, detail="Unknown session.")
+        session.history.append({"role": "user", "content": message})
+        future = asyncio.get_running_loop().run_in_executor(service.executor, work, session.history)
+        admission.turn_started = True
+    except BaseException:
+        for release in reversed(acquired):
+            release()
+        raise
+
+    def finish(future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            session.history = future.result()["messages"]
+        service.upstream.release()
+        session.unlock()
+        admission.release()
+
+    future.add_done_callback(finish)
+    return future
+
+
+async def _run_turn(session_id, session, message, deadline, admission):
+    try:
+        future = await _begin_turn(
+            session, message,
+            lambda history: graph.invoke({"messages": history, "deadline": deadline, "session": session_id}), admission
+        )
+        result = await asyncio.shield(future)
+        return {"session_id": session_id, "content": result["messages"][-1]["content"]}
+    finally:
+        if not admission.turn_started:
+            admission.release()
+
+
+class TurnStreamingResponse(StreamingResponse):
+    """Releases the turn's admission even if the client left before the body started streaming."""
+
+    def __init__(self, content, admission, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if not self.admission.turn_started:
+                self.admission.release()
+
+
+async def _stream_turn(session_id, session, message, deadline, admission):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER_TOKENS)
+    disconnected = False
+
+    def produce(history):
+        # Runs on the executor; blocks on a full queue so slow readers slow the producer
+        final, error = None, None
+        try:
+            inputs = {"messages": history, "deadline": deadline, "session": session_id}
+            for mode, chunk in graph.stream(inputs, stream_mode=["custom", "values"]):
+                if mode == "values":
+                    final = chunk
+                elif not disconnected:
+                    asyncio.run_coroutine_threadsafe(queue.put(("token", chunk["token"])), loop).result()
+        except Exception as e:
+            error = e
+        if not disconnected:
+            asyncio.run_coroutine_threadsafe(queue.put(("done", (final, error))), loop).result()
+        return final
+
+    try:
+        yield f"event: session\ndata: {json.dumps({'session_id': session_id})}\n\n"
+        await _begin_turn(session, message, produce, admission)
+        while True:
+            kind, value = await queue.get()
+            if kind == "token":
+                yield f"data: {json.dumps({'token': value})}\n\n"
+                continue
+            final, error = value
+            if error is not None:
+                yield f"event: error\ndata: {json.dumps({'error': str(error)})}\n\n"
+            else:
+                content = final["messages"][-1]["content"]
+                yield f"event: done\ndata: {json.dumps({'session_id': session_id, 'content': content})}\n\n"
+            break
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away: stop feeding the queue and unblock the producer. The turn
+        # itself finishes in the background, bounded by its deadline.
+        disconnected = True
+        while not queue.empty():
+            queue.get_nowait()
+        raise
+    finally:
+        if not admission.turn_started:
+            admission.release()
+
+
+@api.post("/chat")
+async def chat(request: ChatRequest):
+    admission = service.admit()
+    # The deadline starts at admission, so time spent queueing counts against the turn
+    deadline = new_deadline(TURN_BUDGET_SECONDS)
+    session_id = request.session_id or uuid.uuid4().hex
+    session = service.session(session_id)
+    if request.stream:
+        return TurnStreamingResponse(
+            _stream_turn(session_id, session, request.message, deadline, admission), admission,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Session-Id": session_id},
+        )
+    return await _run_turn(session_id, session, request.message, deadline, admission)
+
+
+@api.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    session = service.sessions.pop(session_id, None)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session.")
+    session.close()  # Deferred until the running turn, if any, is done with the history
+    return {"session_id": session_id, "deleted": True}
+
+
+@api.get("/healthz")
+async def healthz():
+    status = 503 if service.draining else 200
+    return JSONResponse(
+        status_code=status,
+        content={"draining": service.draining, "inflight": service.inflight, "sessions": len(service.sessions)},
+    )
+
+
+class DrainingServer(uvicorn.Server):
+    """Flags the service as draining as soon as a shutdown signal arrives."""
+
+    def handle_exit(self, sig, frame):
+        if service is not None:
+            service.draining = True
+        super().handle_exit(sig, frame)
+
+
+if __name__ == "__main__":
+    config = uvicorn.Config(
+        api, host=HOST, port=PORT, timeout_graceful_shutdown=int(DRAIN_TIMEOUT_SECONDS), log_level="info"
+    )
+    DrainingServer(config).run()
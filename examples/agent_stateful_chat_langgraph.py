@@ -8,142 +8,169 @@
 # pip install -r requirements.txt -q
 # pip install 'sagemaker==2.251.1' --no-deps
 
-import sagemaker
 import boto3
-import json
-from sagemaker.predictor import Predictor
-from sagemaker.serializers import JSONSerializer
-from sagemaker.deserializers import JSONDeserializer
-from typing import Annotated, TypedDict, List, Dict, Any
+import os
+import sys
+from typing import Annotated, TypedDict, Dict, Any, Sequence
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import StreamWriter
+from circuit_breaker import BedrockChatBackend, FailoverChat, SageMakerChatBackend
+from message_store import CompactMessages, as_message_store
+from prompt_layout import SYSTEM_PROMPT, layout_messages, router_from_env
+from turn_deadline import (
+    DeadlineRuntimeClients,
+    ThroughputEstimator,
+    MIN_CALL_SECONDS,
+    new_deadline,
+    time_left,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from traffic_capture import capture_from_env
+from tgi_serving_params import estimate_prompt_tokens, fit_max_new_tokens, load_model_config, plan_serving_params
 
 # Configuration
 # Configuration
 PROFILE_NAME = os.environ.get('AWS_PROFILE', 'default')
 REGION_NAME = 'us-east-1' # Change to 'ap-south-1' or other regions as needed
-ENDPOINT_NAME = "jumpstart-dft-deepseek-llm-r1-disti-20251206-121042"
-
-print(f"Using Endpoint: {ENDPOINT_NAME}")
+ENDPOINT_NAME = os.environ.get('SAGEMAKER_ENDPOINT_NAME', "jumpstart-dft-deepseek-llm-r1-disti-20251206-121042")
+# Inference component to target when the endpoint hosts several models (see scripts/inference_components.py)
+INFERENCE_COMPONENT_NAME = os.environ.get('SAGEMAKER_INFERENCE_COMPONENT')
+# Optional runtime URL override, e.g. http://127.0.0.1:8081 for scripts/local_endpoint_standin.py
+RUNTIME_ENDPOINT_URL = os.environ.get('SAGEMAKER_RUNTIME_ENDPOINT_URL')
+# Concurrent endpoint calls allowed (also the HTTP connection pool size); see agent_http_server.py
+MAX_UPSTREAM_CALLS = int(os.environ.get('MAX_UPSTREAM_CALLS', '16'))
+# Failover targets used while the primary endpoint's circuit is open (both optional)
+FALLBACK_ENDPOINT_NAME = os.environ.get('FALLBACK_ENDPOINT_NAME')
+# A fallback component on the same endpoint (or on FALLBACK_ENDPOINT_NAME when both are set)
+FALLBACK_INFERENCE_COMPONENT = os.environ.get('FALLBACK_INFERENCE_COMPONENT')
+BEDROCK_FALLBACK_MODEL_ARN = os.environ.get('BEDROCK_FALLBACK_MODEL_ARN') # See rag_hybrid_bedrock_sagemaker.py
+# Wall-clock budget for a single turn (graph invocation), including the endpoint call
+TURN_BUDGET_SECONDS = float(os.environ.get('TURN_BUDGET_SECONDS', '60'))
+MAX_TOKENS = 2048 # Upper bound; shrunk per turn to fit the remaining budget and the endpoint's token limits
+# TGI rejects prompt + max_tokens above MAX_TOTAL_TOKENS with a 422. The limits are planned the way the deploy
+# script plans them (scripts/tgi_serving_params.py); set these if the endpoint runs another model or instance.
+SERVING_PLAN = plan_serving_params(
+    load_model_config(os.environ.get('ENDPOINT_MODEL_ID', 'deepseek-ai/DeepSeek-R1-Distill-Llama-8B')),
+    os.environ.get('ENDPOINT_INSTANCE_TYPE', 'ml.g5.2xlarge'),
+)
+
+print(f"Using Endpoint: {ENDPOINT_NAME}" + (f" (component {INFERENCE_COMPONENT_NAME})" if INFERENCE_COMPONENT_NAME else ""))
 print(f"Region: {REGION_NAME}")
+print(f"Turn budget: {TURN_BUDGET_SECONDS}s")
 
 # %%
-# Initialize Predictor
+# Initialize Runtime Clients
 # Create a Boto3 session with the specific profile
 try:
     boto_session = boto3.Session(profile_name=PROFILE_NAME, region_name=REGION_NAME)
 
     print(f"Authenticated with profile: {boto_session.profile_name}")
     print(f"Region: {boto_session.region_name}")
-
-    # Create a SageMaker session using the boto3 session
-    sagemaker_session = sagemaker.Session(boto_session=boto_session)
-    print(f"Authenticated with profile: {boto_session.profile_name}")
 except Exception as e:
     print(f"Failed to use profile {PROFILE_NAME}, falling back to default. Error: {e}")
-    sagemaker_session = None
-
-# retrieve_default can hang if it tries to download model artifacts. 
-# Using direct Predictor initialization is faster and more robust for deployed endpoints.
-print("Initializing Predictor...")
-try:
-    if sagemaker_session:
-        predictor = Predictor(
-            endpoint_name=ENDPOINT_NAME,
-            sagemaker_session=sagemaker_session,
-            serializer=JSONSerializer(),
-            deserializer=JSONDeserializer()
-        )
-    else:
-        predictor = Predictor(
-            endpoint_name=ENDPOINT_NAME,
-            serializer=JSONSerializer(),
-            deserializer=JSONDeserializer()
-        )
-    print("Predictor initialized successfully.")
-except Exception as e:
-    print(f"Error initializing predictor: {e}")
-    raise e
+    boto_session = boto3.Session(region_name=REGION_NAME)
+
+# Record every endpoint call for replay testing when TRAFFIC_CAPTURE_PATH is set (see scripts/traffic_capture.py)
+traffic_capture = capture_from_env(boto_session)
+
+# Endpoint calls go straight through sagemaker-runtime (instead of a Predictor) so that
+# each call gets a socket timeout derived from the turn deadline and can be streamed.
+runtime_clients = DeadlineRuntimeClients(
+    boto_session, endpoint_url=RUNTIME_ENDPOINT_URL, max_pool_connections=MAX_UPSTREAM_CALLS
+)
+throughput = ThroughputEstimator(max_tokens=MAX_TOKENS)
+
+# Each backend sits behind its own circuit breaker; calls fail over down the list
+# PREFIX_ROUTING_VARIANTS: requests sharing a system prompt go to the same variant, where it is cached
+backends = [SageMakerChatBackend(runtime_clients, ENDPOINT_NAME, inference_component=INFERENCE_COMPONENT_NAME,
+                                 router=router_from_env())]
+if FALLBACK_ENDPOINT_NAME or FALLBACK_INFERENCE_COMPONENT:
+    backends.append(SageMakerChatBackend(runtime_clients, FALLBACK_ENDPOINT_NAME or ENDPOINT_NAME,
+                                         inference_component=FALLBACK_INFERENCE_COMPONENT))
+if BEDROCK_FALLBACK_MODEL_ARN:
+    backends.append(BedrockChatBackend(BEDROCK_FALLBACK_MODEL_ARN, boto_session))
+# A call is slow when its first token takes over a quarter of the turn budget; long generations aren't
+chat_backends = FailoverChat(backends, breaker_options={"slow_call_seconds": TURN_BUDGET_SECONDS / 4})
+print(f"Runtime clients initialized successfully. Backends: {[b.name for b in backends]}")
 
 # %%
 # Define Graph State
 class State(TypedDict):
-    # Messages list stores the conversation history
-    messages: List[Dict[str, str]]
+    # Conversation history; a CompactMessages store (plain lists are converted on first use)
+    messages: Sequence[Dict[str, str]]
+    # Absolute time.monotonic() deadline for the current turn
+    deadline: float
+    # Conversation id, so the prefix router keeps a conversation on one variant
+    session: str
 
 # Define the Chat Node
-def call_model(state: State):
+# `writer` is injected by LangGraph; streamed tokens reach callers using stream_mode="custom"
+def call_model(state: State, writer: StreamWriter):
     print("Invoking model...")
-    messages = state["messages"]
-    
+    messages = as_message_store(state["messages"])
+    deadline = state.get("deadline") or new_deadline(TURN_BUDGET_SECONDS)
+
+    seconds_left = time_left(deadline)
+    if seconds_left < MIN_CALL_SECONDS:
+        print(f"DEBUG: Only {seconds_left:.2f}s left in turn, skipping model call.")
+        messages.append({"role": "assistant", "content": "Error: Turn deadline exceeded before the model was called."})
+        return {"messages": messages}
+
     # Prepare payload for DeepSeek model (Chat API format)
     # The endpoint appears to support OpenAI-compatible chat completion format
+    # Stable system prompt first, history next, new question last (prompt_layout.py), so the
+    # endpoint's prefix cache covers everything but the new turn
+    chat_messages = layout_messages(messages, SYSTEM_PROMPT)
+    # The oldest turns are left out once the history outgrows MAX_INPUT_TOKENS
+    while estimate_prompt_tokens(chat_messages) > SERVING_PLAN["max_input_tokens"] and len(chat_messages) > 2:
+        del chat_messages[1 if chat_messages[0]["role"] == "system" else 0]
+    max_tokens = fit_max_new_tokens(SERVING_PLAN, chat_messages, throughput.max_tokens_for(seconds_left))
     payload = {
-        "messages": messages,
-        "max_tokens": 2048,
+        "messages": chat_messages,
+        "max_tokens": max_tokens,
         "temperature": 0.7,
         "top_p": 0.9
     }
     
     try:
-        # Invoke endpoint
-        # print(f"DEBUG: Sending payload with {len(messages)} messages")
-        response = predictor.predict(payload)
-        
-        # Parse response
-        if isinstance(response, bytes):
-            response_data = json.loads(response.decode('utf-8'))
-        else:
-            response_data = response
-            
-        print(f"DEBUG: Response keys: {response_data.keys() if isinstance(response_data, dict) else 'List'}")
-        
-        # Extract content
-        content = None
-        
-        # 1. Handle OpenAI-compatible Chat Completion response (Primary target)
-        if isinstance(response_data, dict) and 'choices' in response_data:
-            choice = response_data['choices'][0]
-            if 'message' in choice:
-                message = choice['message']
-                content = message.get('content')
-                
-                # Check for reasoning content (DeepSeek R1 feature)
-                reasoning = message.get('reasoning_content')
-                if reasoning:
-                    print(f"DEBUG: Reasoning content found ({len(reasoning)} chars)")
-                    
-                    # If content is None (e.g. hit max_tokens during reasoning), usage reasoning as valid output
-                    if not content:
-                        print("DEBUG: Content is empty, using reasoning content as fallback.")
-                        content = f"**Reasoning (truncated):**\n{reasoning}\n\n[Response interrupted due to length limit]"
-                    else:
-                        # Optionally include reasoning in the final output or log it
-                        # For now, we'll store specific reasoning if needed, but here we just return the content
-                        pass
-
-        # 2. Handle generic list response [{'generated_text': '...'}]
-        elif isinstance(response_data, list) and len(response_data) > 0:
-            item = response_data[0]
-            if isinstance(item, dict):
-                 content = item.get('generated_text')
-        
-        # 3. Handle raw dictionary with 'generated_text'
-        elif isinstance(response_data, dict) and 'generated_text' in response_data:
-             content = response_data['generated_text']
-
-        if content is None:
-             print(f"DEBUG: Failed to extract content. Raw data: {response_data}")
-             content = "Error: No content generated."
+        # Invoke endpoint, streaming until done or until the turn deadline passes.
+        # Open circuits are skipped, so an unhealthy endpoint fails over instead of timing out.
+        # print(f"DEBUG: Sending payload with {len(messages)} messages, max_tokens={max_tokens}")
+        result = chat_backends(payload, deadline, on_token=lambda token: writer({"token": token}),
+                               session=state.get("session"))
+        if result["backend"] == backends[0].name:
+            throughput.observe(result)
+        print(f"DEBUG: Streamed {result['tokens']} tokens from {result['backend']} in {result['total_seconds']:.2f}s "
+              f"(max_tokens={max_tokens}, cancelled={result['cancelled']})")
+
+        content = result["content"]
+
+        # Check for reasoning content (DeepSeek R1 feature)
+        reasoning = result["reasoning"]
+        if reasoning:
+            print(f"DEBUG: Reasoning content found ({len(reasoning)} chars)")
+
+            # If content is empty (e.g. hit max_tokens or the deadline during reasoning), use reasoning as valid output
+            if not content:
+                print("DEBUG: Content is empty, using reasoning content as fallback.")
+                content = f"**Reasoning (truncated):**\n{reasoning}"
+
+        if not content:
+            content = "Error: Turn deadline exceeded before any content was generated." if result["cancelled"] else "Error: No content generated."
+        elif result["cancelled"]:
+            content += "\n\n[Response interrupted: turn deadline reached]"
              
-        # Create assistant message
-        assistant_message = {"role": "assistant", "content": content}
+        # Append assistant message (the store is append-only, so no copy of the history)
+        messages.append({"role": "assistant", "content": content})
         
         # Return updated state
-        return {"messages": messages + [assistant_message]}
+        return {"messages": messages}
         
     except Exception as e:
         print(f"Error invoking endpoint: {e}")
-        return {"messages": messages + [{"role": "assistant", "content": f"Error: {str(e)}"}]}
+        messages.append({"role": "assistant", "content": f"Error: {str(e)}"})
+        return {"messages": messages}
 
 # Build the Graph
 workflow = StateGraph(State)
@@ -160,22 +187,25 @@ app = workflow.compile()
 
 # %%
 # Test the Graph with a single turn
-initial_state = {
-    "messages": [
-        {"role": "user", "content": "what is aws sagemaker."}
-    ]
-}
+# (guarded so agent_http_server.py can import the compiled graph without calling the endpoint)
+if __name__ == "__main__":
+    initial_state = {
+        "messages": [
+            {"role": "user", "content": "what is aws sagemaker."}
+        ],
+        "deadline": new_deadline(TURN_BUDGET_SECONDS)
+    }
 
-output = app.invoke(initial_state)
-print("\n--- Final Output ---")
-print(output)
-print(output["messages"][-1]["content"])
+    output = app.invoke(initial_state)
+    print("\n--- Final Output ---")
+    print(output)
+    print(output["messages"][-1]["content"])
 
 # %%
 # Interactive Chat Function
 def chat_session():
     print("Starting chat session. Type 'quit' to exit.")
-    conversation_history = []
+    conversation_history = CompactMessages()
     
     while True:
         user_input = input("User: ")
@@ -184,8 +214,8 @@ def chat_session():
             
         conversation_history.append({"role": "user", "content": user_input})
         
-        # Run graph
-        result = app.invoke({"messages": conversation_history})
+        # Run graph; every turn gets a fresh deadline
+        result = app.invoke({"messages": conversation_history, "deadline": new_deadline(TURN_BUDGET_SECONDS)})
         
         # Update history with the result
         conversation_history = result["messages"]
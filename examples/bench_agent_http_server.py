@@ -0,0 +1,112 @@
+# %% [markdown]
+# # Load Benchmark for the Agent HTTP Server
+#
+# Drives `agent_http_server.py` with concurrent chat sessions and reports
+# requests/sec and latency percentiles (time to first token as well when
+# streaming). Run it against the local endpoint stand-in so no GPU is needed:
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python ../scripts/local_endpoint_standin.py --port 8081 --latency-ms 150 --token-ms 5 &
+#     SAGEMAKER_RUNTIME_ENDPOINT_URL=http://127.0.0.1:8081 python agent_http_server.py &
+#     python bench_agent_http_server.py --concurrency 32 --requests 1000 --stream
+
+# %%
+import argparse
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _chat(conn, session_id, message, stream):
+    """Send one turn; returns (status, first_token_seconds, total_seconds, session_id)."""
+    started = time.perf_counter()
+    body = json.dumps({"session_id": session_id, "message": message, "stream": stream})
+    conn.request("POST", "/chat", body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    first_token = None
+    if response.status == 200 and stream:
+        for line in response:
+            if first_token is None and line.startswith(b"data: {\"token\""):
+                first_token = time.perf_counter() - started
+            if line.startswith(b"event: session"):
+                session_id = json.loads(next(response)[len(b"data: "):])["session_id"]
+    else:
+        data = response.read()
+        if response.status == 200:
+            session_id = json.loads(data)["session_id"]
+    return response.status, first_token, time.perf_counter() - started, session_id
+
+
+def run_benchmark(url, concurrency, requests, turns_per_session, stream):
+    target = urlparse(url)
+    results = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(_):
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=300)
+        session_id, turns = None, 0
+        for i in counter:
+            if turns >= turns_per_session:
+                session_id, turns = None, 0
+            try:
+                status, first_token, total, session_id = _chat(conn, session_id, f"Question {i}: what is SageMaker?", stream)
+            except (OSError, http.client.HTTPException) as e:
+                print(f"Request {i} failed: {e}")
+                status, first_token, total = 0, None, 0.0
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=300)
+            turns += 1
+            with lock:
+                results.append((status, first_token, total))
+        conn.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r[0] == 200]
+    latencies = [r[2] for r in ok]
+    first_tokens = [r[1] for r in ok if r[1] is not None]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected_429": sum(1 for r in results if r[0] == 429),
+        "errors": sum(1 for r in results if r[0] not in (200, 429)),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(ok) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "first_token_p50": percentile(first_tokens, 50),
+        "first_token_p99": percentile(first_tokens, 99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmark for agent_http_server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--turns-per-session", type=int, default=4)
+    parser.add_argument("--stream", action="store_true", help="Use SSE streaming instead of JSON responses")
+    args = parser.parse_args()
+
+    print(f"Benchmarking {args.url}: {args.requests} requests, concurrency {args.concurrency}, stream={args.stream}")
+    stats = run_benchmark(args.url, args.concurrency, args.requests, args.turns_per_session, args.stream)
+    print(f"Completed: {stats['ok']}/{stats['requests']} ok, {stats['rejected_429']} rejected (429), {stats['errors']} errors")
+    print(f"Throughput: {stats['requests_per_second']:.1f} req/s over {stats['elapsed_seconds']:.1f}s")
+    print(f"Latency:    p50 {stats['latency_p50'] * 1000:.0f} ms, p99 {stats['latency_p99'] * 1000:.0f} ms")
+    if args.stream:
+        print(f"First token: p50 {stats['first_token_p50'] * 1000:.0f} ms, p99 {stats['first_token_p99'] * 1000:.0f} ms")
@@ -0,0 +1,133 @@
+# %% [markdown]
+# # Outage Benchmark for the Circuit Breaker
+#
+# Drives `FailoverChat` with steady load while an outage is injected into the
+# primary endpoint, then reports latency per phase, how much traffic failed
+# over, and how long the breaker took to detect the outage and to recover.
+# Both "endpoints" are local stand-ins, so this runs anywhere:
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python ../scripts/local_endpoint_standin.py --port 8081 --latency-ms 100 &  # primary
+#     python ../scripts/local_endpoint_standin.py --port 8082 --latency-ms 150 &  # fallback
+#     python bench_circuit_breaker.py --outage-mode errors
+#     python bench_circuit_breaker.py --outage-mode errors --no-breaker  # baseline
+
+# %%
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+from circuit_breaker import OPEN, CLOSED, FailoverChat, SageMakerChatBackend
+from turn_deadline import DeadlineRuntimeClients, new_deadline
+
+OUTAGES = {
+    # Every call fails fast with a 503
+    "errors": {"error_rate": 1.0},
+    # Calls hang until the turn deadline (socket timeout)
+    "slow": {"latency_ms": 60000.0},
+}
+
+
+def set_standin(url, settings):
+    request = urllib.request.Request(
+        f"{url}/admin/settings", data=json.dumps(settings).encode(), method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def run(args):
+    transitions = []
+    primary = SageMakerChatBackend(
+        DeadlineRuntimeClients(region_name="us-east-1", endpoint_url=args.primary_url, max_pool_connections=args.concurrency),
+        "primary-endpoint",
+    )
+    fallback = SageMakerChatBackend(
+        DeadlineRuntimeClients(region_name="us-east-1", endpoint_url=args.fallback_url, max_pool_connections=args.concurrency),
+        "fallback-endpoint",
+    )
+    breaker_options = {"window_seconds": 10.0, "min_calls": 10, "open_seconds": args.open_seconds,
+                       "half_open_probes": 3, "slow_call_seconds": args.turn_budget / 4}
+    if args.no_breaker:
+        # Thresholds that can never trip: every call still goes to the primary first
+        breaker_options.update(error_rate_threshold=2.0, slow_rate_threshold=2.0, consecutive_failures=float("inf"))
+    chat = FailoverChat([primary, fallback], breaker_options,
+                        on_transition=lambda name, old, new, at: transitions.append((name, new, at)))
+
+    records = []  # (started_at, latency, backend or None)
+    lock = threading.Lock()
+    stop = threading.Event()
+    payload = {"messages": [{"role": "user", "content": "What is SageMaker?"}], "max_tokens": 32}
+
+    def worker():
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                backend = chat(payload, new_deadline(args.turn_budget))["backend"]
+            except Exception:
+                backend = None
+            with lock:
+                records.append((started, time.monotonic() - started, backend))
+
+    set_standin(args.primary_url, {"error_rate": 0.0, "latency_ms": 100.0})
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    began = time.monotonic()
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.healthy_seconds)
+    outage_start = time.monotonic()
+    print(f"Injecting '{args.outage_mode}' outage into the primary for {args.outage_seconds}s...")
+    set_standin(args.primary_url, OUTAGES[args.outage_mode])
+    time.sleep(args.outage_seconds)
+    outage_end = time.monotonic()
+    print("Primary restored.")
+    set_standin(args.primary_url, {"error_rate": 0.0, "latency_ms": 100.0})
+    time.sleep(args.recovery_seconds)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.turn_budget + 5)
+
+    phases = [("healthy", began, outage_start), ("outage", outage_start, outage_end),
+              ("recovery", outage_end, outage_end + args.recovery_seconds)]
+    print(f"\n{'phase':>9} {'requests':>9} {'ok':>6} {'fallback':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, start, end in phases:
+        rows = [r for r in records if start <= r[0] < end]
+        ok = [r for r in rows if r[2] is not None]
+        fell_back = sum(1 for r in ok if r[2] == fallback.name)
+        latencies = [r[1] * 1000 for r in rows]
+        print(f"{name:>9} {len(rows):>9} {len(ok) / max(1, len(rows)):>6.0%} {fell_back / max(1, len(ok)):>9.0%} "
+              f"{percentile(latencies, 50):>8.0f} {percentile(latencies, 99):>8.0f}")
+
+    primary_changes = [(state, at) for name, state, at in transitions if name == primary.name]
+    opened = next((at for state, at in primary_changes if state == OPEN and at >= outage_start), None)
+    closed = next((at for state, at in primary_changes if state == CLOSED and at >= outage_end), None)
+    print(f"\nTime to detect outage (circuit open):   {opened - outage_start:.2f}s" if opened else
+          "\nCircuit never opened during the outage.")
+    print(f"Time to recover after outage (closed): {closed - outage_end:.2f}s" if closed else
+          "Circuit did not close during the recovery phase.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inject an outage and measure circuit breaker failover.")
+    parser.add_argument("--primary-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--fallback-url", default="http://127.0.0.1:8082")
+    parser.add_argument("--outage-mode", choices=sorted(OUTAGES), default="errors")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turn-budget", type=float, default=5.0)
+    parser.add_argument("--open-seconds", type=float, default=5.0)
+    parser.add_argument("--healthy-seconds", type=float, default=10.0)
+    parser.add_argument("--outage-seconds", type=float, default=15.0)
+    parser.add_argument("--recovery-seconds", type=float, default=15.0)
+    parser.add_argument("--no-breaker", action="store_true", help="Baseline: never open the circuit")
+    run(parser.parse_args())
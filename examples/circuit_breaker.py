@@ -0,0 +1,299 @@
+# %% [markdown]
+# # Circuit Breaker and Failover for Chat Backends
+#
+# When the SageMaker endpoint is unhealthy, waiting out every failed call backs
+# up the whole agent. `FailoverChat` puts a `CircuitBreaker` in front of each
+# backend:
+# - **closed**: calls flow; outcomes are tracked over a rolling window
+# - **open**: tripped by a high error rate or slow-call rate (time to first token)
+#   over the window,
+#   or by a run of consecutive failures (which catches an outage quickly even
+#   while the window is still full of earlier successes); calls skip the
+#   backend immediately and go to the next one (e.g. the Bedrock-registered model)
+# - **half-open**: after `open_seconds`, a few probe calls decide whether to close
+#   again or re-open; results of calls started in an earlier state are ignored
+#
+# Errors from SageMaker and Bedrock are normalized into `BackendError` so the
+# agent handles both the same way.
+
+# %%
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from turn_deadline import stream_chat_completion, time_left
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Error codes that mean "this backend is unhealthy right now", as opposed to a bad request
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+UNAVAILABLE_CODES = {
+    "ServiceUnavailable", "ServiceUnavailableException", "InternalFailure", "InternalServerException",
+    "InternalDependencyException", "ModelError", "ModelNotReadyException", "ModelTimeoutException",
+    "ModelStreamErrorException",
+}
+
+
+class BackendError(Exception):
+    """Backend-agnostic failure of a chat call.
+
+    `kind` is one of "timeout", "throttled", "unavailable", "client" or "open";
+    everything except "client" is retryable on another backend.
+    """
+
+    def __init__(self, kind, backend, message, cause=None):
+        super().__init__(f"[{backend}] {kind}: {message}")
+        self.kind = kind
+        self.backend = backend
+        self.cause = cause
+
+    @property
+    def retryable(self):
+        return self.kind != "client"
+
+
+class CircuitOpenError(BackendError):
+    def __init__(self, backend):
+        super().__init__("open", backend, "circuit is open")
+
+
+def normalize_error(exc, backend):
+    """Map boto/botocore/LangChain exceptions from any backend onto BackendError."""
+    if isinstance(exc, BackendError):
+        return exc
+    # LangChain wraps boto errors (e.g. ChatBedrock raises ValueError from ClientError)
+    seen = exc
+    while seen is not None and not isinstance(seen, (ClientError, ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError)):
+        seen = seen.__cause__ or seen.__context__
+    if isinstance(seen, (ReadTimeoutError, ConnectTimeoutError)):
+        return BackendError("timeout", backend, str(seen), exc)
+    if isinstance(seen, EndpointConnectionError):
+        return BackendError("unavailable", backend, str(seen), exc)
+    if isinstance(seen, ClientError):
+        code = seen.response.get("Error", {}).get("Code", "")
+        status = seen.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if code in THROTTLING_CODES or status == 429:
+            return BackendError("throttled", backend, str(seen), exc)
+        if code in UNAVAILABLE_CODES or status >= 500:
+            return BackendError("unavailable", backend, str(seen), exc)
+        return BackendError("client", backend, str(seen), exc)
+    return BackendError("unavailable", backend, str(exc), exc)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by error rate and time to first token.
+
+    `allow()` returns a permit (or None) that the caller hands back to `record()`,
+    so outcomes are only counted in the state the call was admitted in.
+    """
+
+    def __init__(self, name, window_seconds=30.0, min_calls=10, error_rate_threshold=0.5,
+                 slow_call_seconds=10.0, slow_rate_threshold=0.8, consecutive_failures=5,
+                 open_seconds=30.0, half_open_probes=3, on_transition=None):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.on_transition = on_transition
+        self.state = CLOSED
+        self._calls = deque()  # (timestamp, ok, slow)
+        self._generation = 0  # Bumped on every transition; permits from older generations are stale
+        self._failure_streak = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state, reason):
+        previous, self.state = self.state, state
+        self._generation += 1
+        print(f"Circuit '{self.name}': {previous} -> {state} ({reason})")
+        if self.on_transition:
+            self.on_transition(self.name, previous, state, time.monotonic())
+
+    def allow(self):
+        """A permit for one call to this backend, or None (reserves a probe when half-open)."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return None
+                self._transition(HALF_OPEN, "open timeout elapsed")
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    return None
+                self._probes_in_flight += 1
+            return (self._generation, self.state)
+
+    def record(self, ok, first_token_seconds, permit):
+        """Record the outcome of a call admitted with `permit`.
+
+        Slowness is time to first token, so long healthy generations don't count
+        as slow; a call that produced no token counts as slow.
+        """
+        slow = first_token_seconds is None or first_token_seconds >= self.slow_call_seconds
+        now = time.monotonic()
+        with self._lock:
+            if permit[0] != self._generation:
+                return  # Late result from a call started before the last transition
+            if self.state == HALF_OPEN:
+                self._probes_in_flight -= 1
+                if not ok or slow:
+                    self._open(now, "probe failed" if not ok else "probe was slow")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._calls.clear()
+                        self._failure_streak = 0
+                        self._transition(CLOSED, "probes succeeded")
+                return
+
+            self._calls.append((now, ok, slow))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+            self._failure_streak = 0 if ok else self._failure_streak + 1
+            if self._failure_streak >= self.consecutive_failures:
+                self._open(now, f"{self._failure_streak} consecutive failures")
+                return
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            error_rate = sum(1 for _, call_ok, _ in self._calls if not call_ok) / total
+            slow_rate = sum(1 for _, _, call_slow in self._calls if call_slow) / total
+            if error_rate >= self.error_rate_threshold:
+                self._open(now, f"error rate {error_rate:.0%} over {total} calls")
+            elif slow_rate >= self.slow_rate_threshold:
+                self._open(now, f"slow-call rate {slow_rate:.0%} over {total} calls")
+
+    def _open(self, now, reason):
+        self._opened_at = now
+        self._transition(OPEN, reason)
+
+
+class SageMakerChatBackend:
+    """Streams chat completions from a SageMaker endpoint (see turn_deadline.py)."""
+
+    def __init__(self, runtime_clients, endpoint_name, name=None, inference_component=None, router=None):
+        self.runtime_clients = runtime_clients
+        self.endpoint_name = endpoint_name
+        # Optional `router(payload, session)` returning per-request invoke arguments, e.g. prompt_layout.PrefixRouter
+        self.router = router
+        # Target one model on an endpoint hosting inference components (see scripts/inference_components.py)
+        self.invoke_kwargs = {"InferenceComponentName": inference_component} if inference_component else {}
+        target = f"{endpoint_name}/{inference_component}" if inference_component else endpoint_name
+        self.name = name or f"sagemaker:{target}"
+
+    def __call__(self, payload, deadline, on_token=None, session=None):
+        invoke_kwargs = dict(self.invoke_kwargs, **self.router(payload, session)) if self.router else self.invoke_kwargs
+        result = stream_chat_completion(
+            self.runtime_clients.for_deadline(deadline), self.endpoint_name, payload, deadline, on_token=on_token,
+            **invoke_kwargs
+        )
+        if result["cancelled"] and not result["tokens"]:
+            raise BackendError("timeout", self.name, "no tokens before the turn deadline")
+        return result
+
+
+class BedrockChatBackend:
+    """Chat completions from a Bedrock (e.g. Bedrock-registered) model via ChatBedrock."""
+
+    def __init__(self, model_id, boto_session, provider="meta", name=None):
+        # Optional dependency, only needed when a Bedrock fallback is configured
+        from langchain_aws import ChatBedrock
+
+        self.name = name or f"bedrock:{model_id.rsplit('/', 1)[-1]}"
+        self.llm = ChatBedrock(
+            model_id=model_id,
+            client=boto_session.client("bedrock-runtime"),
+            provider=provider,
+        )
+
+    def __call__(self, payload, deadline, on_token=None, session=None):
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        message_types = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+        messages = [message_types.get(m["role"], HumanMessage)(content=m["content"]) for m in payload["messages"]]
+        kwargs = {k: payload[k] for k in ("max_tokens", "temperature", "top_p") if k in payload}
+
+        started = time.monotonic()
+        result = {"content": "", "reasoning": "", "tokens": 0, "first_token_seconds": None,
+                  "total_seconds": 0.0, "cancelled": False}
+        parts = []
+        for chunk in self.llm.stream(messages, **kwargs):
+            if chunk.content:
+                if result["first_token_seconds"] is None:
+                    result["first_token_seconds"] = time.monotonic() - started
+                result["tokens"] += 1
+                parts.append(chunk.content)
+                if on_token:
+                    on_token(chunk.content)
+            if time_left(deadline) <= 0:
+                result["cancelled"] = True
+                break
+        result["content"] = "".join(parts)
+        result["total_seconds"] = time.monotonic() - started
+        if result["cancelled"] and not result["tokens"]:
+            raise BackendError("timeout", self.name, "no tokens before the turn deadline")
+        return result
+
+
+class FailoverChat:
+    """Tries backends in order, skipping any whose circuit is open."""
+
+    def __init__(self, backends, breaker_options=None, on_transition=None):
+        options = dict(breaker_options or {}, on_transition=on_transition)
+        self.backends = [(backend, CircuitBreaker(backend.name, **options)) for backend in backends]
+
+    def __call__(self, payload, deadline, on_token=None, session=None):
+        """Return the first successful result, tagged with the `backend` that served it.
+
+        `session` identifies the conversation, for backends that route by it.
+        """
+        last_error = None
+        for backend, breaker in self.backends:
+            if time_left(deadline) <= 0:
+                break
+            permit = breaker.allow()
+            if permit is None:
+                last_error = CircuitOpenError(backend.name)
+                continue
+            streamed = []
+
+            def forward(token):
+                streamed.append(token)
+                if on_token:
+                    on_token(token)
+
+            started = time.monotonic()
+            try:
+                result = backend(payload, deadline, on_token=forward, session=session)
+            except Exception as e:
+                error = normalize_error(e, backend.name)
+                if error.kind != "client":
+                    breaker.record(False, None, permit)
+                else:
+                    # Caller's fault, not the backend's, which answered promptly
+                    breaker.record(True, time.monotonic() - started, permit)
+                print(f"Backend {backend.name} failed: {error}")
+                # Tokens already reached the caller, so a retry elsewhere would duplicate them
+                if not error.retryable or streamed:
+                    raise error
+                last_error = error
+                continue
+            breaker.record(True, result["first_token_seconds"], permit)
+            result["backend"] = backend.name
+            return result
+        raise last_error or BackendError("timeout", "failover", "turn deadline reached before any backend was tried")
@@ -0,0 +1,271 @@
+# %% [markdown]
+# # Prefix-Cache-Friendly Prompt Layout and Routing
+#
+# TGI and vLLM cache the KV state of prompt prefixes they have already seen, in
+# fixed-size blocks. A request reuses the cache only up to its first differing
+# byte, and only on the instance that served the earlier request. So:
+# - **layout**: stable content first, volatile content last
+#     1. the shared system prompt and tenant instructions (identical across sessions)
+#     2. the conversation history (append-only, so each turn extends the last one)
+#     3. retrieved context, the current time and the new question (new every turn)
+# - **byte-identical rendering**: text is normalized (NFC, `\n` newlines, no
+#   trailing spaces) so the same content always renders to the same bytes
+# - **routing**: the stable prefix is hashed, and rendezvous hashing maps the hash
+#   to a production variant (`TargetVariant`), so requests sharing a prefix land
+#   where it is cached
+#
+# Run this file to simulate the prefix reuse ratio of layouts and routing
+# policies on synthetic multi-tenant traffic, or on a capture log recorded with
+# `scripts/traffic_capture.py` (redaction `none` or `secrets`):
+#
+#     python prompt_layout.py --variants 4
+#     python prompt_layout.py --log /tmp/capture.jsonl.gz --variants 2
+
+import argparse
+import hashlib
+import os
+import random
+import unicodedata
+from collections import Counter, OrderedDict
+
+# --- Configuration ---
+SYSTEM_PROMPT = os.environ.get("AGENT_SYSTEM_PROMPT")  # Optional stable system prompt for the agent
+ROUTING_VARIANTS = [v for v in os.environ.get("PREFIX_ROUTING_VARIANTS", "").split(",") if v]
+# Variants a hot prefix is spread over. More than one keeps a system prompt shared by every session from
+# pinning them all to one variant; few enough that each prefix is still cached on a small set of variants
+ROUTING_FANOUT = int(os.environ.get("PREFIX_ROUTING_FANOUT", "2"))
+BLOCK_CHARS = 64  # ~16 tokens, the KV cache block size of TGI and vLLM
+RAW_PREFIX_CHARS = 1024  # Stable prefix of a raw `inputs` prompt, which has no system message to hash
+
+
+def canonical_text(text):
+    """Normalize text so that equal content always renders to the same bytes."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def build_messages(system=None, history=(), question=None, context=(), volatile=None, instructions=None):
+    """Chat messages in cache-friendly order: stable system prefix, history, then everything volatile.
+
+    `context` is a sequence of retrieved documents (strings or (source, text) pairs) and
+    `volatile` any per-request text such as the current time; both go into the last user
+    message with the question, so they never invalidate the history before them.
+    """
+    stable = [canonical_text(part) for part in (system, instructions) if part]
+    messages = [{"role": "system", "content": "\n\n".join(stable)}] if stable else []
+    messages += [{"role": m["role"], "content": canonical_text(m["content"])} for m in history
+                 if m["role"] != "system"]
+    tail = []
+    for document in context:
+        source, text = document if isinstance(document, tuple) else (None, document)
+        tail.append(f"<document source=\"{source}\">\n{canonical_text(text)}\n</document>" if source
+                    else f"<document>\n{canonical_text(text)}\n</document>")
+    if volatile:
+        tail.append(canonical_text(volatile))
+    if question is not None:
+        tail.append(canonical_text(question))
+    if tail:
+        messages.append({"role": "user", "content": "\n\n".join(tail)})
+    return messages
+
+
+def layout_messages(messages, system=SYSTEM_PROMPT):
+    """Re-lay an agent history (ending with the new user message) with the stable system prompt first."""
+    messages = list(messages)
+    systems = [m["content"] for m in messages if m["role"] == "system"]
+    if system:
+        systems.insert(0, system)
+    last = messages[-1] if messages and messages[-1]["role"] == "user" else None
+    history = messages[:-1] if last else messages
+    return build_messages("\n\n".join(systems) or None, history, last["content"] if last else None)
+
+
+def prefix_hash(payload):
+    """Hash of the request's stable prefix: its leading system messages (or the start of a raw prompt)."""
+    if "messages" in payload:
+        stable = []
+        for message in payload["messages"]:
+            if message["role"] != "system":
+                break
+            stable.append(canonical_text(message["content"]))
+        text = "\n\n".join(stable)
+    else:
+        text = canonical_text(str(payload.get("inputs", "")))[:RAW_PREFIX_CHARS]
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def rendezvous_rank(key, variants):
+    """Variants ordered by highest random weight for `key`; stable when variants are added or removed."""
+    return sorted(variants, key=lambda v: hashlib.sha256(f"{key}|{v}".encode()).digest(), reverse=True)
+
+
+class PrefixRouter:
+    """Picks a `TargetVariant` per request from its prefix hash.
+
+    `fanout` > 1 spreads one hot prefix (e.g. a system prompt shared by every
+    tenant) over its top `fanout` variants, chosen per session to keep a
+    session's history on one variant. With every variant in the fanout the
+    prefix no longer matters and routing is by session alone.
+    """
+
+    def __init__(self, variants, fanout=ROUTING_FANOUT):
+        self.variants = list(variants)
+        self.fanout = max(1, min(fanout, len(self.variants)))
+
+    def variant_for(self, payload, session=None):
+        ranked = rendezvous_rank(prefix_hash(payload), self.variants)[:self.fanout]
+        if len(ranked) == 1:
+            return ranked[0]
+        if session is None:
+            # The first user message is fixed for the life of a conversation
+            first = next((m["content"] for m in payload.get("messages", ()) if m["role"] != "system"), "")
+            session = hashlib.sha256(canonical_text(first).encode()).hexdigest()
+        return rendezvous_rank(session, ranked)[0]
+
+    def __call__(self, payload, session=None):
+        """Extra `invoke_endpoint` arguments for the payload (see SageMakerChatBackend)."""
+        return {"TargetVariant": self.variant_for(payload, session)}
+
+
+def router_from_env():
+    return PrefixRouter(ROUTING_VARIANTS, ROUTING_FANOUT) if ROUTING_VARIANTS else None
+
+
+# --- Simulation ---
+
+def render(payload):
+    """Approximation of the prompt the container tokenizes; the chat template is deterministic too."""
+    if "messages" in payload:
+        return "".join(f"<|{m['role']}|>\n{m['content']}\n" for m in payload["messages"])
+    return str(payload.get("inputs", ""))
+
+
+def block_hashes(text, block_chars=BLOCK_CHARS):
+    """Chained hashes of the full blocks of `text`: block i matches only if blocks 0..i all match."""
+    hashes, previous = [], b""
+    data = text.encode()
+    for start in range(0, len(data) - block_chars + 1, block_chars):
+        previous = hashlib.blake2b(previous + data[start:start + block_chars], digest_size=8).digest()
+        hashes.append(previous)
+    return hashes
+
+
+def simulate_reuse(requests, variants, policy, cache_blocks, fanout=1, block_chars=BLOCK_CHARS, seed=0):
+    """Replay (payload, session) pairs against per-variant LRU prefix caches.
+
+    `policy` is "random" (SageMaker's default weighted split across variants),
+    "round-robin" or "prefix" (PrefixRouter with `fanout`). Returns the fraction
+    of prompt blocks served from cache and the busiest variant's share of requests.
+    """
+    caches = {variant: OrderedDict() for variant in variants}
+    router = PrefixRouter(variants, fanout)
+    rng = random.Random(seed)
+    load = Counter()
+    hit = total = 0
+    for i, (payload, session) in enumerate(requests):
+        if policy == "prefix":
+            variant = router.variant_for(payload, session)
+        elif policy == "round-robin":
+            variant = variants[i % len(variants)]
+        else:
+            variant = rng.choice(variants)
+        load[variant] += 1
+        cache = caches[variant]
+        hashes = block_hashes(render(payload), block_chars)
+        matched = 0
+        for block in hashes:
+            if block not in cache:
+                break
+            matched += 1
+        hit += matched
+        total += len(hashes)
+        for block in hashes:
+            cache[block] = True
+            cache.move_to_end(block)
+        while len(cache) > cache_blocks:
+            cache.popitem(last=False)
+    return {"reuse": hit / total if total else 0.0, "blocks": total,
+            "max_load_share": max(load.values()) / len(requests) if requests else 0.0}
+
+
+def synthetic_traffic(sessions=300, tenants=4, turns=(1, 6), documents=3, seed=0):
+    """Interleaved multi-turn sessions: a shared preamble, per-tenant instructions, RAG context, timestamps.
+
+    Returns {layout: [(payload, session), ...]} for the same conversations laid out
+    "naive" (time and context appended to the system prompt) and "prefix-first".
+    """
+    rng = random.Random(seed)
+    words = ("SageMaker endpoint instance model token latency cache prefix variant GPU batch request "
+             "session tenant policy context document answer question region cost scale").split()
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    preamble = "You are a helpful assistant! Your name is Bob."
+    instructions = [f"Tenant {t} policy:\n{text(300)}" for t in range(tenants)]
+    corpus = [(f"doc-{d}", text(100)) for d in range(60)]
+    conversations = []
+    for s in range(sessions):
+        tenant = rng.randrange(tenants)
+        conversations.append([(f"session-{s}", tenant, text(rng.randint(8, 30)), rng.sample(corpus, documents),
+                               text(rng.randint(40, 120))) for _ in range(rng.randint(*turns))])
+
+    # Sessions overlap in time: each step continues a random open session
+    order = [s for s, turns_ in enumerate(conversations) for _ in turns_]
+    rng.shuffle(order)
+    traffic = {"naive": [], "prefix-first": []}
+    histories, position = {}, Counter()
+    for step, s in enumerate(order):
+        session, tenant, question, context, answer = conversations[s][position[s]]
+        position[s] += 1
+        history = histories.setdefault(s, [])
+        now = f"Current time: 2026-03-01T12:{step // 60 % 60:02d}:{step % 60:02d}Z"
+        rendered = "\n".join(f"[{source}] {body}" for source, body in context)
+        naive = [{"role": "system", "content": f"{preamble}\n{instructions[tenant]}\n{now}\nContext:\n{rendered}"}]
+        traffic["naive"].append(({"messages": naive + history + [{"role": "user", "content": question}]}, session))
+        traffic["prefix-first"].append(({"messages": build_messages(
+            preamble, history, question, context, now, instructions[tenant])}, session))
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    return traffic
+
+
+def recorded_traffic(path):
+    """(payload, session) pairs from a traffic_capture.py log."""
+    import sys
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+    from traffic_capture import load_log
+
+    header, records = load_log(path)
+    if header.get("redaction") in ("content", "drop"):
+        raise ValueError(f"{path} was captured with redaction={header['redaction']}: prompt text was replaced, "
+                         "so reuse can't be measured; capture with TRAFFIC_CAPTURE_REDACT=secrets")
+    return [(r["body"], r.get("SessionId")) for r in records if isinstance(r.get("body"), dict)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate prefix-cache reuse of prompt layouts and routing.")
+    parser.add_argument("--log", default=None, help="traffic_capture.py log; default is synthetic traffic")
+    parser.add_argument("--variants", type=int, default=4, help="Production variants to route between")
+    parser.add_argument("--cache-blocks", type=int, default=4096,
+                        help="Prefix cache size per variant in %d-char blocks" % BLOCK_CHARS)
+    parser.add_argument("--sessions", type=int, default=300)
+    args = parser.parse_args()
+
+    variants = [f"variant-{i}" for i in range(args.variants)]
+    traffic = {"recorded": recorded_traffic(args.log)} if args.log else synthetic_traffic(args.sessions)
+    print(f"{args.variants} variants, {args.cache_blocks} cached blocks of {BLOCK_CHARS} chars each\n")
+    print(f"{'layout':>14} {'routing':>12} {'requests':>9} {'prefix reuse':>13} {'busiest variant':>16}")
+    # The production default (PREFIX_ROUTING_FANOUT) is marked with *; x{variants} is session-only routing
+    fanouts = sorted({1, min(ROUTING_FANOUT, args.variants), args.variants})
+    policies = [("random", 1), ("round-robin", 1)] + [("prefix", fanout) for fanout in fanouts]
+    for layout, requests in traffic.items():
+        for policy, fanout in policies:
+            result = simulate_reuse(requests, variants, policy, args.cache_blocks, fanout)
+            default = "*" if fanout == min(ROUTING_FANOUT, args.variants) else ""
+            label = f"{policy} x{fanout}{default}" if policy == "prefix" else policy
+            print(f"{layout:>14} {label:>12} {len(requests):>9} {result['reuse']:>13.1%} "
+                  f"{result['max_load_share']:>16.0%}")
+        # Upper bound: one variant with an unbounded cache sees every earlier prefix
+        ideal = simulate_reuse(requests, variants[:1], "random", float("inf"))
+        print(f"{layout:>14} {'(bound)':>12} {len(requests):>9} {ideal['reuse']:>13.1%}")
@@ -0,0 +1,212 @@
+# %% [markdown]
+# # Per-Turn Deadlines for SageMaker Chat Calls
+#
+# Helpers used by `agent_stateful_chat_langgraph.py` to keep a single chat turn
+# inside a fixed time budget:
+# - the deadline travels with the graph state and becomes the socket timeout of
+#   the `sagemaker-runtime` client used for the call
+# - `max_tokens` is sized from the observed decode speed and the time left
+# - the response is streamed and cancelled once the deadline passes, keeping
+#   whatever was generated so far
+
+import json
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+from urllib3.exceptions import ReadTimeoutError as StreamReadTimeoutError
+
+# --- Defaults ---
+DEFAULT_TURN_BUDGET_SECONDS = 60.0
+MIN_CALL_SECONDS = 1.0  # Don't start an endpoint call with less time than this left
+CONNECT_TIMEOUT_SECONDS = 5.0
+
+# Read timeouts are bucketed so we only ever build a handful of clients.
+# A bucket is always <= the time left, so the socket never outlives the turn.
+TIMEOUT_BUCKETS = (1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300)
+
+
+def new_deadline(budget_seconds=DEFAULT_TURN_BUDGET_SECONDS):
+    """Return an absolute deadline (time.monotonic based) for a new turn."""
+    return time.monotonic() + budget_seconds
+
+
+def time_left(deadline):
+    """Seconds remaining until the deadline (negative once it has passed)."""
+    return deadline - time.monotonic()
+
+
+class ThroughputEstimator:
+    """Tracks observed decode speed so max_tokens can be sized to the time left."""
+
+    def __init__(self, max_tokens=2048, min_tokens=32, safety=0.8, alpha=0.3):
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.safety = safety
+        self.alpha = alpha
+        self.tokens_per_second = None
+        self.first_token_seconds = None
+        self._lock = threading.Lock()
+
+    def _smooth(self, previous, sample):
+        if previous is None:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * previous
+
+    def observe(self, result):
+        """Update the estimate from a `stream_chat_completion` result."""
+        first_token = result.get("first_token_seconds")
+        tokens = result.get("tokens", 0)
+        if first_token is None:
+            return
+        decode_seconds = result["total_seconds"] - first_token
+        with self._lock:
+            self.first_token_seconds = self._smooth(self.first_token_seconds, first_token)
+            if tokens > 1 and decode_seconds > 0:
+                self.tokens_per_second = self._smooth(
+                    self.tokens_per_second, (tokens - 1) / decode_seconds
+                )
+
+    def max_tokens_for(self, seconds_left):
+        """Largest max_tokens we expect to finish within `seconds_left`."""
+        with self._lock:
+            if self.tokens_per_second is None:
+                return self.max_tokens
+            decode_seconds = seconds_left - (self.first_token_seconds or 0.0)
+            budget = int(decode_seconds * self.tokens_per_second * self.safety)
+        return max(self.min_tokens, min(self.max_tokens, budget))
+
+
+class DeadlineRuntimeClients:
+    """Caches `sagemaker-runtime` clients keyed by their read timeout bucket."""
+
+    def __init__(self, boto_session=None, region_name=None, endpoint_url=None, max_pool_connections=10):
+        self.boto_session = boto_session or boto3.Session(region_name=region_name)
+        self.endpoint_url = endpoint_url
+        self.max_pool_connections = max_pool_connections
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def for_deadline(self, deadline):
+        """Client whose socket timeout does not exceed the time left."""
+        seconds_left = max(1.0, time_left(deadline))
+        timeout = max([b for b in TIMEOUT_BUCKETS if b <= seconds_left] or [1])
+        with self._lock:
+            client = self._clients.get(timeout)
+            if client is None:
+                config = Config(
+                    connect_timeout=min(CONNECT_TIMEOUT_SECONDS, timeout),
+                    read_timeout=timeout,
+                    max_pool_connections=self.max_pool_connections,
+                    # A retry would silently double the time spent on this turn
+                    retries={"max_attempts": 0},
+                )
+                client = self.boto_session.client(
+                    "sagemaker-runtime", endpoint_url=self.endpoint_url, config=config
+                )
+                self._clients[timeout] = client
+        return client
+
+
+def _iter_stream_records(buffer):
+    """Split buffered stream bytes into complete JSON records.
+
+    Handles both SSE framing (`data: {...}`) used by OpenAI-compatible
+    containers and the newline-delimited JSON used by TGI/LMI. Returns
+    (records, leftover_bytes).
+    """
+    records = []
+    *lines, leftover = buffer.split(b"\n")
+    for line in lines:
+        line = line.strip()
+        if line.startswith(b"data:"):
+            line = line[len(b"data:"):].strip()
+        if not line or line == b"[DONE]":
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            print(f"DEBUG: Skipping unparseable stream line: {line[:80]!r}")
+    return records, leftover
+
+
+def _record_text(record):
+    """Return (content, reasoning) deltas carried by one stream record."""
+    if "choices" in record and record["choices"]:
+        delta = record["choices"][0].get("delta") or {}
+        return delta.get("content") or "", delta.get("reasoning_content") or ""
+    token = record.get("token")
+    if isinstance(token, dict) and not token.get("special"):
+        return token.get("text") or "", ""
+    return "", ""
+
+
+def stream_chat_completion(client, endpoint_name, payload, deadline, on_token=None, **invoke_kwargs):
+    """Stream a chat completion and stop once the deadline passes.
+
+    Returns a dict with the (possibly partial) `content` and `reasoning`,
+    the number of streamed `tokens`, timings, and `cancelled=True` when the
+    deadline cut the generation short. `on_token` is called with each content
+    delta as it arrives. Extra keyword arguments are passed through to
+    `invoke_endpoint_with_response_stream`.
+    """
+    started = time.monotonic()
+    result = {
+        "content": "",
+        "reasoning": "",
+        "tokens": 0,
+        "first_token_seconds": None,
+        "total_seconds": 0.0,
+        "cancelled": False,
+    }
+    content_parts, reasoning_parts = [], []
+
+    def consume(records):
+        for record in records:
+            content, reasoning = _record_text(record)
+            if not (content or reasoning):
+                continue
+            if result["first_token_seconds"] is None:
+                result["first_token_seconds"] = time.monotonic() - started
+            result["tokens"] += 1
+            content_parts.append(content)
+            reasoning_parts.append(reasoning)
+            if on_token and content:
+                on_token(content)
+
+    stream = None
+    try:
+        response = client.invoke_endpoint_with_response_stream(
+            EndpointName=endpoint_name,
+            ContentType="application/json",
+            Body=json.dumps(dict(payload, stream=True)),
+            **invoke_kwargs,
+        )
+        stream = response["Body"]
+        buffer = b""
+        for event in stream:
+            part = event.get("PayloadPart")
+            if part:
+                records, buffer = _iter_stream_records(buffer + part["Bytes"])
+                consume(records)
+            if time_left(deadline) <= 0:
+                print("DEBUG: Turn deadline reached, cancelling stream.")
+                result["cancelled"] = True
+                break
+        else:
+            # Some containers don't terminate the last record with a newline
+            consume(_iter_stream_records(buffer + b"\n")[0])
+    except (ReadTimeoutError, ConnectTimeoutError, StreamReadTimeoutError) as e:
+        # The socket timeout is derived from the deadline, so this is the deadline
+        print(f"DEBUG: Endpoint call timed out at the turn deadline: {e}")
+        result["cancelled"] = True
+    finally:
+        if stream is not None:
+            stream.close()
+
+    result["content"] = "".join(content_parts)
+    result["reasoning"] = "".join(reasoning_parts)
+    result["total_seconds"] = time.monotonic() - started
+    return result
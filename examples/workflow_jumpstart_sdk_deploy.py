@@ -18,9 +18,15 @@ import sagemaker
 import boto3
 from sagemaker.jumpstart.model import JumpStartModel
 import json
+import os
+import sys
 import time
 from botocore.exceptions import ClientError
 
+# Autoscaling helpers live with the deploy scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from endpoint_autoscaling import ScalingPolicy, apply_from_env
+
 def get_or_create_sagemaker_role(role_name, boto_session):
     iam = boto_session.client("iam")
     
@@ -119,10 +125,13 @@ model = JumpStartModel(
 
 # Deploy the endpoint
 # accept_eula=True is often required for JumpStart models
+# Starts at the autoscaling floor (1 unless AUTOSCALING_MIN_CAPACITY is set)
 try:
-    predictor = model.deploy(accept_eula=True)
+    predictor = model.deploy(accept_eula=True, initial_instance_count=ScalingPolicy.from_env().min_capacity)
     ENDPOINT_NAME = predictor.endpoint_name
     print(f"Model deployed successfully! Endpoint Name: {ENDPOINT_NAME}")
+    # Registers scaling policies when ENABLE_AUTOSCALING=true (see scripts/endpoint_autoscaling.py)
+    apply_from_env(ENDPOINT_NAME, boto_session)
 except Exception as e:
     print(f"Deployment failed or endpoint already exists: {e}")
     # Attempt to retrieve existing endpoint if deployment fails (e.g. if you ran this cell twice)
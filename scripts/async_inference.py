@@ -0,0 +1,322 @@
+# %% [markdown]
+# ## Asynchronous Inference
+# Long DeepSeek R1 generations (thousands of reasoning tokens) run into the
+# real-time invocation timeout. SageMaker Asynchronous Inference takes the payload
+# from S3, queues it on the endpoint and writes the result back to S3, with up
+# to an hour per request.
+#
+# - `async_inference_config()`: the `AsyncInferenceConfig` for `model.deploy()`
+# - `AsyncInferenceClient.submit()` / `submit_batch()`: upload payloads and call
+#   `invoke_endpoint_async`, in parallel for bulk workloads
+# - `AsyncInferenceClient.wait()`: yields jobs as they finish, found by polling S3
+#   with per-job exponential backoff, or from SNS notifications through an SQS queue
+# - `AsyncInferenceClient.run_batch()`: bulk submission with a bounded number of
+#   outstanding jobs; results come back in input order
+#
+#     python async_inference.py --endpoint-name my-async-endpoint --bucket my-bucket \
+#         --prompts prompts.txt --max-new-tokens 4096
+
+# %%
+import argparse
+import heapq
+import json
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# --- Configuration ---
+ENABLE_ASYNC_INFERENCE = os.environ.get("ENABLE_ASYNC_INFERENCE", "false").lower() == "true"
+ASYNC_S3_BUCKET = os.environ.get("ASYNC_S3_BUCKET")  # Defaults to the SageMaker session bucket
+ASYNC_S3_PREFIX = os.environ.get("ASYNC_S3_PREFIX", "async-inference")
+MAX_CONCURRENT_INVOCATIONS = int(os.environ.get("ASYNC_MAX_CONCURRENT_INVOCATIONS", "4"))  # Per instance
+INVOCATION_TIMEOUT_SECONDS = int(os.environ.get("ASYNC_INVOCATION_TIMEOUT_SECONDS", "3600"))
+SUCCESS_TOPIC = os.environ.get("ASYNC_SNS_SUCCESS_TOPIC")
+ERROR_TOPIC = os.environ.get("ASYNC_SNS_ERROR_TOPIC")
+POLL_INITIAL_SECONDS = float(os.environ.get("ASYNC_POLL_INITIAL_SECONDS", "2"))
+POLL_MAX_SECONDS = float(os.environ.get("ASYNC_POLL_MAX_SECONDS", "30"))
+DEFAULT_WORKERS = 16
+
+PENDING, COMPLETED, FAILED = "pending", "completed", "failed"
+
+
+def async_output_paths(bucket, prefix=ASYNC_S3_PREFIX):
+    base = f"s3://{bucket}/{prefix.strip('/')}"
+    return {"input": f"{base}/input", "output": f"{base}/output", "failure": f"{base}/failure"}
+
+
+def async_inference_config(bucket, prefix=ASYNC_S3_PREFIX, max_concurrent=MAX_CONCURRENT_INVOCATIONS,
+                           success_topic=SUCCESS_TOPIC, error_topic=ERROR_TOPIC):
+    """`AsyncInferenceConfig` for `model.deploy(async_inference_config=...)`."""
+    from sagemaker.async_inference import AsyncInferenceConfig
+
+    paths = async_output_paths(bucket, prefix)
+    notification = {}
+    if success_topic:
+        notification["SuccessTopic"] = success_topic
+    if error_topic:
+        notification["ErrorTopic"] = error_topic
+    return AsyncInferenceConfig(
+        output_path=paths["output"],
+        failure_path=paths["failure"],
+        max_concurrent_invocations_per_instance=max_concurrent,
+        notification_config=notification or None,
+    )
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def _parse_body(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return data.decode("utf-8", errors="replace")
+
+
+class AsyncJob:
+    """One async invocation and, once finished, its result or error."""
+
+    def __init__(self, index, inference_id, input_location, output_location, failure_location):
+        self.index = index
+        self.inference_id = inference_id
+        self.input_location = input_location
+        self.output_location = output_location
+        self.failure_location = failure_location
+        self.submitted = time.monotonic()
+        self.finished = None
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.checks = 0
+        self.next_check = self.submitted
+        self.delay = POLL_INITIAL_SECONDS
+
+    @property
+    def seconds(self):
+        return (self.finished or time.monotonic()) - self.submitted
+
+    def __lt__(self, other):
+        return self.next_check < other.next_check
+
+
+class AsyncInferenceClient:
+    """Submits payloads to an async endpoint and collects the results from S3."""
+
+    def __init__(self, runtime_client, s3_client, endpoint_name, bucket, prefix=ASYNC_S3_PREFIX,
+                 workers=DEFAULT_WORKERS, poll_initial=POLL_INITIAL_SECONDS, poll_max=POLL_MAX_SECONDS,
+                 invocation_timeout=INVOCATION_TIMEOUT_SECONDS):
+        self.runtime = runtime_client
+        self.s3 = s3_client
+        self.endpoint_name = endpoint_name
+        self.bucket = bucket
+        self.input_prefix = _split_s3_uri(async_output_paths(bucket, prefix)["input"])[1]
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.invocation_timeout = invocation_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-inference")
+        self._submitted = 0
+
+    # --- Submission ---
+
+    def submit(self, payload, inference_id=None, index=None):
+        """Upload one payload and invoke the endpoint; returns an AsyncJob."""
+        inference_id = inference_id or str(uuid.uuid4())
+        key = f"{self.input_prefix}/{inference_id}.json"
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/json")
+        response = self.runtime.invoke_endpoint_async(
+            EndpointName=self.endpoint_name,
+            InputLocation=f"s3://{self.bucket}/{key}",
+            ContentType="application/json",
+            InferenceId=inference_id,
+            InvocationTimeoutSeconds=self.invocation_timeout,
+        )
+        if index is None:
+            index, self._submitted = self._submitted, self._submitted + 1
+        job = AsyncJob(index, response.get("InferenceId", inference_id), f"s3://{self.bucket}/{key}",
+                       response["OutputLocation"], response.get("FailureLocation"))
+        job.delay = self.poll_initial
+        job.next_check = job.submitted + self.poll_initial
+        return job
+
+    def submit_batch(self, payloads, start_index=0):
+        """Submit many payloads in parallel; returns jobs in input order."""
+        futures = [self.executor.submit(self.submit, payload, None, start_index + i)
+                   for i, payload in enumerate(payloads)]
+        return [future.result() for future in futures]
+
+    # --- Retrieval ---
+
+    def _fetch(self, job, status, location):
+        bucket, key = _split_s3_uri(location)
+        data = self.s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        job.status = status
+        job.finished = time.monotonic()
+        if status == COMPLETED:
+            job.result = _parse_body(data)
+        else:
+            job.error = data.decode("utf-8", errors="replace")
+        return job
+
+    def _head(self, location):
+        bucket, key = _split_s3_uri(location)
+        try:
+            self.s3.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _check(self, job):
+        """Fetch the job's result or failure if either exists in S3."""
+        job.checks += 1
+        if self._head(job.output_location):
+            return self._fetch(job, COMPLETED, job.output_location)
+        if job.failure_location and self._head(job.failure_location):
+            return self._fetch(job, FAILED, job.failure_location)
+        return None
+
+    def _poll_due(self, due):
+        # A HEAD per expected key: SageMaker names the output objects itself, so there is no per-run
+        # prefix to LIST, and listing the shared output prefix grows with every request ever served
+        return [job for job in self.executor.map(self._check, due) if job]
+
+    def poll(self, jobs, timeout=None):
+        """Yield jobs as they finish, checking S3 for each with exponential backoff and jitter.
+
+        Jobs appended to `jobs` while iterating are picked up too.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        heap = []
+        seen = 0
+        while heap or seen < len(jobs):
+            for job in jobs[seen:]:
+                if job.status == PENDING:
+                    heapq.heappush(heap, job)
+            seen = len(jobs)
+            if not heap:
+                continue
+            now = time.monotonic()
+            if deadline and now >= deadline:
+                raise TimeoutError(f"{len(heap)} async jobs still pending after {timeout}s")
+            wait = heap[0].next_check - now
+            if wait > 0:
+                time.sleep(min(wait, deadline - now) if deadline else wait)
+                continue
+            due = []
+            while heap and heap[0].next_check <= now:
+                due.append(heapq.heappop(heap))
+            for job in self._poll_due(due):
+                yield job
+            for job in due:
+                if job.status == PENDING:
+                    job.delay = min(self.poll_max, job.delay * 2)
+                    job.next_check = time.monotonic() + job.delay * random.uniform(0.8, 1.2)
+                    heapq.heappush(heap, job)
+
+    def listen(self, jobs, sqs_client, queue_url, timeout=None):
+        """Yield jobs as their SNS notifications arrive on `queue_url` (an SQS queue subscribed to the topics).
+
+        Jobs appended to `jobs` while iterating are picked up too.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        pending = {}
+        seen = 0
+        while pending or seen < len(jobs):
+            pending.update((job.inference_id, job) for job in jobs[seen:] if job.status == PENDING)
+            seen = len(jobs)
+            if not pending:
+                continue
+            remaining = deadline - time.monotonic() if deadline else 20
+            if remaining <= 0:
+                raise TimeoutError(f"{len(pending)} async jobs still pending after {timeout}s")
+            response = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10,
+                                                  WaitTimeSeconds=max(1, min(20, int(remaining))))
+            handled, finished, failed = [], [], []
+            for message in response.get("Messages", []):
+                body = json.loads(message["Body"])
+                notification = json.loads(body["Message"]) if "Message" in body else body  # SNS envelope
+                job = pending.pop(notification.get("inferenceId"), None)
+                if job is None:
+                    continue  # Another client's job; it becomes visible again for them
+                handled.append({"Id": str(len(handled)), "ReceiptHandle": message["ReceiptHandle"]})
+                if notification.get("invocationStatus") == "Completed":
+                    location = notification.get("responseParameters", {}).get("outputLocation", job.output_location)
+                    finished.append((job, COMPLETED, location))
+                else:
+                    job.status = FAILED
+                    job.finished = time.monotonic()
+                    job.error = notification.get("failureReason", "Async inference failed")
+                    failed.append(job)
+            if handled:
+                # Acknowledge before yielding, so a caller that stops early doesn't get them redelivered
+                sqs_client.delete_message_batch(QueueUrl=queue_url, Entries=handled)
+            yield from failed
+            yield from self.executor.map(lambda args: self._fetch(*args), finished)
+
+    def wait(self, jobs, timeout=None, sqs_client=None, queue_url=None):
+        """Yield jobs as they finish: from notifications if a queue is given, otherwise by polling S3."""
+        if sqs_client and queue_url:
+            return self.listen(jobs, sqs_client, queue_url, timeout)
+        return self.poll(jobs, timeout)
+
+    def run_batch(self, payloads, max_outstanding=None, timeout=None, sqs_client=None, queue_url=None):
+        """Submit `payloads` keeping at most `max_outstanding` in flight; returns finished jobs in input order."""
+        payloads = list(payloads)
+        max_outstanding = max_outstanding or len(payloads)
+        # `wait` picks up jobs appended to this list, so each finished job makes room for the next
+        jobs = self.submit_batch(payloads[:max_outstanding])
+        finished = 0
+        started = time.monotonic()
+        for _ in self.wait(jobs, timeout, sqs_client, queue_url):
+            finished += 1
+            if len(jobs) < len(payloads):
+                jobs.append(self.submit(payloads[len(jobs)], index=len(jobs)))
+            if finished % 10 == 0 or finished == len(payloads):
+                print(f"{finished}/{len(payloads)} async jobs finished ({time.monotonic() - started:.1f}s)")
+        return sorted(jobs, key=lambda job: job.index)
+
+
+def generated_text(job):
+    """Text of a finished TGI job, or None."""
+    result = job.result
+    if isinstance(result, list) and result:
+        result = result[0]
+    if isinstance(result, dict):
+        return result.get("generated_text") or result.get("choices", [{}])[0].get("message", {}).get("content")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run prompts through an async SageMaker endpoint.")
+    parser.add_argument("--endpoint-name", required=True)
+    parser.add_argument("--bucket", default=ASYNC_S3_BUCKET, required=ASYNC_S3_BUCKET is None)
+    parser.add_argument("--prefix", default=ASYNC_S3_PREFIX)
+    parser.add_argument("--prompts", required=True, help="Text file with one prompt per line")
+    parser.add_argument("--max-new-tokens", type=int, default=4096)
+    parser.add_argument("--max-outstanding", type=int, default=64)
+    parser.add_argument("--queue-url", default=None, help="SQS queue subscribed to the SNS topics")
+    parser.add_argument("--endpoint-url", default=os.environ.get("SAGEMAKER_RUNTIME_ENDPOINT_URL"))
+    parser.add_argument("--aws-endpoint-url", default=None, help="S3/SQS stand-in, e.g. moto")
+    args = parser.parse_args()
+
+    import boto3
+
+    session = boto3.Session()
+    client = AsyncInferenceClient(session.client("sagemaker-runtime", endpoint_url=args.endpoint_url),
+                                  session.client("s3", endpoint_url=args.aws_endpoint_url),
+                                  args.endpoint_name, args.bucket, args.prefix)
+    with open(args.prompts) as f:
+        payloads = [{"inputs": line.strip(), "parameters": {"max_new_tokens": args.max_new_tokens}}
+                    for line in f if line.strip()]
+    sqs = session.client("sqs", endpoint_url=args.aws_endpoint_url) if args.queue_url else None
+    for job in client.run_batch(payloads, args.max_outstanding, sqs_client=sqs, queue_url=args.queue_url):
+        print(json.dumps({"index": job.index, "inference_id": job.inference_id, "status": job.status,
+                          "seconds": round(job.seconds, 1), "text": generated_text(job), "error": job.error}))
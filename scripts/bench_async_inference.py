@@ -0,0 +1,120 @@
+# %% [markdown]
+# ## Benchmark: Long Generations, Real-Time vs. Asynchronous Inference
+# Runs entirely locally: moto provides S3, SNS and SQS, and the endpoint stand-in
+# serves both `InvokeEndpoint` and `InvokeEndpointAsync` with slow, long generations.
+# 1. real-time: requests longer than the invocation timeout fail
+# 2. async, polling S3 with backoff: every job finishes; counts the S3 requests
+# 3. async, SNS -> SQS notifications: the same, without polling
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python bench_async_inference.py --jobs 40 --tokens 400 --token-ms 5
+
+# %%
+import argparse
+import json
+import time
+from collections import Counter
+
+import boto3
+from botocore.config import Config
+
+from async_inference import COMPLETED, FAILED, AsyncInferenceClient, async_output_paths, generated_text
+from bench_stream_model_artifacts import BUCKET, start_moto
+from local_endpoint_standin import AsyncStandin, StandinSettings, serve
+
+
+def count_requests(client):
+    counts = Counter()
+    client.meta.events.register("before-call", lambda model, **_: counts.update([model.name]))
+    return counts
+
+
+def notification_queue(session, endpoint_url):
+    sns = session.client("sns", endpoint_url=endpoint_url)
+    sqs = session.client("sqs", endpoint_url=endpoint_url)
+    topics = {name: sns.create_topic(Name=f"async-{name}")["TopicArn"] for name in ("success", "error")}
+    queue_url = sqs.create_queue(QueueName="async-results")["QueueUrl"]
+    queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])["Attributes"]["QueueArn"]
+    for topic in topics.values():
+        sns.subscribe(TopicArn=topic, Protocol="sqs", Endpoint=queue_arn)
+    return sns, sqs, topics, queue_url
+
+
+def summarize(label, jobs, seconds, counts=None):
+    completed = [job for job in jobs if job.status == COMPLETED]
+    failed = [job for job in jobs if job.status == FAILED]
+    latencies = sorted(job.seconds for job in completed)
+    p50 = latencies[len(latencies) // 2] if latencies else float("nan")
+    requests = sum(counts.values()) if counts else "-"
+    print(f"{label:>22} {len(completed):>9} {len(failed):>6} {seconds:>8.1f} {p50:>10.2f} {requests:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare real-time and async inference for long generations.")
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--tokens", type=int, default=400, help="Generated tokens per request")
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8, help="Async invocations processed at once")
+    parser.add_argument("--max-outstanding", type=int, default=16)
+    parser.add_argument("--realtime-timeout", type=float, default=1.5,
+                        help="Stand-in for the 60s real-time limit, scaled like the token time")
+    args = parser.parse_args()
+
+    server, aws_url = start_moto()
+    session = boto3.Session(region_name="us-east-1")
+    s3 = session.client("s3", endpoint_url=aws_url)
+    s3.create_bucket(Bucket=BUCKET)
+    sns, sqs, topics, queue_url = notification_queue(session, aws_url)
+    paths = async_output_paths(BUCKET)
+
+    settings = StandinSettings(latency_ms=50.0, token_ms=args.token_ms, tokens=args.tokens,
+                               error_rate=args.error_rate, seed=7)
+    backend = AsyncStandin(s3, paths["output"], paths["failure"], args.concurrency, sns,
+                           topics["success"], topics["error"])
+    standin = serve(port=0, settings=settings, async_backend=backend)
+    runtime_url = f"http://127.0.0.1:{standin.server_address[1]}"
+    runtime = session.client("sagemaker-runtime", endpoint_url=runtime_url,
+                             config=Config(read_timeout=args.realtime_timeout, retries={"total_max_attempts": 1},
+                                           max_pool_connections=32))
+    payloads = [{"inputs": f"Reason step by step about problem {i}.", "parameters": {"max_new_tokens": args.tokens}}
+                for i in range(args.jobs)]
+    print(f"{args.jobs} requests of {args.tokens} tokens at {args.token_ms}ms/token "
+          f"(~{args.tokens * args.token_ms / 1000:.1f}s each), {args.error_rate:.0%} injected failures\n")
+    print(f"{'mode':>22} {'completed':>9} {'failed':>6} {'seconds':>8} {'p50 job s':>10} {'AWS requests':>12}")
+
+    try:
+        # 1. Real-time: a handful of calls is enough to show the timeout
+        timeouts = 0
+        started = time.monotonic()
+        for payload in payloads[:4]:
+            try:
+                runtime.invoke_endpoint(EndpointName="r1", ContentType="application/json", Body=json.dumps(payload))
+            except Exception:
+                timeouts += 1
+        print(f"{'real-time (4 calls)':>22} {4 - timeouts:>9} {timeouts:>6} {time.monotonic() - started:>8.1f}")
+
+        for label, use_queue in (("async, S3 polling", False), ("async, notifications", True)):
+            s3_client = session.client("s3", endpoint_url=aws_url)
+            counts = count_requests(s3_client)
+            if use_queue:
+                sqs.purge_queue(QueueUrl=queue_url)  # Notifications of the polling run
+                sqs_counts = count_requests(sqs)
+            client = AsyncInferenceClient(runtime, s3_client, "r1", BUCKET, poll_initial=0.25, poll_max=2.0)
+            started = time.monotonic()
+            jobs = client.run_batch(payloads, args.max_outstanding, timeout=600,
+                                    sqs_client=sqs if use_queue else None, queue_url=queue_url if use_queue else None)
+            if use_queue:
+                counts.update(sqs_counts)
+            summarize(label, jobs, time.monotonic() - started, counts)
+            assert [job.index for job in jobs] == list(range(args.jobs))
+            for job in jobs:
+                if job.status == COMPLETED:
+                    assert len(generated_text(job).split()) == args.tokens, job.result
+                else:
+                    assert job.status == FAILED and "Injected failure" in job.error, job.error
+            print(f"{'':>22} requests: {dict(counts)}")
+        assert timeouts == 4, "real-time calls should have exceeded the timeout"
+    finally:
+        standin.shutdown()
+        server.stop()
@@ -0,0 +1,60 @@
+# %% [markdown]
+# ## Benchmark: Redeploy Iterations with Content-Addressed Artifacts
+# Publishes a synthetic model directory to an in-process moto S3 (or
+# `--endpoint-url`), then repeats the steps of an inference-code iteration:
+# 1. first publish: everything is hashed and uploaded
+# 2. publish again unchanged: nothing is re-hashed or uploaded
+# 3. edit `inference.py` and publish: only the code layer is uploaded
+# 4. publish from a fresh machine (empty local cache): weights are re-hashed, found in S3, not uploaded
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python bench_content_addressed_artifacts.py --size-mb 512
+
+# %%
+import argparse
+import os
+import shutil
+import tempfile
+
+from bench_stream_model_artifacts import BUCKET, make_model_dir, start_moto
+from content_addressed_artifacts import ArtifactStore
+from stream_model_artifacts import MiB, make_s3_client
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time redeploy iterations with content-addressed artifacts.")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--endpoint-url", default=None, help="Existing S3 stand-in; defaults to in-process moto")
+    args = parser.parse_args()
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if not endpoint_url:
+        server, endpoint_url = start_moto()
+    s3 = make_s3_client(endpoint_url, "us-east-1")
+    s3.create_bucket(Bucket=BUCKET)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        model_dir = os.path.join(work_dir, "model")
+        make_model_dir(model_dir, args.size_mb)
+        cache_path = os.path.join(work_dir, "artifact-cache.json")
+        store = ArtifactStore(s3, BUCKET, cache_path=cache_path)
+
+        runs = [("first publish", store.publish(model_dir))]
+        runs.append(("unchanged", store.publish(model_dir)))
+        with open(os.path.join(model_dir, "inference.py"), "a") as f:
+            f.write("\n# tweak the handler\n")
+        runs.append(("code change", store.publish(model_dir)))
+        fresh = ArtifactStore(s3, BUCKET, cache_path=os.path.join(work_dir, "fresh-cache.json"))
+        runs.append(("empty cache", fresh.publish(model_dir)))
+
+        print(f"\n{'step':>14} {'seconds':>8} {'uploaded MiB':>13} {'layers uploaded':>16}")
+        for step, result in runs:
+            print(f"{step:>14} {result['seconds']:>8.2f} {result['uploaded_bytes'] / MiB:>13.2f} "
+                  f"{', '.join(result['uploaded']) or '-':>16}")
+        assert runs[0][1]["weights"] == runs[2][1]["weights"], "weights layer should be reused"
+        assert runs[0][1]["code"] != runs[2][1]["code"], "code layer should change"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if server:
+            server.stop()
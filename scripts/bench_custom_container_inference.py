@@ -0,0 +1,120 @@
+# %% [markdown]
+# ## Benchmark: Dynamic Batching in the Custom Container Handler
+# Runs `custom_container_inference.py` on CPU with a tiny, randomly initialized
+# GPT-2 and an in-memory word-level tokenizer (nothing is downloaded), and
+# compares one-request-at-a-time generation (`--max-batch-size 1`) with
+# dynamic batching under concurrent callers:
+#
+#     python bench_custom_container_inference.py --concurrency 16 --requests 256
+#
+# It also checks that greedy outputs are the same whether a prompt ran alone
+# or inside a padded batch.
+
+# %%
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+import custom_container_inference as handler
+
+VOCAB = ("<pad> <eos> <unk> " + " ".join(f"w{i}" for i in range(509))).split()
+
+
+def tiny_model(layers=4, hidden=256, heads=4, seed=0):
+    """Randomly initialized GPT-2 with the vocabulary of `tiny_tokenizer`."""
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(VOCAB), n_positions=1024, n_embd=hidden, n_layer=layers, n_head=heads,
+                        bos_token_id=1, eos_token_id=1, pad_token_id=0)
+    model = GPT2LMHeadModel(config).eval()
+    model.generation_config.eos_token_id = None  # Always generate the requested number of tokens
+    return model
+
+
+def tiny_tokenizer():
+    tokenizer = Tokenizer(models.WordLevel({word: i for i, word in enumerate(VOCAB)}, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="<eos>", unk_token="<unk>")
+    return handler.load_tokenizer(fast)
+
+
+def make_prompts(count, seed=0):
+    rng = random.Random(seed)
+    prompts = []
+    for _ in range(count):
+        length = rng.randint(8, 96)
+        prompts.append((" ".join(rng.choice(VOCAB[3:]) for _ in range(length)), rng.choice((16, 32, 48))))
+    return prompts
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def run(model, tokenizer, prompts, concurrency, max_batch_size, max_batch_tokens, max_wait_ms):
+    batcher = handler.DynamicBatcher(model, tokenizer, max_batch_size=max_batch_size,
+                                     max_batch_tokens=max_batch_tokens, max_wait_ms=max_wait_ms)
+    handler.warmup(batcher)
+    batches_before, requests_before = batcher.batches, batcher.requests
+    artifacts = {"model": model, "tokenizer": tokenizer, "batcher": batcher}
+    latencies, outputs = [], {}
+    lock = threading.Lock()
+
+    def call(index):
+        prompt, max_new_tokens = prompts[index]
+        started = time.perf_counter()
+        prediction = handler.predict_fn({"inputs": prompt, "parameters": {"max_new_tokens": max_new_tokens}}, artifacts)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            outputs[index] = prediction[0]["generated_text"]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(len(prompts))))
+    elapsed = time.perf_counter() - started
+    batches = batcher.batches - batches_before
+    return {
+        "requests_per_second": len(prompts) / elapsed,
+        "tokens_per_second": sum(n for _, n in prompts) / elapsed,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "mean_batch_size": (batcher.requests - requests_before) / max(1, batches),
+        "outputs": outputs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU benchmark for the dynamic-batching inference handler.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-batch-tokens", type=int, default=8192)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, tokenizer = tiny_model(), tiny_tokenizer()
+    prompts = make_prompts(args.requests)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    results = {}
+    for label, batch_size in (("unbatched", 1), ("dynamic", args.max_batch_size)):
+        results[label] = run(model, tokenizer, prompts, args.concurrency, batch_size, args.max_batch_tokens, args.max_wait_ms)
+        stats = results[label]
+        print(f"{label:>10}: {stats['requests_per_second']:7.1f} req/s, {stats['tokens_per_second']:8.0f} tok/s, "
+              f"p50 {stats['latency_p50'] * 1000:6.0f} ms, p99 {stats['latency_p99'] * 1000:6.0f} ms, "
+              f"mean batch {stats['mean_batch_size']:.1f}")
+
+    same = sum(results["unbatched"]["outputs"][i] == results["dynamic"]["outputs"][i] for i in range(len(prompts)))
+    print(f"Speedup: {results['dynamic']['requests_per_second'] / results['unbatched']['requests_per_second']:.2f}x; "
+          f"{same}/{len(prompts)} outputs identical to unbatched generation")
@@ -0,0 +1,56 @@
+# %% [markdown]
+# ## Benchmark: First User Requests With and Without Warmup
+# Starts an in-process stand-in whose first `--cold-requests` requests are slow
+# (like a fresh TGI endpoint), then sends a burst of "user" requests:
+# 1. straight after deploy, so users absorb the cold start
+# 2. after `warmup_endpoint()` reported ready, on a fresh stand-in
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python bench_endpoint_warmup.py --cold-requests 40 --cold-ms 1500
+
+# %%
+import argparse
+import json
+import statistics
+
+import boto3
+
+from endpoint_warmup import _invoke, print_curve, runtime_client_for, synthetic_prompt, warmup_endpoint, warmup_shapes
+from local_endpoint_standin import StandinSettings, serve
+
+
+def user_burst(client, requests):
+    body = json.dumps({"inputs": synthetic_prompt(200), "parameters": {"max_new_tokens": 32}})
+    latencies = [_invoke(client, "standin", body)[0] for _ in range(requests)]
+    return {"p50": statistics.median(latencies), "max": max(latencies), "first": latencies[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare first user requests with and without warmup.")
+    parser.add_argument("--cold-requests", type=int, default=40)
+    parser.add_argument("--cold-ms", type=float, default=1500.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--user-requests", type=int, default=20)
+    args = parser.parse_args()
+
+    session = boto3.Session(region_name="us-east-1")
+    results = {}
+    for warm in (False, True):
+        settings = StandinSettings(latency_ms=args.latency_ms, token_ms=1.0, cold_requests=args.cold_requests,
+                                   cold_ms=args.cold_ms)
+        server = serve(port=0, settings=settings)
+        client = runtime_client_for(session, f"http://127.0.0.1:{server.server_address[1]}")
+        try:
+            if warm:
+                warmup = warmup_endpoint(client, "standin", warmup_shapes(), max_new_tokens=16, curve_path=None)
+                print_curve(warmup["curve"])
+                assert warmup["ready"], "warmup never stabilized"
+                assert warmup["requests"] >= args.cold_requests, "ready before the cold start was over"
+            results[warm] = user_burst(client, args.user_requests)
+        finally:
+            server.shutdown()
+
+    print(f"\n{'':>16} {'first ms':>9} {'p50 ms':>8} {'max ms':>8}")
+    for warm, label in ((False, "no warmup"), (True, "after warmup")):
+        r = results[warm]
+        print(f"{label:>16} {r['first']:>9.0f} {r['p50']:>8.0f} {r['max']:>8.0f}")
@@ -0,0 +1,136 @@
+# %% [markdown]
+# ## Benchmark: Streaming Packaging vs. Write-then-Upload
+# Builds a synthetic model directory (fp16-like weights plus small config
+# files), then packages it to S3 four ways and reports wall time, throughput
+# and the local disk used for staging:
+# - `baseline`: the notebook's old flow, `tarfile` "w:gz" to /tmp then `upload_file`
+# - `tar.gz`, `tar`, `prefix`: `stream_model_artifacts.package_model_dir`
+#
+# Every upload is downloaded again and checked file by file. Without
+# `--endpoint-url` an in-process moto S3 server is started (`pip install "moto[server]"`):
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python bench_stream_model_artifacts.py --size-mb 512
+
+# %%
+import argparse
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+from stream_model_artifacts import FORMATS, MiB, make_s3_client, package_model_dir
+
+BUCKET = "model-artifacts-bench"
+
+
+def make_model_dir(path, size_mb, shards=2, seed=0):
+    """Weights are fp16 normals: like real checkpoints, they barely compress."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    per_shard = size_mb * MiB // shards // 2
+    for i in range(shards):
+        weights = rng.standard_normal(per_shard, dtype=np.float32).astype(np.float16)
+        weights.tofile(os.path.join(path, f"model-{i + 1:05d}-of-{shards:05d}.safetensors"))
+    with open(os.path.join(path, "config.json"), "w") as f:
+        f.write('{"model_type": "gpt2", "n_layer": 24}\n')
+    with open(os.path.join(path, "inference.py"), "w") as f:
+        f.write("def model_fn(model_dir):\n    pass\n")
+
+
+def file_digests(model_dir):
+    digests = {}
+    for root, _, files in os.walk(model_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                digests[os.path.relpath(path, model_dir).replace(os.sep, "/")] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def uploaded_digests(s3, key, fmt):
+    if fmt == "prefix":
+        prefix = key.rstrip("/") + "/"
+        digests = {}
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=prefix):
+            for item in page.get("Contents", []):
+                body = s3.get_object(Bucket=BUCKET, Key=item["Key"])["Body"].read()
+                digests[item["Key"][len(prefix):]] = hashlib.sha256(body).hexdigest()
+        return digests
+    body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    digests = {}
+    with tarfile.open(fileobj=io.BytesIO(body), mode="r:*") as tar:
+        for member in tar:
+            if member.isfile():
+                digests[os.path.normpath(member.name)] = hashlib.sha256(tar.extractfile(member).read()).hexdigest()
+    return digests
+
+
+def baseline(model_dir, s3, key):
+    """Old notebook flow: full tar.gz on local disk, then upload it."""
+    started = time.perf_counter()
+    tar_path = os.path.join(tempfile.mkdtemp(), "model.tar.gz")
+    try:
+        with tarfile.open(tar_path, "w:gz") as tar:
+            tar.add(model_dir, arcname=".")
+        staged = os.path.getsize(tar_path)
+        s3.upload_file(tar_path, BUCKET, key)
+    finally:
+        shutil.rmtree(os.path.dirname(tar_path), ignore_errors=True)
+    return time.perf_counter() - started, staged
+
+
+def start_moto():
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # One access-log line per part otherwise
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare streaming model packaging with write-then-upload.")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--part-size-mb", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--endpoint-url", default=None, help="Existing S3 stand-in; defaults to in-process moto")
+    args = parser.parse_args()
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if not endpoint_url:
+        server, endpoint_url = start_moto()
+    s3 = make_s3_client(endpoint_url, "us-east-1", args.workers)
+    s3.create_bucket(Bucket=BUCKET)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        model_dir = os.path.join(work_dir, "model")
+        make_model_dir(model_dir, args.size_mb)
+        expected = file_digests(model_dir)
+        source_mb = sum(os.path.getsize(os.path.join(model_dir, f)) for f in os.listdir(model_dir)) / MiB
+        print(f"Synthetic model: {source_mb:.0f} MiB in {len(expected)} files, S3 at {endpoint_url}\n")
+        print(f"{'method':>9} {'seconds':>8} {'MiB/s':>7} {'uploaded MiB':>13} {'staged MiB':>11} {'verified':>9}")
+
+        seconds, staged = baseline(model_dir, s3, "baseline/model.tar.gz")
+        ok = uploaded_digests(s3, "baseline/model.tar.gz", "tar.gz") == expected
+        print(f"{'baseline':>9} {seconds:>8.2f} {source_mb / seconds:>7.1f} {staged / MiB:>13.1f} {staged / MiB:>11.1f} {str(ok):>9}")
+
+        for fmt in FORMATS:
+            key = f"{fmt}/model" + {"tar.gz": ".tar.gz", "tar": ".tar", "prefix": ""}[fmt]
+            stats = package_model_dir(model_dir, s3, BUCKET, key, fmt, args.part_size_mb * MiB, args.workers)
+            ok = uploaded_digests(s3, key, fmt) == expected
+            print(f"{fmt:>9} {stats['seconds']:>8.2f} {stats['source_bytes_per_second'] / MiB:>7.1f} "
+                  f"{stats['uploaded_bytes'] / MiB:>13.1f} {0.0:>11.1f} {str(ok):>9}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if server:
+            server.stop()
@@ -0,0 +1,108 @@
+# %% [markdown]
+# ## Benchmark: Capture Traffic, Replay It Against Another Configuration
+# Two in-process stand-ins play the current and the candidate endpoint
+# configuration:
+# - current: faster first token
+# - candidate: slower per-token decode
+#
+# 1. Open-loop synthetic traffic (Poisson arrivals, streaming chat plus TGI
+#    requests, some with secrets in them) goes to the current endpoint through
+#    a client hooked by `TrafficCapture`.
+# 2. The log is replayed against the candidate at 1x, then at `--speed`x.
+# 3. Latency and throughput are diffed side by side, and the replay's schedule
+#    is checked against the captured arrival times.
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python bench_traffic_replay.py --requests 120 --rate 8 --speed 4
+
+# %%
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from local_endpoint_standin import StandinSettings, serve
+from traffic_capture import TrafficCapture, load_log, print_diff, replay
+
+SECRET = "hf_" + "a1B2c3D4e5F6g7H8i9J0kLmN"
+
+
+def runtime_client(session, port, workers):
+    return session.client("sagemaker-runtime", endpoint_url=f"http://127.0.0.1:{port}",
+                          config=Config(max_pool_connections=workers, retries={"total_max_attempts": 1}))
+
+
+def synthetic_call(client, rng, i):
+    if rng.random() < 0.7:
+        payload = {"messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": f"Question {i}: my token is {SECRET}, mail me at dev{i}@example.com. "
+                                        + "Explain SageMaker endpoints. " * rng.randint(1, 20)},
+        ], "max_tokens": rng.choice([16, 32, 64])}
+        response = client.invoke_endpoint_with_response_stream(
+            EndpointName="current", ContentType="application/json", Body=json.dumps(dict(payload, stream=True)))
+        for _ in response["Body"]:
+            pass
+    else:
+        payload = {"inputs": "Summarize: " + "text " * rng.randint(10, 400),
+                   "parameters": {"max_new_tokens": rng.choice([8, 32, 64])}}
+        client.invoke_endpoint(EndpointName="current", ContentType="application/json",
+                               Body=json.dumps(payload))["Body"].read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture synthetic traffic and replay it against a candidate.")
+    parser.add_argument("--requests", type=int, default=120)
+    parser.add_argument("--rate", type=float, default=8.0, help="Mean arrivals per second")
+    parser.add_argument("--speed", type=float, default=4.0, help="Speed of the second replay")
+    parser.add_argument("--redaction", default="content", choices=("none", "secrets", "content", "drop"))
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    current = serve(port=0, settings=StandinSettings(latency_ms=80.0, token_ms=4.0, seed=1))
+    candidate = serve(port=0, settings=StandinSettings(latency_ms=40.0, token_ms=7.0, seed=2))
+    work_dir = tempfile.mkdtemp()
+    try:
+        session = boto3.Session(region_name="us-east-1")
+        capture = TrafficCapture(os.path.join(work_dir, "capture.jsonl.gz"), redaction=args.redaction)
+        capture.attach(session)  # Every sagemaker-runtime client from this session is recorded
+        client = runtime_client(session, current.server_address[1], 64)
+
+        rng = random.Random(args.seed)
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            for i in range(args.requests):
+                time.sleep(rng.expovariate(args.rate))
+                executor.submit(synthetic_call, client, random.Random(args.seed + i), i)
+        capture.close()
+
+        with gzip.open(capture.log.path, "rt") as f:
+            raw = f.read()
+        assert SECRET not in raw and "@example.com" not in raw or args.redaction == "none", "secret leaked"
+        header, captured = load_log(capture.log.path)
+        size = os.path.getsize(capture.log.path)
+        print(f"Log: {len(captured)} records, {size / 1024:.1f} KiB ({size / len(captured):.0f} B/record), "
+              f"redaction={header['redaction']}")
+
+        # Replay through a plain (unhooked) client
+        replay_client = runtime_client(boto3.Session(region_name="us-east-1"), candidate.server_address[1], 64)
+        for speed in (1.0, args.speed):
+            print(f"\n--- Replay against the candidate at {speed:g}x ---")
+            replayed = replay(captured, replay_client, "candidate", speed=speed,
+                              output_path=os.path.join(work_dir, f"replay-{speed:g}x.jsonl.gz"))
+            origin, start = captured[0]["ts"], replayed[0]["ts"]
+            drift = [abs((r["ts"] - start) - (c["ts"] - origin) / speed) * 1000 for c, r in zip(captured, replayed)]
+            print(f"schedule error: mean {sum(drift) / len(drift):.1f} ms, max {max(drift):.1f} ms")
+            assert all(r and not r.get("error") for r in replayed), "replay had errors"
+            print_diff(captured, replayed, ("captured", f"replay {speed:g}x"))
+    finally:
+        current.shutdown()
+        candidate.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,4 +1,6 @@
-
+# Deletes every endpoint in one region. To find and act on idle endpoints only,
+# across regions and with config snapshots for redeploying, see endpoint_inventory.py.
+import os
 import boto3
 import time
 
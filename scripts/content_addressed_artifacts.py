@@ -0,0 +1,252 @@
+# %% [markdown]
+# ## Content-Addressed Model Artifacts
+# Splits a saved model directory into two layers and stores each in S3 under
+# the SHA-256 of its contents:
+# - **code** (`*.py`, `requirements.txt`, anything under `code/`): a small
+#   `model.tar.gz` with the files under `code/`, used as the container's
+#   `ModelDataUrl` (where the Hugging Face inference toolkit looks for `inference.py`)
+# - **weights** (everything else): uncompressed files under an S3 prefix,
+#   attached as an `AdditionalModelDataSources` channel and mounted at
+#   `/opt/ml/additional-model-data-sources/weights`
+#
+#     s3://{bucket}/{prefix}/code/sha256/{digest}/model.tar.gz
+#     s3://{bucket}/{prefix}/weights/sha256/{digest}/...
+#
+# A layer whose digest is already in S3 is not uploaded again, so changing
+# `inference.py` only uploads a few KB. File hashes and known layers are kept
+# in a local manifest cache, so unchanged multi-GB weights aren't re-read either;
+# hashes are keyed by path within the model directory, size and mtime, so they
+# carry over to a copy of the directory made with its timestamps (`cp -p`, `shutil.copytree`).
+#
+#     python content_addressed_artifacts.py --model-dir /tmp/model --bucket my-bucket
+
+# %%
+import argparse
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+
+from botocore.exceptions import ClientError
+
+from stream_model_artifacts import DEFAULT_WORKERS, MiB, make_s3_client, package_model_dir
+
+# --- Configuration ---
+DEFAULT_PREFIX = "model-artifacts"
+CACHE_PATH = os.environ.get(
+    "ARTIFACT_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "sagemaker-model-artifacts.json")
+)
+CODE_PATTERNS = ("*.py", "requirements.txt", "code/*")
+WEIGHTS_CHANNEL = "weights"
+LAYER_MARKER = ".layer.json"  # Written last, so a partial upload never counts as present
+
+
+def is_code(relative_path):
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in CODE_PATTERNS)
+
+
+class ArtifactStore:
+    """Publishes model directories as content-addressed code and weights layers."""
+
+    def __init__(self, s3_client, bucket, prefix=DEFAULT_PREFIX, cache_path=CACHE_PATH, workers=DEFAULT_WORKERS):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cache = {"files": {}, "layers": []}
+        self._used = set()  # File cache keys looked up by this store
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable artifact cache {cache_path}: {e}")
+        # Entries of the older absolute-path format can't be matched anymore
+        self.cache["files"] = {key: entry for key, entry in self.cache.get("files", {}).items() if "\0" in key}
+
+    def _prune_files(self):
+        """Drop cached hashes whose file version is gone: deleted, or modified since it was hashed."""
+        for key, (_, path) in list(self.cache["files"].items()):
+            if key in self._used:
+                continue
+            try:
+                stat = os.stat(path)
+                current = key.rsplit("\0", 2)[1:] == [str(stat.st_size), str(stat.st_mtime_ns)]
+            except OSError:
+                current = False
+            if not current:
+                del self.cache["files"][key]
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        self._prune_files()
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(temp_path, self.cache_path)
+
+    def file_digest(self, path, relative=None):
+        """SHA-256 of a file, reused from the cache while its path in the model directory, size and mtime match."""
+        stat = os.stat(path)
+        key = f"{relative or os.path.basename(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        self._used.add(key)
+        cached = self.cache["files"].get(key)
+        if cached:
+            cached[1] = os.path.abspath(path)  # Where the file was last seen, for pruning
+            return cached[0]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(8 * MiB), b""):
+                digest.update(block)
+        self.cache["files"][key] = [digest.hexdigest(), os.path.abspath(path)]
+        return digest.hexdigest()
+
+    def layer_digests(self, model_dir):
+        """Digest of each layer: SHA-256 over its sorted (relative path, file digest) pairs."""
+        files = {"code": [], "weights": []}
+        for root, _, names in os.walk(model_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, model_dir).replace(os.sep, "/")
+                files["code" if is_code(relative) else "weights"].append((relative, self.file_digest(path, relative)))
+        digests = {}
+        for layer, entries in files.items():
+            listing = "".join(f"{relative}\0{digest}\n" for relative, digest in sorted(entries))
+            digests[layer] = (hashlib.sha256(listing.encode()).hexdigest(), sorted(entries))
+        return digests
+
+    def layer_uri(self, layer, digest):
+        base = f"s3://{self.bucket}/{self.prefix}/{layer}/sha256/{digest}/"
+        return base + "model.tar.gz" if layer == "code" else base
+
+    def _key(self, uri):
+        return uri[len(f"s3://{self.bucket}/"):]
+
+    def exists(self, layer, digest, verify=False):
+        """Whether the layer is already in S3 (from the cache unless `verify`)."""
+        uri = self.layer_uri(layer, digest)
+        if uri in self.cache["layers"] and not verify:
+            return True
+        key = self._key(uri) if layer == "code" else self._key(uri) + LAYER_MARKER
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                if uri in self.cache["layers"]:
+                    self.cache["layers"].remove(uri)
+                return False
+            raise
+        if uri not in self.cache["layers"]:
+            self.cache["layers"].append(uri)
+        return True
+
+    def _upload_code(self, model_dir, uri, entries):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            for relative, _ in entries:
+                arcname = relative if relative.startswith("code/") else f"code/{relative}"
+                tar.add(os.path.join(model_dir, relative), arcname=arcname)
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(uri), Body=buffer.getvalue())
+        return buffer.tell()
+
+    def _upload_weights(self, model_dir, uri, entries):
+        stats = package_model_dir(model_dir, self.s3, self.bucket, self._key(uri), fmt="prefix",
+                                  workers=self.workers, include=lambda relative: not is_code(relative))
+        marker = {"files": dict(entries), "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(uri) + LAYER_MARKER, Body=json.dumps(marker).encode())
+        return stats["uploaded_bytes"]
+
+    def publish(self, model_dir, verify=False):
+        """Upload whichever layers of `model_dir` aren't in S3 yet; returns URIs and what was uploaded."""
+        started = time.perf_counter()
+        result = {"uploaded": [], "uploaded_bytes": 0}
+        try:
+            for layer, (digest, entries) in self.layer_digests(model_dir).items():
+                if not entries:
+                    result[layer] = result[f"{layer}_digest"] = None
+                    continue
+                uri = self.layer_uri(layer, digest)
+                result[layer] = uri
+                result[f"{layer}_digest"] = digest
+                if self.exists(layer, digest, verify):
+                    print(f"{layer}: unchanged, using {uri}")
+                    continue
+                print(f"{layer}: uploading {len(entries)} files to {uri}")
+                upload = self._upload_code if layer == "code" else self._upload_weights
+                result["uploaded_bytes"] += upload(model_dir, uri, entries)
+                result["uploaded"].append(layer)
+                self.cache["layers"].append(uri)
+        finally:
+            self._save_cache()
+        result["seconds"] = time.perf_counter() - started
+        print(f"Published in {result['seconds']:.2f}s, uploaded {result['uploaded_bytes'] / MiB:.1f} MiB "
+              f"({', '.join(result['uploaded']) or 'nothing'})")
+        return result
+
+
+def container_definition(artifacts, image_uri, environment=None):
+    """`PrimaryContainer` for `create_model`: code as model data, weights as an extra channel."""
+    container = {"Image": image_uri, "Environment": dict(environment or {})}
+    if artifacts.get("code"):
+        container["ModelDataUrl"] = artifacts["code"]
+    if artifacts.get("weights"):
+        container["AdditionalModelDataSources"] = [{
+            "ChannelName": WEIGHTS_CHANNEL,
+            "S3DataSource": {
+                "S3Uri": artifacts["weights"],
+                "S3DataType": "S3Prefix",
+                "CompressionType": "None",
+            },
+        }]
+    return container
+
+
+def model_name(base_name, artifacts, container, role):
+    """Deterministic model name: the same code, weights, container (image and environment) and role map to
+    the same SageMaker model, and changing any of them creates a new one."""
+    config = json.dumps({"container": container, "role": role}, sort_keys=True)
+    digests = [artifacts["code_digest"], artifacts["weights_digest"], hashlib.sha256(config.encode()).hexdigest()]
+    suffix = "".join(f"-{(digest or 'none')[:8]}" for digest in digests)
+    return base_name[:63 - len(suffix)].rstrip("-") + suffix
+
+
+def create_model_if_missing(sm_client, base_name, role, artifacts, image_uri, environment=None):
+    """Create the SageMaker model for these artifacts unless it already exists; returns its name."""
+    container = container_definition(artifacts, image_uri, environment)
+    name = model_name(base_name, artifacts, container, role)
+    try:
+        sm_client.describe_model(ModelName=name)
+        print(f"Model {name} already exists")
+        return name
+    except ClientError as e:
+        if "Could not find model" not in str(e):
+            raise
+    sm_client.create_model(
+        ModelName=name,
+        ExecutionRoleArn=role,
+        PrimaryContainer=container,
+    )
+    print(f"Created model {name}")
+    return name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish a model directory as content-addressed S3 layers.")
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX)
+    parser.add_argument("--verify", action="store_true", help="Check S3 even for layers in the local cache")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--endpoint-url", default=os.environ.get("S3_ENDPOINT_URL"), help="e.g. a moto server")
+    parser.add_argument("--region", default=None)
+    args = parser.parse_args()
+
+    store = ArtifactStore(make_s3_client(args.endpoint_url, args.region, args.workers), args.bucket, args.prefix,
+                          workers=args.workers)
+    print(json.dumps(store.publish(args.model_dir, verify=args.verify), indent=2))
@@ -0,0 +1,263 @@
+# %% [markdown]
+# ## Dynamic-Batching Inference Handler (Custom Container)
+# Drop-in `inference.py` for `notebooks/04_deploy_model_custom_container.ipynb`.
+#
+# Instead of running one `generate` per `predict_fn` call, every prompt is put on
+# a thread-safe queue and a background loop gathers concurrent requests into
+# one batch (up to `MAX_BATCH_SIZE` prompts / `MAX_BATCH_TOKENS` tokens, waiting
+# at most `MAX_BATCH_WAIT_MS` for stragglers), left-pads them, generates in a
+# single pass and hands each caller its own slice of the output.
+# A batch only holds requests with the same generation parameters (including
+# `max_new_tokens`), so short requests never wait for a longer one, and requests
+# whose caller gave up or that outlived `REQUEST_TIMEOUT_SECONDS` are dropped
+# before generation.
+# The model is warmed up at load time so the first real request doesn't pay for
+# allocator growth and kernel selection.
+#
+# All limits can be set through the model's environment variables.
+
+# %%
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+# --- Configuration ---
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "8"))
+MAX_BATCH_TOKENS = int(os.environ.get("MAX_BATCH_TOKENS", "8192"))  # Padded prompt + new tokens per batch
+MAX_BATCH_WAIT_MS = float(os.environ.get("MAX_BATCH_WAIT_MS", "10"))
+MAX_INPUT_TOKENS = int(os.environ.get("MAX_INPUT_TOKENS", "512"))
+DEFAULT_MAX_NEW_TOKENS = int(os.environ.get("DEFAULT_MAX_NEW_TOKENS", "64"))
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("REQUEST_TIMEOUT_SECONDS", "120"))
+WARMUP = os.environ.get("WARMUP", "true").lower() == "true"
+# Weights published as a separate layer (content_addressed_artifacts.py) are mounted here
+WEIGHTS_DIR = os.environ.get("MODEL_WEIGHTS_DIR", "/opt/ml/additional-model-data-sources/weights")
+
+# Sampling parameters that must match (with max_new_tokens) for requests to share a batch
+SAMPLING_KEYS = ("do_sample", "temperature", "top_p", "top_k", "repetition_penalty")
+
+
+class GenerationRequest:
+    __slots__ = ("input_ids", "max_new_tokens", "sampling", "deadline", "future")
+
+    def __init__(self, input_ids, max_new_tokens, sampling, timeout=REQUEST_TIMEOUT_SECONDS):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.sampling = sampling
+        self.deadline = time.monotonic() + timeout
+        self.future = Future()
+
+    @property
+    def params(self):
+        return self.max_new_tokens, self.sampling
+
+    def alive(self):
+        return not self.future.cancelled() and time.monotonic() < self.deadline
+
+    def claim(self):
+        """Mark the request running; False if it was cancelled or expired and must not be generated."""
+        if time.monotonic() >= self.deadline:
+            self.future.cancel()
+        return self.future.set_running_or_notify_cancel()
+
+
+class DynamicBatcher:
+    """Background loop that coalesces concurrent generation requests into batches."""
+
+    def __init__(self, model, tokenizer, max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS,
+                 max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = next(model.parameters()).device
+        self.batches = 0
+        self.requests = 0
+        self.dropped = 0  # Cancelled or expired before generation
+        self._queue = queue.Queue()
+        self._deferred = deque()  # Requests that didn't fit the previous batch; only touched by the loop
+        self._thread = threading.Thread(target=self._loop, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, parameters=None, timeout=REQUEST_TIMEOUT_SECONDS):
+        """Queue a prompt; returns a Future resolving to the generated text (cancel it to withdraw the prompt)."""
+        parameters = dict(parameters or {})
+        input_ids = self.tokenizer(prompt, truncation=True, max_length=MAX_INPUT_TOKENS)["input_ids"]
+        max_new_tokens = int(parameters.pop("max_new_tokens", DEFAULT_MAX_NEW_TOKENS))
+        if "do_sample" not in parameters and ("temperature" in parameters or "top_p" in parameters):
+            parameters["do_sample"] = parameters.get("temperature", 1.0) > 0
+        sampling = tuple((key, parameters[key]) for key in SAMPLING_KEYS if key in parameters)
+        request = GenerationRequest(input_ids, max_new_tokens, sampling, timeout)
+        self._queue.put(request)
+        return request.future
+
+    @staticmethod
+    def _batch_tokens(batch):
+        # Left padding makes every row as long as the longest prompt
+        longest = max(len(r.input_ids) for r in batch)
+        return len(batch) * (longest + batch[0].max_new_tokens)
+
+    def _next(self, timeout):
+        while True:
+            if self._deferred:
+                request = self._deferred.popleft()
+            else:
+                request = self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+            if request.alive():
+                return request
+            self._drop(request)
+
+    def _drop(self, request):
+        request.future.cancel()
+        self.dropped += 1
+
+    def _collect(self):
+        batch = [self._next(None)]
+        skipped = []
+        gather_until = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = gather_until - time.monotonic()
+            if remaining <= 0 and not self._deferred:
+                break
+            try:
+                request = self._next(max(0.0, remaining))
+            except queue.Empty:
+                break
+            if request.params != batch[0].params or self._batch_tokens(batch + [request]) > self.max_batch_tokens:
+                skipped.append(request)
+                continue
+            batch.append(request)
+        # Skipped requests go first next round, in arrival order
+        self._deferred.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self, batch):
+        # Last chance to skip work nobody waits for; claimed requests can no longer be cancelled
+        claimed = [r for r in batch if r.claim()]
+        self.dropped += len(batch) - len(claimed)
+        batch[:] = claimed
+        if not batch:
+            return
+        padded = self.tokenizer.pad({"input_ids": [r.input_ids for r in batch]}, padding=True, return_tensors="pt")
+        padded = {k: v.to(self.device) for k, v in padded.items()}
+        with torch.inference_mode():
+            output = self.model.generate(
+                **padded,
+                max_new_tokens=batch[0].max_new_tokens,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **dict(batch[0].sampling),
+            )
+        new_tokens = output[:, padded["input_ids"].shape[1]:]
+        for request, tokens in zip(batch, new_tokens):
+            request.future.set_result(self.tokenizer.decode(tokens, skip_special_tokens=True))
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run(batch)
+            except Exception as e:
+                print(f"Error in batch of {len(batch)}: {e}")
+                print(traceback.format_exc())
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            if batch:
+                self.batches += 1
+                self.requests += len(batch)
+
+
+def warmup(batcher):
+    """Run the batch shapes we expect before taking traffic."""
+    started = time.monotonic()
+    short = "Hello"
+    long = " ".join(["warmup"] * (MAX_INPUT_TOKENS // 2))
+    for size in sorted({1, max(1, batcher.max_batch_size // 2), batcher.max_batch_size}):
+        for prompt in (short, long):
+            futures = [batcher.submit(prompt, {"max_new_tokens": 8}) for _ in range(size)]
+            for future in futures:
+                future.result(timeout=REQUEST_TIMEOUT_SECONDS)
+    print(f"Warmup finished in {time.monotonic() - started:.2f}s")
+
+
+def load_tokenizer(tokenizer):
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def model_fn(model_dir):
+    """Load the model for inference"""
+    try:
+        print("Loading model and tokenizer...")
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        weights_dir = WEIGHTS_DIR if os.path.isdir(WEIGHTS_DIR) else model_dir
+        model = AutoModelForCausalLM.from_pretrained(weights_dir, torch_dtype="auto").to(device).eval()
+        tokenizer = load_tokenizer(AutoTokenizer.from_pretrained(weights_dir))
+
+        batcher = DynamicBatcher(model, tokenizer)
+        if WARMUP:
+            warmup(batcher)
+        print(f"Model and tokenizer loaded successfully on {device}! "
+              f"(max batch {MAX_BATCH_SIZE}, max batch tokens {MAX_BATCH_TOKENS}, wait {MAX_BATCH_WAIT_MS}ms)")
+        return {"model": model, "tokenizer": tokenizer, "batcher": batcher}
+    except Exception as e:
+        print(f"Error in model_fn: {e}")
+        print(traceback.format_exc())
+        raise
+
+
+def input_fn(request_body, request_content_type):
+    """Parse input data"""
+    if request_content_type == 'application/json':
+        input_data = json.loads(request_body)
+        if isinstance(input_data, dict) and 'inputs' in input_data:
+            return {"inputs": input_data['inputs'], "parameters": input_data.get('parameters', {})}
+        return {"inputs": input_data, "parameters": {}}
+    if isinstance(request_body, (bytes, bytearray)):
+        request_body = request_body.decode("utf-8")
+    return {"inputs": request_body, "parameters": {}}
+
+
+def predict_fn(input_data, model_artifacts):
+    """Make predictions"""
+    try:
+        batcher = model_artifacts["batcher"]
+        prompts = input_data["inputs"]
+        if isinstance(prompts, str):
+            prompts = [prompts]
+
+        # Every prompt joins the shared queue, so it can batch with other callers' prompts
+        futures = [batcher.submit(prompt, input_data["parameters"]) for prompt in prompts]
+        deadline = time.monotonic() + REQUEST_TIMEOUT_SECONDS
+        try:
+            return [{"generated_text": f.result(timeout=max(0.0, deadline - time.monotonic()))} for f in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()  # Not generated unless already running
+            raise
+    except Exception as e:
+        print(f"Error in predict_fn: {e}")
+        print(traceback.format_exc())
+        return {"error": str(e)}
+
+
+def output_fn(prediction, content_type):
+    """Format output"""
+    try:
+        if content_type == 'application/json':
+            return json.dumps(prediction)
+        else:
+            return str(prediction)
+    except Exception as e:
+        print(f"Error in output_fn: {e}")
+        return json.dumps({"error": str(e)})
@@ -19,6 +19,7 @@ from sagemaker.session import Session
 PROFILE_NAME = os.environ.get('AWS_PROFILE', 'default')
 ROLE_ARN = os.environ.get('SAGEMAKER_ROLE_ARN')  # Required: Your SageMaker execution role ARN
 HF_TOKEN = os.environ.get("HF_TOKEN")  # Required for gated models
+ENABLE_AUTOSCALING = os.environ.get("ENABLE_AUTOSCALING", "false").lower() == "true"  # See endpoint_autoscaling.py
 
 # --- Session Initialization ---
 
@@ -36,6 +37,11 @@ print(f"SageMaker Execution Role: {role}")
 
 # %%
 from sagemaker.huggingface import HuggingFaceModel, get_huggingface_llm_image_uri
+from endpoint_autoscaling import ScalingPolicy, apply_from_env, remove_scaling_policy
+from tgi_serving_params import fit_max_new_tokens, load_model_config, plan_serving_params, print_plan, serving_env
+from endpoint_warmup import warmup_from_env
+from async_inference import (ASYNC_S3_BUCKET, ENABLE_ASYNC_INFERENCE, COMPLETED, AsyncInferenceClient,
+                             async_inference_config, generated_text)
 
 # --- Model Configuration ---
 
@@ -43,7 +49,11 @@ from sagemaker.huggingface import HuggingFaceModel, get_huggingface_llm_image_ur
 MODEL_ID = 'deepseek-ai/DeepSeek-R1-Distill-Llama-8B'
 TASK = 'text-generation'
 INSTANCE_TYPE = "ml.g5.2xlarge" # 1x A10G GPU (24GB VRAM) - Supports BF16 and sufficient for 8B model
-
+# Start at the autoscaling floor (1 unless AUTOSCALING_MIN_CAPACITY is set)
+scaling_policy = ScalingPolicy.from_env()
+# Token limits sized from the model config and the instance's GPU memory (see tgi_serving_params.py)
+serving_plan = plan_serving_params(load_model_config(MODEL_ID, HF_TOKEN), INSTANCE_TYPE)
+print_plan(serving_plan)
 
 hub = {
     'HF_MODEL_ID': MODEL_ID, 
@@ -51,8 +61,9 @@ hub = {
     # Pass the token to the container only if needed for private models
     'HF_TOKEN': HF_TOKEN,
     'HF_MODEL_DEVICE_MAP': 'auto', # Distribute model across all available GPUs
-    'SM_NUM_GPUS': '1', # Explicitly set number of GPUs for the container
-    'HF_TRUST_REMOTE_CODE': 'True' # Allow custom model architectures 
+    'HF_TRUST_REMOTE_CODE': 'True', # Allow custom model architectures 
+    # SM_NUM_GPUS (every GPU on the instance) and TGI token limits
+    **serving_env(serving_plan),
 }
 
 # --- Create HuggingFaceModel Object ---
@@ -70,14 +81,32 @@ huggingface_model = HuggingFaceModel(
 
 print(f"Starting deployment of {MODEL_ID} to endpoint...")
 
+# Asynchronous inference (ENABLE_ASYNC_INFERENCE=true): requests and results go through S3, so long
+# R1 reasoning runs aren't cut off by the real-time invocation timeout
+async_bucket = (ASYNC_S3_BUCKET or sess.default_bucket()) if ENABLE_ASYNC_INFERENCE else None
+async_config = async_inference_config(async_bucket) if ENABLE_ASYNC_INFERENCE else None
+
 predictor = huggingface_model.deploy(
-    initial_instance_count=1,
+    initial_instance_count=scaling_policy.min_capacity,
     instance_type=INSTANCE_TYPE,
-    container_startup_health_check_timeout=300
+    container_startup_health_check_timeout=300,
+    async_inference_config=async_config,
 )
 
 print(f"Deployment complete. Endpoint Name: {predictor.endpoint_name}")
 
+# --- Autoscaling (Optional) ---
+# Target tracking, step scaling, cooldowns and scheduled floors from AUTOSCALING_* variables
+apply_from_env(predictor.endpoint_name, boto_session)
+
+# --- Warmup (Readiness Gate) ---
+# Absorb CUDA graph capture and allocator growth before real traffic (ENABLE_WARMUP=false to skip).
+# Async endpoints only accept InvokeEndpointAsync, so they skip the real-time warmup.
+if not ENABLE_ASYNC_INFERENCE:
+    warmup = warmup_from_env(predictor.endpoint_name, boto_session, max_input_tokens=serving_plan["max_input_tokens"])
+    if warmup and not warmup["ready"]:
+        print("Warning: latency had not stabilized; the first requests may still be slow.")
+
 # %%
 # --- Inference Test Data ---
 data = {
@@ -86,7 +115,16 @@ data = {
 
 # --- Invoke the Endpoint ---
 print("Invoking the endpoint...")
-response = predictor.predict(data)
+if ENABLE_ASYNC_INFERENCE:
+    # Let the model reason for as long as MAX_TOTAL_TOKENS allows after the prompt
+    data["parameters"] = {"max_new_tokens": fit_max_new_tokens(serving_plan, data["inputs"],
+                                                               serving_plan["max_total_tokens"])}
+    async_client = AsyncInferenceClient(boto_session.client("sagemaker-runtime"), boto_session.client("s3"),
+                                        predictor.endpoint_name, async_bucket)
+    job = async_client.run_batch([data], timeout=3600)[0]
+    response = [{"generated_text": generated_text(job) if job.status == COMPLETED else f"Failed: {job.error}"}]
+else:
+    response = predictor.predict(data)
 
 # --- Print Results ---
 print("\n--- Prediction Response ---")
@@ -98,6 +136,12 @@ print("---------------------------\n")
 # %%
 # --- Delete the Endpoint ---
 print(f"Deleting endpoint: {predictor.endpoint_name}...")
+if ENABLE_AUTOSCALING:
+    try:
+        remove_scaling_policy(predictor.endpoint_name, boto_session.client("application-autoscaling"),
+                              boto_session.client("cloudwatch"), boto_session.client("sagemaker"))
+    except Exception as e:
+        print(f"Could not remove autoscaling: {e}")
 predictor.delete_endpoint()
 print("Endpoint deleted successfully.")
 
@@ -14,10 +14,12 @@
 import sagemaker
 import boto3
 import os
-import json
 # --- FIX --- Import Session specifically from sagemaker.session
 from sagemaker.session import Session 
 from sagemaker.huggingface import HuggingFaceModel, get_huggingface_llm_image_uri, HuggingFacePredictor
+from endpoint_autoscaling import ScalingPolicy, apply_from_env, remove_scaling_policy
+from tgi_serving_params import load_model_config, plan_serving_params, print_plan, serving_env
+from endpoint_warmup import warmup_from_env
 
 
 # --- Configuration Section ---
@@ -25,6 +27,7 @@ from sagemaker.huggingface import HuggingFaceModel, get_huggingface_llm_image_ur
 PROFILE_NAME = os.environ.get('AWS_PROFILE', 'default')
 ROLE_ARN = os.environ.get('SAGEMAKER_ROLE_ARN')  # Required: Your SageMaker execution role ARN
 HF_TOKEN = os.environ.get("HF_TOKEN")  # Required for gated models like Gemma
+ENABLE_AUTOSCALING = os.environ.get("ENABLE_AUTOSCALING", "false").lower() == "true"  # See endpoint_autoscaling.py
 
 # --- Session Initialization ---
 
@@ -58,20 +61,24 @@ MODEL_ID = 'google/gemma-7b'
 # Using ml.g5.12xlarge (4 GPUs) as per snippet request. 
 # Note: ml.g5.2xlarge (1 GPU) is also sufficient for 7B models if cost is a concern.
 INSTANCE_TYPE = "ml.g5.2xlarge" 
-NUM_GPUS = 1
 ENDPOINT_NAME = 'gemma-7b-inference-optimized-1'
+# Start at the autoscaling floor (1 unless AUTOSCALING_MIN_CAPACITY is set)
+scaling_policy = ScalingPolicy.from_env()
+
+# Token limits sized from the model config and the instance's GPU memory (see tgi_serving_params.py).
+# Gemma's 256k vocabulary (1 MB of float32 logits per prefill token) and 448 KiB/token KV cache keep
+# them at 1024/1024/2048 on ml.g5.2xlarge (24GB VRAM).
+serving_plan = plan_serving_params(load_model_config(MODEL_ID, HF_TOKEN), INSTANCE_TYPE)
+print_plan(serving_plan)
 
 hub = {
     'HF_MODEL_ID': MODEL_ID,
-    'SM_NUM_GPUS': json.dumps(NUM_GPUS),
     'HF_TOKEN': HF_TOKEN,
     'HF_TASK': 'text-generation',
     'HF_MODEL_DEVICE_MAP': 'auto',
     'HF_TRUST_REMOTE_CODE': 'True',
-    # Reduce token limits to avoid OOM on ml.g5.2xlarge (24GB VRAM) due to large vocab (256k)
-    'MAX_BATCH_PREFILL_TOKENS': '1024',
-    'MAX_INPUT_TOKENS': '1024',
-    'MAX_TOTAL_TOKENS': '2048'
+    # SM_NUM_GPUS, MAX_INPUT_TOKENS, MAX_TOTAL_TOKENS, MAX_BATCH_PREFILL_TOKENS, CUDA_MEMORY_FRACTION
+    **serving_env(serving_plan),
 }
 
 # --- Create HuggingFaceModel Object ---
@@ -110,13 +117,23 @@ if endpoint_exists:
 else:
     print(f"Starting deployment of {MODEL_ID} to endpoint: {ENDPOINT_NAME}...")
     predictor = huggingface_model.deploy(
-        initial_instance_count=1,
+        initial_instance_count=scaling_policy.min_capacity,
         instance_type=INSTANCE_TYPE,
         container_startup_health_check_timeout=3600,
         endpoint_name=ENDPOINT_NAME
     )
     print(f"Deployment complete. Endpoint Name: {predictor.endpoint_name}")
 
+# --- Autoscaling (Optional) ---
+# Target tracking, step scaling, cooldowns and scheduled floors from AUTOSCALING_* variables
+apply_from_env(ENDPOINT_NAME, boto_session)
+
+# --- Warmup (Readiness Gate) ---
+# Absorb CUDA graph capture and allocator growth before real traffic (ENABLE_WARMUP=false to skip)
+warmup = warmup_from_env(ENDPOINT_NAME, boto_session, max_input_tokens=serving_plan["max_input_tokens"])
+if warmup and not warmup["ready"]:
+    print("Warning: latency had not stabilized; the first requests may still be slow.")
+
 ########################################################################
 
 # %%
@@ -153,5 +170,11 @@ except Exception as e:
 # --- Delete the Endpoint (Optional) ---
 # Uncomment the following lines to delete the endpoint after testing
 print(f"Deleting endpoint: {predictor.endpoint_name}...")
+if ENABLE_AUTOSCALING:
+    try:
+        remove_scaling_policy(predictor.endpoint_name, boto_session.client("application-autoscaling"),
+                              boto_session.client("cloudwatch"), boto_session.client("sagemaker"))
+    except Exception as e:
+        print(f"Could not remove autoscaling: {e}")
 predictor.delete_endpoint()
 print("Endpoint deleted successfully.")
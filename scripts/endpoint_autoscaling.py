@@ -0,0 +1,585 @@
+# %% [markdown]
+# ## Endpoint Autoscaling
+# Registers an endpoint variant with Application Auto Scaling and attaches:
+# - **target tracking** on `InvocationsPerInstance` or on concurrent requests per model
+# - optional **step scaling** driven by a CloudWatch alarm (e.g. on `ModelLatency`)
+# - **cooldowns** for scale-in and scale-out
+# - **scheduled floors**: cron actions that raise or lower the minimum instance count
+#
+# The same `ScalingPolicy` can be replayed against a traffic trace offline with
+# `simulate()`, to predict instance counts and queueing delay before applying it:
+#
+#     python endpoint_autoscaling.py simulate --instance-rps 1.5 --target-value 60
+#     python endpoint_autoscaling.py apply --endpoint-name my-endpoint --dry-run
+#     python endpoint_autoscaling.py remove --endpoint-name my-endpoint
+#     python endpoint_autoscaling.py check   # apply/remove against botocore's Stubber
+#
+# Deploy scripts read the policy from the environment (`ScalingPolicy.from_env()`)
+# when `ENABLE_AUTOSCALING=true`.
+
+# %%
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import random
+from collections import deque
+
+# --- Configuration ---
+SCALABLE_DIMENSION = "sagemaker:variant:DesiredInstanceCount"
+TARGET_METRICS = {
+    # name: (predefined metric type, simulator metric)
+    "invocations": ("SageMakerVariantInvocationsPerInstance", "InvocationsPerInstance"),
+    "concurrency": ("SageMakerVariantConcurrentRequestsPerModelHighResolution", "ConcurrentRequestsPerModel"),
+}
+# Target tracking alarms: scale out after 3 high minutes, in after 15 minutes below 90% of target
+SCALE_OUT_DATAPOINTS = 3
+SCALE_IN_DATAPOINTS = 15
+SCALE_IN_RATIO = 0.9
+CRON_DAYS = {"SUN": 1, "MON": 2, "TUE": 3, "WED": 4, "THU": 5, "FRI": 6, "SAT": 7}
+
+
+class ScalingPolicy:
+    """Autoscaling settings for one endpoint variant."""
+
+    def __init__(self, min_capacity=1, max_capacity=4, target_metric="invocations", target_value=None,
+                 scale_in_cooldown=600, scale_out_cooldown=120, step_metric=None, step_threshold=None,
+                 step_adjustments=(), step_cooldown=120, step_evaluation_periods=1, scheduled_floors=()):
+        if target_metric not in TARGET_METRICS:
+            raise ValueError(f"target_metric must be one of {sorted(TARGET_METRICS)}")
+        if min_capacity > max_capacity:
+            raise ValueError("min_capacity cannot exceed max_capacity")
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        self.target_metric = target_metric
+        self.target_value = target_value  # None disables target tracking
+        self.scale_in_cooldown = scale_in_cooldown
+        self.scale_out_cooldown = scale_out_cooldown
+        self.step_metric = step_metric  # CloudWatch metric name in AWS/SageMaker, e.g. "ModelLatency"
+        self.step_threshold = step_threshold
+        # (lower, upper, adjustment) with bounds relative to the threshold; None means unbounded
+        self.step_adjustments = [tuple(step) for step in step_adjustments]
+        self.step_cooldown = step_cooldown
+        self.step_evaluation_periods = step_evaluation_periods
+        # (name, "cron(minute hour day-of-month month day-of-week year)", min capacity)
+        self.scheduled_floors = [tuple(floor) for floor in scheduled_floors]
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """Build a policy from AUTOSCALING_* environment variables."""
+        step = json.loads(os.environ.get("AUTOSCALING_STEP_SCALING", "{}"))
+        settings = {
+            "min_capacity": int(os.environ.get("AUTOSCALING_MIN_CAPACITY", "1")),
+            "max_capacity": int(os.environ.get("AUTOSCALING_MAX_CAPACITY", "4")),
+            "target_metric": os.environ.get("AUTOSCALING_TARGET_METRIC", "invocations"),
+            "target_value": float(os.environ["AUTOSCALING_TARGET_VALUE"]) if os.environ.get("AUTOSCALING_TARGET_VALUE") else None,
+            "scale_in_cooldown": int(os.environ.get("AUTOSCALING_SCALE_IN_COOLDOWN", "600")),
+            "scale_out_cooldown": int(os.environ.get("AUTOSCALING_SCALE_OUT_COOLDOWN", "120")),
+            "step_metric": step.get("metric"),
+            "step_threshold": step.get("threshold"),
+            "step_adjustments": step.get("steps", ()),
+            "step_cooldown": step.get("cooldown", 120),
+            "step_evaluation_periods": step.get("evaluation_periods", 1),
+            # e.g. [["weekday-floor", "cron(0 8 ? * MON-FRI *)", 2], ["night", "cron(0 20 ? * * *)", 1]]
+            "scheduled_floors": json.loads(os.environ.get("AUTOSCALING_SCHEDULED_FLOORS", "[]")),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def describe(self):
+        parts = [f"{self.min_capacity}-{self.max_capacity} instances"]
+        if self.target_value is not None:
+            parts.append(f"target {self.target_metric}={self.target_value:g}")
+        if self.step_metric:
+            parts.append(f"step on {self.step_metric}>{self.step_threshold:g}")
+        if self.scheduled_floors:
+            parts.append(f"{len(self.scheduled_floors)} scheduled floors")
+        return ", ".join(parts)
+
+
+# --- Provisioning ---
+
+def _step_groups(policy):
+    """Split step adjustments into a scale-out (above threshold) and a scale-in (below) group."""
+    out = [s for s in policy.step_adjustments if s[2] > 0]
+    scale_in = [s for s in policy.step_adjustments if s[2] < 0]
+    return [("scale-out", "GreaterThanOrEqualToThreshold", out), ("scale-in", "LessThanThreshold", scale_in)]
+
+
+def _step_policy_name(endpoint_name, direction):
+    # Also the name of the CloudWatch alarm that triggers the policy
+    return f"{endpoint_name}-step-{direction}"
+
+
+def _scalable_target(endpoint_name, sagemaker_client=None, variant_name=None):
+    if variant_name is None:
+        variants = sagemaker_client.describe_endpoint(EndpointName=endpoint_name)["ProductionVariants"]
+        variant_name = variants[0]["VariantName"]
+    return variant_name, {"ServiceNamespace": "sagemaker", "ScalableDimension": SCALABLE_DIMENSION,
+                          "ResourceId": f"endpoint/{endpoint_name}/variant/{variant_name}"}
+
+
+def _step_configuration(steps, cooldown):
+    adjustments = []
+    for lower, upper, adjustment in steps:
+        step = {"ScalingAdjustment": int(adjustment)}
+        if lower is not None:
+            step["MetricIntervalLowerBound"] = float(lower)
+        if upper is not None:
+            step["MetricIntervalUpperBound"] = float(upper)
+        adjustments.append(step)
+    return {"AdjustmentType": "ChangeInCapacity", "StepAdjustments": adjustments,
+            "Cooldown": int(cooldown), "MetricAggregationType": "Average"}
+
+
+def apply_scaling_policy(policy, endpoint_name, autoscaling_client, cloudwatch_client=None, sagemaker_client=None,
+                         variant_name=None):
+    """Register the variant as a scalable target and create its policies, alarms and scheduled actions.
+
+    Clients are passed in so they can be stubbed (e.g. `RecordingClient` or botocore's Stubber).
+    """
+    variant_name, target = _scalable_target(endpoint_name, sagemaker_client, variant_name)
+    resource_id = target["ResourceId"]
+
+    print(f"Registering {resource_id}: {policy.describe()}")
+    autoscaling_client.register_scalable_target(
+        MinCapacity=policy.min_capacity, MaxCapacity=policy.max_capacity, **target
+    )
+
+    if policy.target_value is not None:
+        predefined, _ = TARGET_METRICS[policy.target_metric]
+        autoscaling_client.put_scaling_policy(
+            PolicyName=f"{endpoint_name}-target-{policy.target_metric}",
+            PolicyType="TargetTrackingScaling",
+            TargetTrackingScalingPolicyConfiguration={
+                "TargetValue": float(policy.target_value),
+                "PredefinedMetricSpecification": {"PredefinedMetricType": predefined},
+                "ScaleInCooldown": int(policy.scale_in_cooldown),
+                "ScaleOutCooldown": int(policy.scale_out_cooldown),
+            },
+            **target,
+        )
+
+    if policy.step_metric:
+        for direction, comparison, steps in _step_groups(policy):
+            if not steps:
+                continue
+            policy_name = _step_policy_name(endpoint_name, direction)
+            response = autoscaling_client.put_scaling_policy(
+                PolicyName=policy_name,
+                PolicyType="StepScaling",
+                StepScalingPolicyConfiguration=_step_configuration(steps, policy.step_cooldown),
+                **target,
+            )
+            cloudwatch_client.put_metric_alarm(
+                AlarmName=policy_name,
+                Namespace="AWS/SageMaker",
+                MetricName=policy.step_metric,
+                Dimensions=[{"Name": "EndpointName", "Value": endpoint_name},
+                            {"Name": "VariantName", "Value": variant_name}],
+                Statistic="Average",
+                Period=60,
+                EvaluationPeriods=int(policy.step_evaluation_periods),
+                Threshold=float(policy.step_threshold),
+                ComparisonOperator=comparison,
+                AlarmActions=[response["PolicyARN"]],
+            )
+
+    for name, schedule, floor in policy.scheduled_floors:
+        autoscaling_client.put_scheduled_action(
+            ScheduledActionName=f"{endpoint_name}-{name}",
+            Schedule=schedule,
+            ScalableTargetAction={"MinCapacity": int(floor), "MaxCapacity": policy.max_capacity},
+            **target,
+        )
+    print("Autoscaling configured.")
+    return resource_id
+
+
+def remove_scaling_policy(endpoint_name, autoscaling_client, cloudwatch_client=None, sagemaker_client=None,
+                          variant_name=None):
+    """Delete the step-scaling alarms, then deregister the variant (which deletes its policies and scheduled actions).
+
+    The variant defaults to the endpoint's first one, as in `apply_scaling_policy`.
+    """
+    _, target = _scalable_target(endpoint_name, sagemaker_client, variant_name)
+    if cloudwatch_client is not None:
+        # DeleteAlarms fails on unknown names, so only delete the alarms that exist
+        names = [_step_policy_name(endpoint_name, direction) for direction in ("scale-out", "scale-in")]
+        existing = [alarm["AlarmName"] for alarm in cloudwatch_client.describe_alarms(AlarmNames=names)["MetricAlarms"]]
+        if existing:
+            cloudwatch_client.delete_alarms(AlarmNames=existing)
+            print(f"Deleted alarms: {', '.join(existing)}")
+    print(f"Deregistering {target['ResourceId']}")
+    autoscaling_client.deregister_scalable_target(**target)
+
+
+class RecordingClient:
+    """Stand-in for boto3 clients that prints each call instead of sending it."""
+
+    def __init__(self, service):
+        self.service = service
+        self.calls = []
+
+    def __getattr__(self, operation):
+        def call(**kwargs):
+            self.calls.append((operation, kwargs))
+            print(f"[dry-run] {self.service}.{operation}({json.dumps(kwargs, default=str)})")
+            if operation == "describe_endpoint":
+                return {"ProductionVariants": [{"VariantName": "AllTraffic"}]}
+            return {"PolicyARN": f"arn:aws:autoscaling:dry-run:{kwargs.get('PolicyName', '')}", "MetricAlarms": []}
+        return call
+
+
+def apply_from_env(endpoint_name, boto_session, variant_name=None):
+    """Used by the deploy scripts: apply `ScalingPolicy.from_env()` when ENABLE_AUTOSCALING=true."""
+    if os.environ.get("ENABLE_AUTOSCALING", "false").lower() != "true":
+        print("Autoscaling disabled (set ENABLE_AUTOSCALING=true to enable).")
+        return None
+    try:
+        return apply_scaling_policy(
+            ScalingPolicy.from_env(), endpoint_name,
+            boto_session.client("application-autoscaling"),
+            boto_session.client("cloudwatch"),
+            boto_session.client("sagemaker"),
+            variant_name,
+        )
+    except Exception as e:
+        print(f"Error configuring autoscaling for {endpoint_name}: {e}")
+        return None
+
+
+# --- Simulation ---
+
+def _cron_field(field, value, low, names=None):
+    if field in ("*", "?"):
+        return True
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if names:
+            for name, number in names.items():
+                part = part.replace(name, str(number))
+        if part == "*":
+            start, end = low, value if step == 1 else 10 ** 6
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-"))
+        else:
+            start = end = int(part)
+        if start <= value <= end and (value - start) % step == 0:
+            return True
+    return False
+
+
+def cron_matches(schedule, when):
+    """Whether an Application Auto Scaling `cron(...)` expression fires at minute `when`."""
+    fields = schedule.strip()[len("cron("):-1].split()
+    minute, hour, day, month, weekday = fields[:5]
+    cron_weekday = (when.weekday() + 1) % 7 + 1  # Python Monday=0 -> cron SUN=1 ... SAT=7
+    return (_cron_field(minute, when.minute, 0) and _cron_field(hour, when.hour, 0)
+            and _cron_field(day, when.day, 1) and _cron_field(month, when.month, 1)
+            and _cron_field(weekday, cron_weekday, 1, CRON_DAYS))
+
+
+def _floor_at(policy, when):
+    """Minimum capacity in effect at `when`: the most recent scheduled floor within the past week."""
+    minute = when.replace(second=0, microsecond=0)
+    for back in range(7 * 24 * 60):
+        at = minute - datetime.timedelta(minutes=back)
+        for _, schedule, floor in policy.scheduled_floors:
+            if cron_matches(schedule, at):
+                return int(floor)
+    return policy.min_capacity
+
+
+def simulate(policy, trace, instance_rps, service_seconds=2.0, provisioning_seconds=480, timeout_seconds=60.0,
+             start=None, initial_instances=None):
+    """Replay per-second request arrivals against `policy`.
+
+    Each instance serves `instance_rps` requests/s at `service_seconds` latency; extra
+    requests queue (FIFO, shared) and are dropped after `timeout_seconds`. New instances
+    take `provisioning_seconds` to come into service. Metrics are evaluated each minute
+    the way CloudWatch alarms would see them. Returns per-minute rows and a summary.
+    """
+    start = start or datetime.datetime(2025, 1, 6)  # A Monday, midnight
+    floor = _floor_at(policy, start) if policy.scheduled_floors else policy.min_capacity
+    in_service = initial_instances or max(floor, policy.min_capacity)
+    desired = in_service
+    pending = deque()  # Times at which provisioning instances come into service
+    backlog = 0.0
+    last_scale_out = last_scale_in = last_step = -math.inf
+    history = {name: deque(maxlen=SCALE_IN_DATAPOINTS) for name in ("target", "step")}
+    rows = []
+    minute = {"arrivals": 0.0, "served": 0.0, "dropped": 0.0, "delay": 0.0, "concurrency": 0.0}
+
+    for t, arrivals in enumerate(trace):
+        while pending and pending[0] <= t:
+            pending.popleft()
+            in_service += 1
+        capacity = in_service * instance_rps
+        served = min(backlog + arrivals, capacity)
+        backlog += arrivals - served
+        dropped = max(0.0, backlog - capacity * timeout_seconds)
+        backlog -= dropped
+        minute["arrivals"] += arrivals
+        minute["served"] += served
+        minute["dropped"] += dropped
+        minute["delay"] += backlog / capacity if capacity else timeout_seconds
+        minute["concurrency"] += (served * service_seconds + backlog) / max(in_service, 1)
+
+        if (t + 1) % 60:
+            continue
+
+        # --- Once a minute: publish metrics and evaluate policies ---
+        now = start + datetime.timedelta(seconds=t + 1)
+        metrics = {
+            "InvocationsPerInstance": minute["arrivals"] / max(in_service, 1),
+            "ConcurrentRequestsPerModel": minute["concurrency"] / 60,
+            "ModelLatency": (service_seconds + minute["delay"] / 60) * 1e6,  # microseconds, like CloudWatch
+        }
+        for _, schedule, scheduled_floor in policy.scheduled_floors:
+            if cron_matches(schedule, now.replace(second=0)):
+                floor = int(scheduled_floor)
+        new_desired = desired
+
+        if policy.target_value is not None:
+            value = metrics[TARGET_METRICS[policy.target_metric][1]]
+            history["target"].append(value)
+            recent = list(history["target"])
+            # Total load / target per instance (pending instances don't count twice)
+            wanted = math.ceil(in_service * value / policy.target_value) if value else floor
+            if (len(recent) >= SCALE_OUT_DATAPOINTS and min(recent[-SCALE_OUT_DATAPOINTS:]) > policy.target_value
+                    and t - last_scale_out >= policy.scale_out_cooldown and wanted > desired):
+                new_desired = wanted
+            elif (len(recent) >= SCALE_IN_DATAPOINTS and max(recent) < SCALE_IN_RATIO * policy.target_value
+                    and t - last_scale_in >= policy.scale_in_cooldown and wanted < desired):
+                new_desired = wanted
+
+        if policy.step_metric:
+            value = metrics[policy.step_metric]
+            history["step"].append(value)
+            recent = list(history["step"])[-policy.step_evaluation_periods:]
+            if len(recent) == policy.step_evaluation_periods and t - last_step >= policy.step_cooldown:
+                for direction, _, steps in _step_groups(policy):
+                    breached = (min(recent) >= policy.step_threshold if direction == "scale-out"
+                                else max(recent) < policy.step_threshold)
+                    if not breached:
+                        continue
+                    delta = value - policy.step_threshold
+                    for lower, upper, adjustment in steps:
+                        if (lower is None or delta >= lower) and (upper is None or delta < upper):
+                            new_desired = max(new_desired, desired + adjustment) if adjustment > 0 \
+                                else min(new_desired, desired + adjustment)
+                            last_step = t
+                            break
+
+        new_desired = max(floor, policy.min_capacity, min(policy.max_capacity, new_desired))
+        if new_desired > desired:
+            pending.extend([t + provisioning_seconds] * (new_desired - desired))
+            last_scale_out = t
+        elif new_desired < desired:
+            remove = desired - new_desired
+            while remove and pending:
+                pending.pop()
+                remove -= 1
+            in_service -= remove
+            last_scale_in = t
+        desired = new_desired
+
+        rows.append({
+            "minute": (t + 1) // 60,
+            "time": now.strftime("%a %H:%M"),
+            "requests": minute["arrivals"],
+            "in_service": in_service,
+            "desired": desired,
+            "queue_delay_seconds": minute["delay"] / 60,
+            "dropped": minute["dropped"],
+            **metrics,
+        })
+        minute = dict.fromkeys(minute, 0.0)
+
+    delays = sorted(row["queue_delay_seconds"] for row in rows)
+    total = sum(row["requests"] for row in rows) or 1.0
+    summary = {
+        "instance_hours": sum(row["in_service"] for row in rows) / 60,
+        "max_instances": max((row["desired"] for row in rows), default=0),
+        "queue_delay_p50": delays[len(delays) // 2] if delays else 0.0,
+        "queue_delay_p99": delays[min(len(delays) - 1, int(len(delays) * 0.99))] if delays else 0.0,
+        "dropped_fraction": sum(row["dropped"] for row in rows) / total,
+    }
+    return rows, summary
+
+
+def synthetic_trace(hours=24, base_rps=0.5, peak_rps=6.0, spike_rps=12.0, spike_at_hour=14.0, spike_minutes=20, seed=0):
+    """Per-second Poisson arrivals: quiet nights, a business-hours peak and one burst."""
+    rng = random.Random(seed)
+    trace = []
+    for second in range(int(hours * 3600)):
+        hour = (second / 3600) % 24
+        # Smooth day curve, highest mid-afternoon
+        rate = base_rps + (peak_rps - base_rps) * max(0.0, math.sin(math.pi * (hour - 7) / 13)) if 7 <= hour <= 20 else base_rps
+        if spike_at_hour * 3600 <= second < spike_at_hour * 3600 + spike_minutes * 60:
+            rate = spike_rps
+        # Poisson sample via exponential gaps
+        count, elapsed = 0, rng.expovariate(rate) if rate else 2.0
+        while elapsed < 1.0:
+            count += 1
+            elapsed += rng.expovariate(rate)
+        trace.append(count)
+    return trace
+
+
+def load_trace(path):
+    """CSV of `offset_seconds,requests` rows (header optional) -> per-second arrivals."""
+    counts = {}
+    with open(path) as f:
+        for row in csv.reader(f):
+            try:
+                second, requests = int(float(row[0])), float(row[1])
+            except (ValueError, IndexError):
+                continue  # Header or blank line
+            counts[second] = counts.get(second, 0.0) + requests
+    return [counts.get(second, 0.0) for second in range(max(counts, default=-1) + 1)]
+
+
+def print_simulation(label, rows, summary, every_minutes=60):
+    print(f"\n=== {label} ===")
+    print(f"{'time':>9} {'req/s':>6} {'instances':>9} {'desired':>7} {'queue s':>8} {'dropped':>8}")
+    for row in rows[every_minutes - 1::every_minutes]:
+        print(f"{row['time']:>9} {row['requests'] / 60:>6.2f} {row['in_service']:>9} {row['desired']:>7} "
+              f"{row['queue_delay_seconds']:>8.1f} {row['dropped']:>8.0f}")
+    print(f"Instance-hours {summary['instance_hours']:.1f}, peak {summary['max_instances']} instances, "
+          f"queue delay p50 {summary['queue_delay_p50']:.1f}s / p99 {summary['queue_delay_p99']:.1f}s, "
+          f"dropped {summary['dropped_fraction']:.1%}")
+
+
+# --- Check ---
+
+def check():
+    """apply/remove against botocore's Stubber (which validates every request), and the dry-run recorder."""
+    import boto3
+    from botocore.stub import ANY, Stubber
+
+    session = boto3.Session(region_name="us-east-1", aws_access_key_id="stub", aws_secret_access_key="stub")
+    autoscaling, cloudwatch, sagemaker = (session.client(name) for name in
+                                          ("application-autoscaling", "cloudwatch", "sagemaker"))
+    endpoint, variant = "my-endpoint", "blue"  # Not AllTraffic: the variant must come from the endpoint
+    target = {"ServiceNamespace": "sagemaker", "ResourceId": f"endpoint/{endpoint}/variant/{variant}",
+              "ScalableDimension": SCALABLE_DIMENSION}
+    policy = ScalingPolicy(min_capacity=1, max_capacity=4, target_value=60, step_metric="ModelLatency",
+                           step_threshold=10e6, step_adjustments=[(0, None, 2)],
+                           scheduled_floors=[("business-hours", "cron(30 6 ? * MON-FRI *)", 2)])
+    policy_arn = ("arn:aws:autoscaling:us-east-1:123456789012:scalingPolicy:0000:resource/sagemaker/"
+                  f"{target['ResourceId']}:policyName/{endpoint}-step-scale-out")
+    now = datetime.datetime(2026, 1, 1)
+    described = {"EndpointName": endpoint, "EndpointConfigName": endpoint,
+                 "EndpointArn": f"arn:aws:sagemaker:us-east-1:123456789012:endpoint/{endpoint}",
+                 "EndpointStatus": "InService", "CreationTime": now,
+                 "LastModifiedTime": now, "ProductionVariants": [{"VariantName": variant}]}
+    stubbers = [Stubber(client) for client in (autoscaling, cloudwatch, sagemaker)]
+    autoscaling_stub, cloudwatch_stub, sagemaker_stub = stubbers
+
+    # 1. Apply: target tracking, one step policy with its alarm, one scheduled floor
+    sagemaker_stub.add_response("describe_endpoint", described, {"EndpointName": endpoint})
+    autoscaling_stub.add_response("register_scalable_target", {}, dict(target, MinCapacity=1, MaxCapacity=4))
+    autoscaling_stub.add_response("put_scaling_policy", {"PolicyARN": policy_arn}, dict(
+        target, PolicyName=f"{endpoint}-target-invocations", PolicyType="TargetTrackingScaling",
+        TargetTrackingScalingPolicyConfiguration=ANY))
+    autoscaling_stub.add_response("put_scaling_policy", {"PolicyARN": policy_arn}, dict(
+        target, PolicyName=f"{endpoint}-step-scale-out", PolicyType="StepScaling",
+        StepScalingPolicyConfiguration=ANY))
+    cloudwatch_stub.add_response("put_metric_alarm", {}, {
+        "AlarmName": f"{endpoint}-step-scale-out", "Namespace": "AWS/SageMaker", "MetricName": "ModelLatency",
+        "Dimensions": [{"Name": "EndpointName", "Value": endpoint}, {"Name": "VariantName", "Value": variant}],
+        "Statistic": "Average", "Period": 60, "EvaluationPeriods": 1, "Threshold": 10e6,
+        "ComparisonOperator": "GreaterThanOrEqualToThreshold", "AlarmActions": [policy_arn]})
+    autoscaling_stub.add_response("put_scheduled_action", {}, dict(
+        target, ScheduledActionName=f"{endpoint}-business-hours", Schedule="cron(30 6 ? * MON-FRI *)",
+        ScalableTargetAction={"MinCapacity": 2, "MaxCapacity": 4}))
+
+    # 2. Remove: the existing alarm goes first, then the target with its policies and scheduled actions
+    sagemaker_stub.add_response("describe_endpoint", described, {"EndpointName": endpoint})
+    cloudwatch_stub.add_response(
+        "describe_alarms", {"MetricAlarms": [{"AlarmName": f"{endpoint}-step-scale-out"}]},
+        {"AlarmNames": [f"{endpoint}-step-scale-out", f"{endpoint}-step-scale-in"]})
+    cloudwatch_stub.add_response("delete_alarms", {}, {"AlarmNames": [f"{endpoint}-step-scale-out"]})
+    autoscaling_stub.add_response("deregister_scalable_target", {}, target)
+    with autoscaling_stub, cloudwatch_stub, sagemaker_stub:
+        assert apply_scaling_policy(policy, endpoint, autoscaling, cloudwatch, sagemaker) == target["ResourceId"]
+        remove_scaling_policy(endpoint, autoscaling, cloudwatch, sagemaker)
+        for stubber in stubbers:
+            stubber.assert_no_pending_responses()
+
+    # 3. Every alarm apply can create is looked up by remove (both step directions)
+    both = ScalingPolicy(step_metric="ModelLatency", step_threshold=10e6,
+                         step_adjustments=[(0, None, 2), (None, -5e6, -1)])
+    recorder = RecordingClient("cloudwatch")
+    apply_scaling_policy(both, endpoint, RecordingClient("application-autoscaling"), recorder, variant_name=variant)
+    remove_scaling_policy(endpoint, RecordingClient("application-autoscaling"), recorder, variant_name=variant)
+    created = {kwargs["AlarmName"] for operation, kwargs in recorder.calls if operation == "put_metric_alarm"}
+    looked_up = [kwargs["AlarmNames"] for operation, kwargs in recorder.calls if operation == "describe_alarms"]
+    assert len(created) == 2 and created == set(looked_up[0]), (created, looked_up)
+    print("\nAll autoscaling checks passed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision or simulate SageMaker endpoint autoscaling.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    apply_parser = commands.add_parser("apply", help="Apply ScalingPolicy.from_env() to an endpoint")
+    apply_parser.add_argument("--endpoint-name", required=True)
+    apply_parser.add_argument("--variant-name", default=None)
+    apply_parser.add_argument("--dry-run", action="store_true", help="Print the API calls without sending them")
+
+    remove_parser = commands.add_parser("remove", help="Delete the step-scaling alarms and deregister the variant")
+    remove_parser.add_argument("--endpoint-name", required=True)
+    remove_parser.add_argument("--variant-name", default=None)
+    remove_parser.add_argument("--dry-run", action="store_true", help="Print the API calls without sending them")
+
+    sim_parser = commands.add_parser("simulate", help="Replay a traffic trace against policies offline")
+    sim_parser.add_argument("--trace", default=None, help="CSV of offset_seconds,requests; default is synthetic")
+    sim_parser.add_argument("--hours", type=float, default=24.0, help="Length of the synthetic trace")
+    sim_parser.add_argument("--instance-rps", type=float, default=1.5, help="Requests/s one instance sustains")
+    sim_parser.add_argument("--service-seconds", type=float, default=2.0)
+    sim_parser.add_argument("--provisioning-seconds", type=float, default=480.0)
+    sim_parser.add_argument("--max-capacity", type=int, default=8)
+    sim_parser.add_argument("--target-value", type=float, default=None,
+                            help="Target for the env policy (default: 70%% of instance capacity per minute)")
+    commands.add_parser("check", help="Verify apply/remove against botocore's Stubber")
+    args = parser.parse_args()
+
+    if args.command in ("apply", "remove"):
+        import boto3
+
+        if args.dry_run:
+            clients = [RecordingClient(name) for name in ("application-autoscaling", "cloudwatch", "sagemaker")]
+        else:
+            session = boto3.Session()
+            clients = [session.client(name) for name in ("application-autoscaling", "cloudwatch", "sagemaker")]
+        if args.command == "apply":
+            apply_scaling_policy(ScalingPolicy.from_env(), args.endpoint_name, *clients, variant_name=args.variant_name)
+        else:
+            remove_scaling_policy(args.endpoint_name, *clients, variant_name=args.variant_name)
+    elif args.command == "check":
+        check()
+    else:
+        trace = load_trace(args.trace) if args.trace else synthetic_trace(hours=args.hours)
+        target = args.target_value or round(0.7 * args.instance_rps * 60)
+        env_policy = ScalingPolicy.from_env(target_value=target, max_capacity=args.max_capacity)
+        policies = [
+            ("fixed, 1 instance", ScalingPolicy(min_capacity=1, max_capacity=1)),
+            (f"target tracking ({env_policy.describe()})", env_policy),
+            ("target tracking + latency steps + weekday floor", ScalingPolicy.from_env(
+                target_value=target, max_capacity=args.max_capacity, step_metric="ModelLatency",
+                step_threshold=10e6, step_adjustments=[(0, 20e6, 2), (20e6, None, 4)],
+                scheduled_floors=[("business-hours", "cron(30 6 ? * MON-FRI *)", 3),
+                                  ("after-hours", "cron(0 19 ? * MON-FRI *)", env_policy.min_capacity)],
+            )),
+        ]
+        for label, policy in policies:
+            rows, summary = simulate(policy, trace, args.instance_rps, args.service_seconds, args.provisioning_seconds)
+            print_simulation(label, rows, summary)
@@ -0,0 +1,664 @@
+# %% [markdown]
+# ## Endpoint Inventory: Find Idle Endpoints Across Regions
+# Forgotten GPU endpoints keep billing by the instance-hour. This scans several
+# regions concurrently, describes every endpoint, and pulls its hourly
+# `Invocations` from CloudWatch with batched `GetMetricData` calls (up to 500
+# metrics per call instead of one `GetMetricStatistics` call per endpoint).
+# Endpoints older than the threshold with no invocations within it are idle.
+#
+# Actions on idle endpoints:
+# - `report` (default): print the inventory
+# - `scale-to-zero`, where SageMaker supports it:
+#   - inference-component endpoints whose managed instance scaling allows 0 instances:
+#     every component's copy count is set to 0, and a step-scaling policy on its
+#     `NoCapacityInvocationFailures` alarm adds a copy when a request finds none
+#   - async endpoints: the autoscaling floor and desired instance count are set to 0, and a
+#     step-scaling policy on the `HasBacklogWithoutCapacity` alarm adds an instance when requests queue up
+#   - other real-time endpoints can't hold zero instances and are left alone
+# - `delete`: write a JSON snapshot of the endpoint, its config, models, components
+#   and tags, then delete the endpoint (and its components). `restore` redeploys
+#   from the snapshot, recreating the config and models if they were removed too.
+#
+# The lookback is extended to cover `--idle-hours` if it is shorter, so an endpoint is
+# only called idle when its whole idle window was searched for invocations.
+#
+# Endpoints tagged `INVENTORY_KEEP_TAG` (default `keep-alive`) are never touched. Regions the
+# credentials can't use (opt-in regions that aren't enabled, denied access) are skipped.
+#
+#     python endpoint_inventory.py --regions us-east-1,ap-south-1 --idle-hours 24
+#     python endpoint_inventory.py --regions all --action delete --dry-run
+#     python endpoint_inventory.py restore endpoint-snapshots/us-east-1/my-endpoint-20260101T000000.json
+#     python endpoint_inventory.py check   # scan, act and restore against stubbed clients
+
+# %%
+import argparse
+import datetime
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from inference_components import describe_or_none, wait_for_status
+
+# --- Configuration ---
+REGIONS = os.environ.get("INVENTORY_REGIONS", "us-east-1,ap-south-1")
+IDLE_HOURS = float(os.environ.get("INVENTORY_IDLE_HOURS", "24"))
+LOOKBACK_DAYS = int(os.environ.get("INVENTORY_LOOKBACK_DAYS", "14"))  # How far back the last invocation is searched
+SNAPSHOT_DIR = os.environ.get("INVENTORY_SNAPSHOT_DIR", "endpoint-snapshots")
+KEEP_TAG = os.environ.get("INVENTORY_KEEP_TAG", "keep-alive")
+METRIC_PERIOD = 3600
+MAX_QUERIES_PER_CALL = 500  # GetMetricData limit
+ACTIONS = ("report", "scale-to-zero", "delete")
+BACKLOG_COOLDOWN = 300  # Seconds between backlog scale-outs of a zero-instance async endpoint
+NO_CAPACITY_COOLDOWN = 60  # Seconds between scale-outs of a zero-copy inference component
+VARIANT_DIMENSION = "sagemaker:variant:DesiredInstanceCount"
+COMPONENT_DIMENSION = "sagemaker:inference-component:DesiredCopyCount"
+# Errors of regions that are disabled for the account or the credentials can't access
+SKIPPED_REGION_ERRORS = ("UnrecognizedClientException", "InvalidClientTokenId", "AuthFailure", "OptInRequired",
+                         "AccessDeniedException")
+
+# Fields of the describe responses accepted by the matching create calls
+MODEL_FIELDS = ("ModelName", "PrimaryContainer", "Containers", "InferenceExecutionConfig", "ExecutionRoleArn",
+                "VpcConfig", "EnableNetworkIsolation")
+CONFIG_FIELDS = ("EndpointConfigName", "ProductionVariants", "DataCaptureConfig", "KmsKeyId", "AsyncInferenceConfig",
+                 "ExplainerConfig", "ShadowProductionVariants", "ExecutionRoleArn", "VpcConfig",
+                 "EnableNetworkIsolation")
+COMPONENT_SPEC_FIELDS = ("ModelName", "StartupParameters", "ComputeResourceRequirements", "BaseInferenceComponentName")
+
+
+def _pick(response, fields):
+    return {field: response[field] for field in fields if response.get(field) is not None}
+
+
+def _utc(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+# --- Scan ---
+
+def describe_region(region, sagemaker_client):
+    """One record per endpoint: variants, instance counts and the CloudWatch dimensions of its invocations."""
+    records = []
+    for page in sagemaker_client.get_paginator("list_endpoints").paginate():
+        for summary in page["Endpoints"]:
+            name = summary["EndpointName"]
+            endpoint = sagemaker_client.describe_endpoint(EndpointName=name)
+            config = sagemaker_client.describe_endpoint_config(EndpointConfigName=endpoint["EndpointConfigName"])
+            current = {v["VariantName"]: v for v in endpoint.get("ProductionVariants", [])}
+            variants, metrics = [], []
+            components = []
+            for variant in config["ProductionVariants"]:
+                summary_variant = current.get(variant["VariantName"], {})
+                variants.append({
+                    "name": variant["VariantName"],
+                    "instance_type": variant.get("InstanceType", "serverless"),
+                    "instances": summary_variant.get("CurrentInstanceCount", 0),
+                    "serverless": "ServerlessConfig" in variant,
+                    "min_instances": summary_variant.get("ManagedInstanceScaling", {}).get("MinInstanceCount"),
+                })
+                if "ModelName" in variant or "ServerlessConfig" in variant:
+                    metrics.append([{"Name": "EndpointName", "Value": name},
+                                    {"Name": "VariantName", "Value": variant["VariantName"]}])
+            if any("ModelName" not in v and "ServerlessConfig" not in v for v in config["ProductionVariants"]):
+                # Inference components report invocations per component
+                for component_page in sagemaker_client.get_paginator("list_inference_components").paginate(
+                        EndpointNameEquals=name, PaginationConfig={"PageSize": 100}):
+                    components += [c["InferenceComponentName"] for c in component_page["InferenceComponents"]]
+                metrics += [[{"Name": "InferenceComponentName", "Value": c}] for c in components]
+            records.append({
+                "region": region, "endpoint": name, "arn": endpoint["EndpointArn"],
+                "status": endpoint["EndpointStatus"], "created": _utc(endpoint["CreationTime"]),
+                "config": endpoint["EndpointConfigName"], "async": "AsyncInferenceConfig" in config,
+                "variants": variants, "components": components, "metrics": metrics,
+                "describe": {"endpoint": endpoint, "config": config},
+            })
+    return records
+
+
+def fetch_invocations(cloudwatch_client, records, now, lookback_days=LOOKBACK_DAYS, batch_size=MAX_QUERIES_PER_CALL):
+    """Sum of invocations and the last active hour per record, batching every metric into GetMetricData calls."""
+    queries, owners = [], {}
+    for record in records:
+        record["invocations"], record["last_invocation"] = 0, None
+        for dimensions in record["metrics"]:
+            query_id = f"q{len(queries)}"
+            owners[query_id] = record
+            queries.append({"Id": query_id, "ReturnData": True, "MetricStat": {
+                "Metric": {"Namespace": "AWS/SageMaker", "MetricName": "Invocations", "Dimensions": dimensions},
+                "Period": METRIC_PERIOD, "Stat": "Sum",
+            }})
+    calls = 0
+    for start in range(0, len(queries), batch_size):
+        kwargs = {"MetricDataQueries": queries[start:start + batch_size], "ScanBy": "TimestampDescending",
+                  "StartTime": now - datetime.timedelta(days=lookback_days), "EndTime": now}
+        while True:
+            response = cloudwatch_client.get_metric_data(**kwargs)
+            calls += 1
+            for result in response["MetricDataResults"]:
+                record = owners[result["Id"]]
+                for timestamp, value in zip(result["Timestamps"], result["Values"]):
+                    if value > 0:
+                        record["invocations"] += int(value)
+                        timestamp = _utc(timestamp)
+                        if record["last_invocation"] is None or timestamp > record["last_invocation"]:
+                            record["last_invocation"] = timestamp
+            if not response.get("NextToken"):
+                break
+            kwargs["NextToken"] = response["NextToken"]
+    return calls
+
+
+def classify(record, now, idle_hours=IDLE_HOURS, lookback_days=LOOKBACK_DAYS):
+    """Mark the record idle when it is in service, holds instances and had no invocations for `idle_hours`."""
+    if idle_hours > lookback_days * 24:
+        raise ValueError(f"idle_hours={idle_hours} exceeds the {lookback_days}-day lookback of the invocations")
+    since = record["last_invocation"] or max(record["created"], now - datetime.timedelta(days=lookback_days))
+    record["idle_hours"] = (now - since).total_seconds() / 3600
+    instances = sum(v["instances"] for v in record["variants"] if not v["serverless"])
+    record["instances"] = instances
+    record["idle_instance_hours"] = record["idle_hours"] * instances
+    record["idle"] = record["status"] == "InService" and instances > 0 and record["idle_hours"] >= idle_hours
+    return record
+
+
+def scan(regions, client_factory, idle_hours=IDLE_HOURS, lookback_days=LOOKBACK_DAYS, now=None,
+         batch_size=MAX_QUERIES_PER_CALL):
+    """Inventory of every endpoint in `regions`, scanned concurrently.
+
+    `client_factory(service, region)` returns a client, so the scan can run against stubs.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if idle_hours > lookback_days * 24:
+        # Otherwise idle time would be clipped to the lookback and no endpoint could reach the threshold
+        lookback_days = math.ceil(idle_hours / 24)
+        print(f"Lookback extended to {lookback_days} days to cover {idle_hours:.0f} idle hours")
+    # Clients are created up front: creating them is not thread-safe, using them is
+    clients = {region: (client_factory("sagemaker", region), client_factory("cloudwatch", region))
+               for region in regions}
+
+    def scan_region(region):
+        sagemaker_client, cloudwatch_client = clients[region]
+        try:
+            records = describe_region(region, sagemaker_client)
+        except EndpointConnectionError as e:
+            print(f"{region}: skipped ({e})")
+            return []
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in SKIPPED_REGION_ERRORS:
+                raise
+            print(f"{region}: skipped ({e.response['Error']['Code']})")
+            return []
+        calls = fetch_invocations(cloudwatch_client, records, now, lookback_days, batch_size)
+        print(f"{region}: {len(records)} endpoints, {sum(len(r['metrics']) for r in records)} metrics "
+              f"in {calls} GetMetricData call(s)")
+        return [classify(record, now, idle_hours, lookback_days) for record in records]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(regions))) as executor:
+        results = list(executor.map(scan_region, regions))
+    return [record for records in results for record in records]
+
+
+def print_inventory(records):
+    print(f"{'region':<15} {'endpoint':<40} {'status':<10} {'instances':<24} {'invocations':>11} "
+          f"{'idle h':>7} {'idle inst-h':>11}")
+    for r in sorted(records, key=lambda r: -r["idle_instance_hours"]):
+        instances = ", ".join(f"{v['instances']}x {v['instance_type']}" for v in r["variants"])
+        flag = " IDLE" if r["idle"] else ""
+        print(f"{r['region']:<15} {r['endpoint'][:40]:<40} {r['status']:<10} {instances[:24]:<24} "
+              f"{r['invocations']:>11} {r['idle_hours']:>7.0f} {r['idle_instance_hours']:>11.0f}{flag}")
+    idle = [r for r in records if r["idle"]]
+    print(f"{len(idle)} idle endpoint(s), {sum(r['idle_instance_hours'] for r in idle):.0f} idle instance-hours")
+
+
+# --- Actions ---
+
+def _backlog_policy_name(endpoint_name, variant_name):
+    # Also the name of the CloudWatch alarm that triggers the policy
+    return f"{endpoint_name}-{variant_name}-backlog-scale-out"
+
+
+def _no_capacity_policy_name(component_name):
+    # Also the name of the CloudWatch alarm that triggers the policy
+    return f"{component_name}-no-capacity-scale-out"
+
+
+def _scale_out_from_zero(autoscaling_client, cloudwatch_client, target, policy_name, default_max, cooldown, alarm):
+    """Lower the autoscaling floor of `target` to 0 and add one unit of capacity whenever `alarm` fires.
+
+    Target tracking can't scale out from zero, so a step policy does. `alarm` holds the metric
+    arguments of `put_metric_alarm`.
+    """
+    existing = autoscaling_client.describe_scalable_targets(
+        ServiceNamespace="sagemaker", ResourceIds=[target["ResourceId"]])["ScalableTargets"]
+    max_capacity = existing[0]["MaxCapacity"] if existing else max(1, default_max)
+    # Lower the floor first, or autoscaling would restore the capacity
+    autoscaling_client.register_scalable_target(MinCapacity=0, MaxCapacity=max_capacity, **target)
+    policy_arn = autoscaling_client.put_scaling_policy(
+        PolicyName=policy_name, PolicyType="StepScaling",
+        StepScalingPolicyConfiguration={
+            "AdjustmentType": "ChangeInCapacity", "Cooldown": cooldown, "MetricAggregationType": alarm["Statistic"],
+            "StepAdjustments": [{"MetricIntervalLowerBound": 0.0, "ScalingAdjustment": 1}]},
+        **target)["PolicyARN"]
+    cloudwatch_client.put_metric_alarm(AlarmName=policy_name, Namespace="AWS/SageMaker",
+                                       ComparisonOperator="GreaterThanOrEqualToThreshold",
+                                       TreatMissingData="missing", AlarmActions=[policy_arn], **alarm)
+
+
+def scale_to_zero(record, sagemaker_client, autoscaling_client, cloudwatch_client, dry_run=False):
+    """Scale an idle endpoint to zero instances where SageMaker supports it; returns what was done."""
+    if record["components"]:
+        if any(v["min_instances"] != 0 for v in record["variants"]):
+            return "not supported: managed instance scaling must allow MinInstanceCount=0"
+        manual = []
+        for name in record["components"]:
+            if dry_run:
+                continue
+            target = {"ServiceNamespace": "sagemaker", "ScalableDimension": COMPONENT_DIMENSION,
+                      "ResourceId": f"inference-component/{name}"}
+            # A request for a component without copies fails with NoCapacityInvocationFailures;
+            # adding a copy makes managed instance scaling bring an instance back
+            try:
+                _scale_out_from_zero(autoscaling_client, cloudwatch_client, target, _no_capacity_policy_name(name),
+                                     1, NO_CAPACITY_COOLDOWN, {
+                                         "MetricName": "NoCapacityInvocationFailures", "Statistic": "Maximum",
+                                         "Dimensions": [{"Name": "InferenceComponentName", "Value": name}],
+                                         "Period": 60, "EvaluationPeriods": 1, "Threshold": 1.0})
+            except ClientError as e:
+                print(f"{name}: no scale-out policy ({e.response['Error']['Code']})")
+                manual.append(name)
+            sagemaker_client.update_inference_component_runtime_config(
+                InferenceComponentName=name, DesiredRuntimeConfig={"CopyCount": 0})
+        if manual:
+            return (f"{len(record['components'])} component(s) scaled to zero, manual scale-out required for "
+                    f"{', '.join(manual)}")
+        return (f"{len(record['components'])} component(s) set to 0 copies "
+                "(NoCapacityInvocationFailures alarms scale them out again)")
+    if record["async"]:
+        for variant in record["variants"]:
+            target = {"ServiceNamespace": "sagemaker", "ScalableDimension": VARIANT_DIMENSION,
+                      "ResourceId": f"endpoint/{record['endpoint']}/variant/{variant['name']}"}
+            if dry_run:
+                continue
+            # Requests queue up while no instance is there to take them
+            _scale_out_from_zero(autoscaling_client, cloudwatch_client, target,
+                                 _backlog_policy_name(record["endpoint"], variant["name"]), variant["instances"],
+                                 BACKLOG_COOLDOWN, {
+                                     "MetricName": "HasBacklogWithoutCapacity", "Statistic": "Average",
+                                     "Dimensions": [{"Name": "EndpointName", "Value": record["endpoint"]}],
+                                     "Period": 60, "EvaluationPeriods": 2, "DatapointsToAlarm": 2, "Threshold": 1.0})
+            sagemaker_client.update_endpoint_weights_and_capacities(
+                EndpointName=record["endpoint"],
+                DesiredWeightsAndCapacities=[{"VariantName": variant["name"], "DesiredInstanceCount": 0}])
+        return "async endpoint scaled to 0 instances (the HasBacklogWithoutCapacity alarm scales it out again)"
+    return "not supported: real-time endpoints without inference components keep at least one instance"
+
+
+def snapshot_endpoint(record, sagemaker_client, directory=SNAPSHOT_DIR, tags=None):
+    """Write everything needed to redeploy the endpoint to a JSON file; returns its path."""
+    config = record["describe"]["config"]
+    model_names = {v["ModelName"] for v in config["ProductionVariants"] if "ModelName" in v}
+    components = [sagemaker_client.describe_inference_component(InferenceComponentName=name)
+                  for name in record["components"]]
+    model_names |= {c["Specification"]["ModelName"] for c in components if "ModelName" in c.get("Specification", {})}
+    snapshot = {
+        "region": record["region"],
+        "endpoint": record["describe"]["endpoint"],
+        "endpoint_config": config,
+        "models": [sagemaker_client.describe_model(ModelName=name) for name in sorted(model_names)],
+        "inference_components": components,
+        "tags": tags if tags is not None else sagemaker_client.list_tags(ResourceArn=record["arn"])["Tags"],
+        "inventory": {k: record[k] for k in ("invocations", "idle_hours", "idle_instance_hours")},
+    }
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(directory, record["region"], f"{record['endpoint']}-{stamp}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=2, default=str)
+    return path
+
+
+def delete_endpoint(record, sagemaker_client, directory=SNAPSHOT_DIR, tags=None, poll_seconds=15,
+                    timeout_seconds=1800):
+    """Snapshot, then delete the endpoint (components first). Its config and models are kept."""
+    path = snapshot_endpoint(record, sagemaker_client, directory, tags)
+    for name in record["components"]:
+        sagemaker_client.delete_inference_component(InferenceComponentName=name)
+    for name in record["components"]:
+        wait_for_status(sagemaker_client.describe_inference_component, "InferenceComponentStatus", poll_seconds,
+                        timeout_seconds, gone=True, InferenceComponentName=name)
+    sagemaker_client.delete_endpoint(EndpointName=record["endpoint"])
+    return path
+
+
+def restore_endpoint(path, sagemaker_client, endpoint_name=None, poll_seconds=30, timeout_seconds=3600):
+    """Redeploy an endpoint from a snapshot, recreating its models and config if they are gone."""
+    with open(path) as f:
+        snapshot = json.load(f)
+    name = endpoint_name or snapshot["endpoint"]["EndpointName"]
+    for model in snapshot["models"]:
+        if describe_or_none(sagemaker_client.describe_model, ModelName=model["ModelName"]) is None:
+            sagemaker_client.create_model(**_pick(model, MODEL_FIELDS))
+    config = snapshot["endpoint_config"]
+    if describe_or_none(sagemaker_client.describe_endpoint_config,
+                        EndpointConfigName=config["EndpointConfigName"]) is None:
+        sagemaker_client.create_endpoint_config(**_pick(config, CONFIG_FIELDS))
+    tags = [tag for tag in snapshot["tags"] if not tag["Key"].startswith("aws:")]  # aws: tags are reserved
+    sagemaker_client.create_endpoint(EndpointName=name, EndpointConfigName=config["EndpointConfigName"],
+                                     **({"Tags": tags} if tags else {}))
+    print(f"Restoring {name} from {path}...")
+    wait_for_status(sagemaker_client.describe_endpoint, "EndpointStatus", poll_seconds, timeout_seconds,
+                    EndpointName=name)
+    for component in snapshot["inference_components"]:
+        sagemaker_client.create_inference_component(
+            InferenceComponentName=component["InferenceComponentName"], EndpointName=name,
+            VariantName=component["VariantName"],
+            Specification=_pick(component["Specification"], COMPONENT_SPEC_FIELDS),
+            # A component scaled to zero before deletion comes back with one copy
+            RuntimeConfig={"CopyCount": max(1, component["RuntimeConfig"]["DesiredCopyCount"])},
+        )
+    return name
+
+
+def act(records, action, client_factory, directory=SNAPSHOT_DIR, dry_run=False, keep_tag=KEEP_TAG):
+    """Apply `action` to every idle record not tagged `keep_tag`; returns {(region, endpoint): outcome}."""
+    outcomes = {}
+    for record in records:
+        if not record["idle"] or action == "report":
+            continue
+        sagemaker_client = client_factory("sagemaker", record["region"])
+        tags = sagemaker_client.list_tags(ResourceArn=record["arn"])["Tags"]
+        if any(tag["Key"] == keep_tag for tag in tags):
+            outcome = f"skipped: tagged {keep_tag}"
+        elif action == "scale-to-zero":
+            outcome = scale_to_zero(record, sagemaker_client,
+                                    client_factory("application-autoscaling", record["region"]),
+                                    client_factory("cloudwatch", record["region"]), dry_run)
+        elif dry_run:
+            outcome = "snapshot and delete"
+        else:
+            outcome = f"deleted, snapshot {delete_endpoint(record, sagemaker_client, directory, tags)}"
+        outcome = f"[dry-run] {outcome}" if dry_run else outcome
+        print(f"{record['region']}/{record['endpoint']}: {outcome}")
+        outcomes[(record["region"], record["endpoint"])] = outcome
+    return outcomes
+
+
+# --- Check ---
+
+def check():
+    """Two regions of stubbed SageMaker and CloudWatch clients: scan, act on idle endpoints, restore one."""
+    import tempfile
+
+    import boto3
+    from botocore.stub import ANY, Stubber
+
+    now = datetime.datetime(2026, 3, 1, 12, tzinfo=datetime.timezone.utc)
+    old, recent = now - datetime.timedelta(days=30), now - datetime.timedelta(hours=2)
+    arn = "arn:aws:sagemaker:{}:123456789012:{}"
+    role = "arn:aws:iam::123456789012:role/sm"
+    stubbers, clients = {}, {}
+
+    def client(service, region):
+        if (service, region) not in clients:
+            clients[service, region] = boto3.client(service, region_name=region, aws_access_key_id="stub",
+                                                    aws_secret_access_key="stub")
+            stubbers[service, region] = Stubber(clients[service, region])
+        return clients[service, region]
+
+    def endpoint(region, name, created, variants, config=None):
+        return {"EndpointName": name, "EndpointArn": arn.format(region, "endpoint/" + name),
+                "EndpointConfigName": config or name, "EndpointStatus": "InService", "CreationTime": created,
+                "LastModifiedTime": created, "ProductionVariants": variants}
+
+    def endpoint_config(name, variants, **extra):
+        return dict({"EndpointConfigName": name, "EndpointConfigArn": arn.format("x", "endpoint-config/" + name),
+                     "ProductionVariants": variants, "CreationTime": old}, **extra)
+
+    model_variant = {"VariantName": "AllTraffic", "ModelName": "model-a", "InstanceType": "ml.g5.2xlarge",
+                     "InitialInstanceCount": 1}
+    ic_variant = {"VariantName": "AllTraffic", "InstanceType": "ml.g5.12xlarge", "InitialInstanceCount": 1,
+                  "ManagedInstanceScaling": {"Status": "ENABLED", "MinInstanceCount": 0, "MaxInstanceCount": 2}}
+    running = {"VariantName": "AllTraffic", "CurrentInstanceCount": 1}
+    endpoints = {
+        # region: [(describe_endpoint, describe_endpoint_config, components), ...]
+        "us-east-1": [
+            (endpoint("us-east-1", "busy", old, [running]), endpoint_config("busy", [model_variant]), []),
+            (endpoint("us-east-1", "idle-rt", old, [running]), endpoint_config("idle-rt", [model_variant]), []),
+            (endpoint("us-east-1", "idle-ic", old, [dict(running, ManagedInstanceScaling=ic_variant[
+                "ManagedInstanceScaling"])]), endpoint_config("idle-ic", [ic_variant]),
+             ["idle-ic-gemma-7b", "idle-ic-mistral-7b"]),
+        ],
+        "ap-south-1": [
+            (endpoint("ap-south-1", "idle-async", old, [running]), endpoint_config(
+                "idle-async", [model_variant], AsyncInferenceConfig={"OutputConfig": {"S3OutputPath": "s3://b/o"}}),
+             []),
+            (endpoint("ap-south-1", "new", recent, [running]), endpoint_config("new", [model_variant]), []),
+        ],
+    }
+    for region in endpoints:
+        for service in ("sagemaker", "cloudwatch", "application-autoscaling"):
+            client(service, region)
+    hourly = [now - datetime.timedelta(hours=h) for h in (1, 2, 3)]
+    for region, described in endpoints.items():
+        sm = stubbers["sagemaker", region]
+        sm.add_response("list_endpoints", {"Endpoints": [
+            {k: e[k] for k in ("EndpointName", "EndpointArn", "CreationTime", "LastModifiedTime", "EndpointStatus")}
+            for e, _, _ in described]})
+        for e, c, components in described:
+            sm.add_response("describe_endpoint", e, {"EndpointName": e["EndpointName"]})
+            sm.add_response("describe_endpoint_config", c, {"EndpointConfigName": e["EndpointConfigName"]})
+            if components:
+                # One component per page, so the listing has to follow NextToken
+                for i, n in enumerate(components):
+                    page = {"InferenceComponents": [{
+                        "InferenceComponentName": n, "InferenceComponentArn": arn.format(region, "ic/" + n),
+                        "EndpointName": e["EndpointName"], "EndpointArn": e["EndpointArn"],
+                        "VariantName": "AllTraffic", "CreationTime": old, "LastModifiedTime": old}]}
+                    expected = {"EndpointNameEquals": e["EndpointName"], "MaxResults": 100}
+                    if i:
+                        expected["NextToken"] = f"page-{i}"
+                    if i + 1 < len(components):
+                        page["NextToken"] = f"page-{i + 1}"
+                    sm.add_response("list_inference_components", page, expected)
+        # Batches of two queries: us-east-1 has four metrics -> two calls, the first one paginated
+        cw = stubbers["cloudwatch", region]
+        metric_count = sum(len(components) or 1 for _, _, components in described)
+        for start in range(0, metric_count, 2):
+            ids = [f"q{i}" for i in range(start, min(start + 2, metric_count))]
+            results = [{"Id": i, "Timestamps": hourly if (region, i) == ("us-east-1", "q0") else [],
+                        "Values": [5.0, 0.0, 2.0] if (region, i) == ("us-east-1", "q0") else [],
+                        "StatusCode": "Complete"} for i in ids]
+            expected = {"MetricDataQueries": ANY, "StartTime": now - datetime.timedelta(days=LOOKBACK_DAYS),
+                        "EndTime": now, "ScanBy": "TimestampDescending"}
+            if start == 0 and region == "us-east-1":
+                cw.add_response("get_metric_data", {"MetricDataResults": results[:1], "NextToken": "page-2"}, expected)
+                cw.add_response("get_metric_data", {"MetricDataResults": results[1:]},
+                                dict(expected, NextToken="page-2"))
+            else:
+                cw.add_response("get_metric_data", {"MetricDataResults": results}, expected)
+
+    # An opt-in region the account hasn't enabled rejects the credentials; the scan skips it
+    disabled = "ap-east-1"
+    client("cloudwatch", disabled)
+    client("sagemaker", disabled)
+    stubbers["sagemaker", disabled].add_client_error(
+        "list_endpoints", service_error_code="UnrecognizedClientException",
+        service_message="The security token included in the request is invalid.")
+
+    for stubber in stubbers.values():
+        stubber.activate()
+    records = {r["endpoint"]: r for r in scan(list(endpoints) + [disabled], client, idle_hours=24, now=now,
+                                              batch_size=2)}
+    print_inventory(records.values())
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+    assert records["busy"]["invocations"] == 7 and not records["busy"]["idle"], records["busy"]
+    assert records["busy"]["last_invocation"] == hourly[0]
+    assert {name for name, r in records.items() if r["idle"]} == {"idle-rt", "idle-ic", "idle-async"}
+    assert records["idle-rt"]["idle_hours"] == LOOKBACK_DAYS * 24 and not records["new"]["idle"]
+    assert records["idle-ic"]["metrics"] == [[{"Name": "InferenceComponentName", "Value": "idle-ic-gemma-7b"}],
+                                             [{"Name": "InferenceComponentName", "Value": "idle-ic-mistral-7b"}]]
+
+    # An idle window longer than the lookback can't be measured: classify refuses it, scan extends the lookback
+    try:
+        classify(dict(records["idle-rt"]), now, idle_hours=LOOKBACK_DAYS * 24 + 1)
+        raise AssertionError("idle_hours beyond the lookback should be rejected")
+    except ValueError:
+        pass
+    long_idle = "eu-west-1"
+    sm, cw = Stubber(client("sagemaker", long_idle)), Stubber(client("cloudwatch", long_idle))
+    stubbers["sagemaker", long_idle], stubbers["cloudwatch", long_idle] = sm, cw
+    described = endpoint(long_idle, "idle-30d", old, [running])
+    sm.add_response("list_endpoints", {"Endpoints": [{k: described[k] for k in (
+        "EndpointName", "EndpointArn", "CreationTime", "LastModifiedTime", "EndpointStatus")}]})
+    sm.add_response("describe_endpoint", described, {"EndpointName": "idle-30d"})
+    sm.add_response("describe_endpoint_config", endpoint_config("idle-30d", [model_variant]),
+                    {"EndpointConfigName": "idle-30d"})
+    cw.add_response("get_metric_data", {"MetricDataResults": [
+        {"Id": "q0", "Timestamps": [], "Values": [], "StatusCode": "Complete"}]}, {
+        "MetricDataQueries": ANY, "StartTime": now - datetime.timedelta(days=30), "EndTime": now,
+        "ScanBy": "TimestampDescending"})
+    sm.activate()
+    cw.activate()
+    (long_record,) = scan([long_idle], client, idle_hours=30 * 24, now=now)
+    assert long_record["idle"] and long_record["idle_hours"] == 30 * 24, long_record
+
+    # Scale to zero: components to 0 copies, the async endpoint to 0 instances; plain real-time can't.
+    # Each component gets a step policy that adds a copy on NoCapacityInvocationFailures; one whose
+    # policy can't be created is still scaled to zero but reported as needing a manual scale-out
+    east, south = stubbers["sagemaker", "us-east-1"], stubbers["sagemaker", "ap-south-1"]
+    scaling = stubbers["application-autoscaling", "ap-south-1"]
+    east_scaling = stubbers["application-autoscaling", "us-east-1"]
+    east.add_response("list_tags", {"Tags": []}, {"ResourceArn": records["idle-rt"]["arn"]})
+    east.add_response("list_tags", {"Tags": []}, {"ResourceArn": records["idle-ic"]["arn"]})
+    component_target = {"ServiceNamespace": "sagemaker", "ResourceId": "inference-component/idle-ic-gemma-7b",
+                        "ScalableDimension": COMPONENT_DIMENSION}
+    east_scaling.add_response("describe_scalable_targets", {"ScalableTargets": []}, {
+        "ServiceNamespace": "sagemaker", "ResourceIds": [component_target["ResourceId"]]})
+    east_scaling.add_response("register_scalable_target", {}, dict(component_target, MinCapacity=0, MaxCapacity=1))
+    no_capacity_policy = "idle-ic-gemma-7b-no-capacity-scale-out"
+    no_capacity_arn = ("arn:aws:autoscaling:us-east-1:123456789012:scalingPolicy:0000:resource/sagemaker/"
+                       f"inference-component/idle-ic-gemma-7b:policyName/{no_capacity_policy}")
+    east_scaling.add_response("put_scaling_policy", {"PolicyARN": no_capacity_arn}, dict(
+        component_target, PolicyName=no_capacity_policy, PolicyType="StepScaling",
+        StepScalingPolicyConfiguration={
+            "AdjustmentType": "ChangeInCapacity", "Cooldown": NO_CAPACITY_COOLDOWN,
+            "MetricAggregationType": "Maximum",
+            "StepAdjustments": [{"MetricIntervalLowerBound": 0.0, "ScalingAdjustment": 1}]}))
+    stubbers["cloudwatch", "us-east-1"].add_response("put_metric_alarm", {}, {
+        "AlarmName": no_capacity_policy, "Namespace": "AWS/SageMaker", "MetricName": "NoCapacityInvocationFailures",
+        "Dimensions": [{"Name": "InferenceComponentName", "Value": "idle-ic-gemma-7b"}], "Statistic": "Maximum",
+        "Period": 60, "EvaluationPeriods": 1, "Threshold": 1.0, "ComparisonOperator": "GreaterThanOrEqualToThreshold",
+        "TreatMissingData": "missing", "AlarmActions": [no_capacity_arn]})
+    east.add_response("update_inference_component_runtime_config",
+                      {"InferenceComponentArn": arn.format("us-east-1", "inference-component/idle-ic-gemma-7b")},
+                      {"InferenceComponentName": "idle-ic-gemma-7b", "DesiredRuntimeConfig": {"CopyCount": 0}})
+    east_scaling.add_client_error("describe_scalable_targets", service_error_code="AccessDeniedException",
+                                  service_message="Not authorized to perform application-autoscaling actions")
+    east.add_response("update_inference_component_runtime_config",
+                      {"InferenceComponentArn": arn.format("us-east-1", "inference-component/idle-ic-mistral-7b")},
+                      {"InferenceComponentName": "idle-ic-mistral-7b", "DesiredRuntimeConfig": {"CopyCount": 0}})
+    south.add_response("list_tags", {"Tags": [{"Key": "team", "Value": "ml"}]},
+                       {"ResourceArn": records["idle-async"]["arn"]})
+    resource = "endpoint/idle-async/variant/AllTraffic"
+    scaling.add_response("describe_scalable_targets", {"ScalableTargets": [{
+        "ServiceNamespace": "sagemaker", "ResourceId": resource, "MinCapacity": 1, "MaxCapacity": 4,
+        "ScalableDimension": "sagemaker:variant:DesiredInstanceCount", "RoleARN": role, "CreationTime": old}]})
+    scaling.add_response("register_scalable_target", {}, {
+        "ServiceNamespace": "sagemaker", "ResourceId": resource, "MinCapacity": 0, "MaxCapacity": 4,
+        "ScalableDimension": "sagemaker:variant:DesiredInstanceCount"})
+    backlog_policy = "idle-async-AllTraffic-backlog-scale-out"
+    backlog_arn = ("arn:aws:autoscaling:ap-south-1:123456789012:scalingPolicy:0000:resource/sagemaker/"
+                   f"{resource}:policyName/{backlog_policy}")
+    scaling.add_response("put_scaling_policy", {"PolicyARN": backlog_arn}, {
+        "ServiceNamespace": "sagemaker", "ResourceId": resource, "PolicyName": backlog_policy,
+        "ScalableDimension": "sagemaker:variant:DesiredInstanceCount", "PolicyType": "StepScaling",
+        "StepScalingPolicyConfiguration": ANY})
+    stubbers["cloudwatch", "ap-south-1"].add_response("put_metric_alarm", {}, {
+        "AlarmName": backlog_policy, "Namespace": "AWS/SageMaker", "MetricName": "HasBacklogWithoutCapacity",
+        "Dimensions": [{"Name": "EndpointName", "Value": "idle-async"}], "Statistic": "Average", "Period": 60,
+        "EvaluationPeriods": 2, "DatapointsToAlarm": 2, "Threshold": 1.0,
+        "ComparisonOperator": "GreaterThanOrEqualToThreshold", "TreatMissingData": "missing",
+        "AlarmActions": [backlog_arn]})
+    south.add_response("update_endpoint_weights_and_capacities", {"EndpointArn": records["idle-async"]["arn"]}, {
+        "EndpointName": "idle-async", "DesiredWeightsAndCapacities": [{"VariantName": "AllTraffic",
+                                                                       "DesiredInstanceCount": 0}]})
+    outcomes = act(records.values(), "scale-to-zero", client)
+    assert outcomes[("us-east-1", "idle-rt")].startswith("not supported"), outcomes
+    assert outcomes[("us-east-1", "idle-ic")] == ("2 component(s) scaled to zero, manual scale-out required for "
+                                                  "idle-ic-mistral-7b"), outcomes
+    assert outcomes[("ap-south-1", "idle-async")].startswith("async"), outcomes
+
+    # Delete with a snapshot (the keep-alive endpoint is skipped), then restore after the config was removed too
+    with tempfile.TemporaryDirectory() as directory:
+        east.add_response("list_tags", {"Tags": [{"Key": "owner", "Value": "me"}]},
+                          {"ResourceArn": records["idle-rt"]["arn"]})
+        east.add_response("describe_model", {
+            "ModelName": "model-a", "ModelArn": arn.format("us-east-1", "model/model-a"), "CreationTime": old,
+            "ExecutionRoleArn": role, "PrimaryContainer": {"Image": "tgi:2.2.0", "Environment": {"SM_NUM_GPUS": "1"}},
+        }, {"ModelName": "model-a"})
+        east.add_response("delete_endpoint", {}, {"EndpointName": "idle-rt"})
+        east.add_response("list_tags", {"Tags": [{"Key": KEEP_TAG, "Value": "true"}]},
+                          {"ResourceArn": records["idle-ic"]["arn"]})
+        outcomes = act([records["idle-rt"], records["idle-ic"]], "delete", client, directory)
+        assert outcomes[("us-east-1", "idle-ic")] == f"skipped: tagged {KEEP_TAG}", outcomes
+        path = outcomes[("us-east-1", "idle-rt")].split("snapshot ", 1)[1]
+
+        not_found = {"service_error_code": "ValidationException", "service_message": "Could not find it."}
+        east.add_response("describe_model", {"ModelName": "model-a", "CreationTime": old,
+                                             "ModelArn": arn.format("us-east-1", "model/model-a")},
+                          {"ModelName": "model-a"})
+        east.add_client_error("describe_endpoint_config", **not_found)
+        east.add_response("create_endpoint_config",
+                          {"EndpointConfigArn": arn.format("us-east-1", "endpoint-config/idle-rt")},
+                          {"EndpointConfigName": "idle-rt", "ProductionVariants": [model_variant]})
+        east.add_response("create_endpoint", {"EndpointArn": records["idle-rt"]["arn"]}, {
+            "EndpointName": "idle-rt", "EndpointConfigName": "idle-rt", "Tags": [{"Key": "owner", "Value": "me"}]})
+        east.add_response("describe_endpoint", endpoints["us-east-1"][1][0], {"EndpointName": "idle-rt"})
+        assert restore_endpoint(path, clients["sagemaker", "us-east-1"], poll_seconds=0) == "idle-rt"
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+    print("All checks passed")
+
+
+def session_client_factory(session):
+    from botocore.config import Config
+
+    # Adaptive retries absorb the throttling of describe calls on accounts with many endpoints
+    config = Config(retries={"mode": "adaptive", "max_attempts": 10})
+    return lambda service, region: session.client(service, region_name=region, config=config)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find idle SageMaker endpoints across regions.")
+    parser.add_argument("command", nargs="?", default="scan", choices=("scan", "restore", "check"))
+    parser.add_argument("snapshot", nargs="?", help="Snapshot file for `restore`")
+    parser.add_argument("--regions", default=REGIONS, help="Comma-separated regions, or `all`")
+    parser.add_argument("--idle-hours", type=float, default=IDLE_HOURS)
+    parser.add_argument("--lookback-days", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--action", default="report", choices=ACTIONS)
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--endpoint-name", default=None, help="New name for `restore`")
+    parser.add_argument("--dry-run", action="store_true", help="Report what the action would do")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        check()
+    else:
+        import boto3
+
+        session = boto3.Session(profile_name=os.environ.get("AWS_PROFILE"))
+        factory = session_client_factory(session)
+        if args.command == "restore":
+            with open(args.snapshot) as f:
+                region = json.load(f)["region"]
+            restore_endpoint(args.snapshot, factory("sagemaker", region), args.endpoint_name)
+        else:
+            regions = session.get_available_regions("sagemaker") if args.regions == "all" else args.regions.split(",")
+            records = scan(regions, factory, args.idle_hours, args.lookback_days)
+            print_inventory(records)
+            act(records, args.action, factory, args.snapshot_dir, args.dry_run)
@@ -0,0 +1,216 @@
+# %% [markdown]
+# ## Endpoint Warmup and Readiness Gating
+# A fresh TGI endpoint is `InService` before it is fast: the first requests pay
+# for CUDA graph capture and allocator growth. This sends a synthetic workload
+# covering the prompt lengths and concurrency we expect, in rounds, until the
+# median latency of every shape has stopped moving (the last `WARMUP_WINDOW`
+# rounds within `WARMUP_TOLERANCE` of each other). Only then is the endpoint
+# reported ready. Every round is recorded as the warmup curve.
+#
+#     python endpoint_warmup.py --endpoint-name my-endpoint --curve warmup.csv
+#
+# On an endpoint hosting inference components (see inference_components.py),
+# name the model to warm with `--inference-component` or `SAGEMAKER_INFERENCE_COMPONENT`:
+#
+#     python endpoint_warmup.py --endpoint-name shared-llms --inference-component shared-llms-gemma-7b
+#
+# Against the local stand-in, with the first 40 requests slow:
+#
+#     python local_endpoint_standin.py --port 8081 --cold-requests 40 --cold-ms 2000 &
+#     python endpoint_warmup.py --endpoint-name local --endpoint-url http://127.0.0.1:8081
+
+# %%
+import argparse
+import csv
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+ENABLE_WARMUP = os.environ.get("ENABLE_WARMUP", "true").lower() == "true"
+PROMPT_TOKENS = [int(n) for n in os.environ.get("WARMUP_PROMPT_TOKENS", "32,256,1024").split(",")]
+CONCURRENCY = [int(n) for n in os.environ.get("WARMUP_CONCURRENCY", "1,4").split(",")]
+MAX_NEW_TOKENS = int(os.environ.get("WARMUP_MAX_NEW_TOKENS", "64"))
+TOLERANCE = float(os.environ.get("WARMUP_TOLERANCE", "0.15"))  # Allowed spread of recent round medians
+WINDOW = int(os.environ.get("WARMUP_WINDOW", "3"))  # Rounds that must agree
+MAX_ROUNDS = int(os.environ.get("WARMUP_MAX_ROUNDS", "20"))
+TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "900"))
+CURVE_PATH = os.environ.get("WARMUP_CURVE_PATH")  # CSV of every round, if set
+RUNTIME_ENDPOINT_URL = os.environ.get("SAGEMAKER_RUNTIME_ENDPOINT_URL")  # e.g. the local stand-in
+INFERENCE_COMPONENT = os.environ.get("SAGEMAKER_INFERENCE_COMPONENT")  # Model to warm on a multi-model endpoint
+
+CURVE_FIELDS = ("round", "prompt_tokens", "concurrency", "p50_ms", "max_ms", "errors", "elapsed_seconds")
+FILLER = ("The endpoint is warming up with a synthetic prompt that covers the lengths we expect in "
+          "production traffic so kernels and memory pools are ready before users arrive").split()
+
+
+def synthetic_prompt(tokens):
+    """About `tokens` tokens of filler text (one word is roughly one token)."""
+    return " ".join(FILLER[i % len(FILLER)] for i in range(max(1, tokens)))
+
+
+def warmup_shapes(prompt_tokens=PROMPT_TOKENS, concurrency=CONCURRENCY, max_input_tokens=None):
+    """(prompt tokens, concurrent requests) pairs, with prompts capped at the endpoint's input limit."""
+    if max_input_tokens:
+        # Leave room for special tokens and tokenizer differences
+        prompt_tokens = sorted({min(tokens, int(max_input_tokens * 0.8)) for tokens in prompt_tokens})
+    return [(tokens, count) for tokens in prompt_tokens for count in concurrency]
+
+
+def _invoke(runtime_client, endpoint_name, body, invoke_kwargs):
+    started = time.perf_counter()
+    try:
+        response = runtime_client.invoke_endpoint(EndpointName=endpoint_name, ContentType="application/json",
+                                                  Body=body, **invoke_kwargs)
+        response["Body"].read()
+        return (time.perf_counter() - started) * 1000.0, None
+    except Exception as e:
+        return (time.perf_counter() - started) * 1000.0, e
+
+
+def _stable(history, window, tolerance):
+    recent = history[-window:]
+    return len(recent) == window and (max(recent) - min(recent)) <= tolerance * min(recent)
+
+
+def warmup_endpoint(runtime_client, endpoint_name, shapes=None, max_new_tokens=MAX_NEW_TOKENS,
+                    tolerance=TOLERANCE, window=WINDOW, max_rounds=MAX_ROUNDS, timeout_seconds=TIMEOUT_SECONDS,
+                    curve_path=CURVE_PATH, inference_component=None):
+    """Send warmup rounds until every shape's median latency is stable; returns readiness and the curve.
+
+    `inference_component` targets one model on an endpoint hosting inference components.
+    """
+    shapes = shapes or warmup_shapes()
+    # Endpoints with inference components reject invocations that don't name one
+    invoke_kwargs = {"InferenceComponentName": inference_component} if inference_component else {}
+    target = f"{endpoint_name}/{inference_component}" if inference_component else endpoint_name
+    bodies = {tokens: json.dumps({"inputs": synthetic_prompt(tokens),
+                                  "parameters": {"max_new_tokens": max_new_tokens}})
+              for tokens, _ in shapes}
+    history = {shape: [] for shape in shapes}
+    curve = []
+    started = time.monotonic()
+    ready = False
+    print(f"Warming up {target}: {len(shapes)} shapes, tolerance {tolerance:.0%} over {window} rounds")
+    with ThreadPoolExecutor(max_workers=max(count for _, count in shapes)) as executor:
+        for round_number in range(1, max_rounds + 1):
+            round_errors = 0
+            for tokens, count in shapes:
+                results = list(executor.map(lambda _: _invoke(runtime_client, endpoint_name, bodies[tokens], invoke_kwargs),
+                                            range(count)))
+                latencies = [latency for latency, error in results if error is None]
+                errors = [error for _, error in results if error is not None]
+                round_errors += len(errors)
+                row = {
+                    "round": round_number, "prompt_tokens": tokens, "concurrency": count,
+                    "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+                    "max_ms": round(max(latencies), 1) if latencies else None,
+                    "errors": len(errors), "elapsed_seconds": round(time.monotonic() - started, 2),
+                }
+                curve.append(row)
+                if errors:
+                    print(f"  round {round_number} {tokens} tokens x{count}: {len(errors)} errors ({errors[0]})")
+                else:
+                    history[(tokens, count)].append(row["p50_ms"])
+            summary = ", ".join(f"{t}x{c}={history[(t, c)][-1]:.0f}ms" for t, c in shapes if history[(t, c)])
+            print(f"  round {round_number}: {summary}")
+            # A round with errors resets nothing but can't count toward stability
+            if round_errors == 0 and all(_stable(history[shape], window, tolerance) for shape in shapes):
+                ready = True
+                break
+            if time.monotonic() - started > timeout_seconds:
+                print(f"Warmup timed out after {timeout_seconds:.0f}s")
+                break
+
+    result = {"endpoint_name": endpoint_name, "inference_component": inference_component, "ready": ready, "rounds": curve[-1]["round"] if curve else 0,
+              "requests": sum(row["concurrency"] for row in curve), "seconds": round(time.monotonic() - started, 2),
+              "curve": curve}
+    if curve_path:
+        with open(curve_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CURVE_FIELDS)
+            writer.writeheader()
+            writer.writerows(curve)
+        print(f"Warmup curve written to {curve_path}")
+    print(f"{target} {'ready' if ready else 'NOT ready'} after {result['rounds']} rounds, "
+          f"{result['requests']} requests, {result['seconds']:.1f}s")
+    return result
+
+
+def print_curve(curve):
+    print(f"{'round':>5} {'prompt':>7} {'conc':>5} {'p50 ms':>8} {'max ms':>8} {'errors':>6}")
+    for row in curve:
+        p50 = f"{row['p50_ms']:.0f}" if row["p50_ms"] is not None else "-"
+        peak = f"{row['max_ms']:.0f}" if row["max_ms"] is not None else "-"
+        print(f"{row['round']:>5} {row['prompt_tokens']:>7} {row['concurrency']:>5} {p50:>8} {peak:>8} "
+              f"{row['errors']:>6}")
+
+
+def runtime_client_for(boto_session, endpoint_url=RUNTIME_ENDPOINT_URL, max_pool_connections=None):
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=max_pool_connections or max(CONCURRENCY) + 1,
+                    read_timeout=120, retries={"max_attempts": 1})
+    return boto_session.client("sagemaker-runtime", endpoint_url=endpoint_url, config=config)
+
+
+def deployed_max_input_tokens(sagemaker_client, endpoint_name, inference_component=None):
+    """`MAX_INPUT_TOKENS` from the environment of the endpoint's (or component's) model, or None if unset or unreadable."""
+    try:
+        if inference_component:
+            component = sagemaker_client.describe_inference_component(InferenceComponentName=inference_component)
+            model_name = component["Specification"].get("ModelName")
+        else:
+            config_name = sagemaker_client.describe_endpoint(EndpointName=endpoint_name)["EndpointConfigName"]
+            variant = sagemaker_client.describe_endpoint_config(EndpointConfigName=config_name)["ProductionVariants"][0]
+            model_name = variant.get("ModelName")  # Unset when inference components carry the containers
+        if not model_name:
+            return None
+        model = sagemaker_client.describe_model(ModelName=model_name)
+        container = model.get("PrimaryContainer") or model["Containers"][0]
+        limit = container.get("Environment", {}).get("MAX_INPUT_TOKENS")
+        return int(limit) if limit else None
+    except Exception as e:
+        print(f"Could not read MAX_INPUT_TOKENS of {endpoint_name}: {e}")
+        return None
+
+
+def warmup_from_env(endpoint_name, boto_session, max_input_tokens=None, inference_component=INFERENCE_COMPONENT):
+    """Warm up `endpoint_name` with the WARMUP_* settings if ENABLE_WARMUP is true (the default)."""
+    if not ENABLE_WARMUP:
+        print("Warmup disabled (ENABLE_WARMUP=false)")
+        return None
+    shapes = warmup_shapes(max_input_tokens=max_input_tokens)
+    return warmup_endpoint(runtime_client_for(boto_session), endpoint_name, shapes,
+                           inference_component=inference_component)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm up an endpoint until its latency is stable.")
+    parser.add_argument("--endpoint-name", required=True)
+    parser.add_argument("--endpoint-url", default=RUNTIME_ENDPOINT_URL, help="e.g. the local stand-in")
+    parser.add_argument("--inference-component", default=INFERENCE_COMPONENT,
+                        help="Model to warm on an endpoint hosting inference components")
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--prompt-tokens", default=",".join(map(str, PROMPT_TOKENS)))
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY)))
+    parser.add_argument("--max-input-tokens", type=int, default=None, help="Endpoint MAX_INPUT_TOKENS")
+    parser.add_argument("--max-new-tokens", type=int, default=MAX_NEW_TOKENS)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS)
+    parser.add_argument("--curve", default=CURVE_PATH, help="CSV file for the warmup curve")
+    args = parser.parse_args()
+
+    import boto3
+
+    concurrency = [int(n) for n in args.concurrency.split(",")]
+    client = runtime_client_for(boto3.Session(region_name=args.region or "us-east-1"), args.endpoint_url,
+                                max(concurrency) + 1)
+    shapes = warmup_shapes([int(n) for n in args.prompt_tokens.split(",")], concurrency, args.max_input_tokens)
+    result = warmup_endpoint(client, args.endpoint_name, shapes, args.max_new_tokens, args.tolerance,
+                             args.window, args.max_rounds, curve_path=args.curve,
+                             inference_component=args.inference_component)
+    print_curve(result["curve"])
+    raise SystemExit(0 if result["ready"] else 1)
@@ -0,0 +1,357 @@
+# %% [markdown]
+# ## Offline Evaluation: Quality vs. Latency
+# Runs a prompt set against every combination of generation parameters
+# (temperature, top_p, max_new_tokens) and endpoints, then reports which
+# configurations are on the latency/quality Pareto front. Everything else
+# costs more latency for the same score, or gives less score for the same latency.
+#
+# - Calls go through one `ThreadPoolExecutor`, so at most `--concurrency`
+#   requests are in flight across all endpoints. Requests are shuffled so that
+#   no configuration runs entirely on a cold or a saturated endpoint.
+# - Scores are computed in one pass over all outputs with NumPy:
+#   - `length`: words generated
+#   - `exact`: normalized exact match with the reference
+#   - `f1`: token-overlap F1 (SQuAD style) on hashed token counts
+#   - `embedding`: cosine similarity of output and reference embeddings.
+#     `EVAL_EMBEDDING_MODEL` picks a sentence-transformers model. Without it a
+#     hashing embedder (signed unigram + bigram features) runs locally with no
+#     downloads.
+# - Failed calls score 0 and show up in the error rate.
+#
+# `--standin` starts one local endpoint stand-in per endpoint, so the whole run
+# needs no AWS account or GPU (e.g. in CI). The stand-in's answers degrade with
+# temperature, and its full-length answer serves as the reference:
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python eval_harness.py --standin --fail-under 0.9
+#     python eval_harness.py --endpoints gemma-7b,deepseek-r1 --prompts eval.jsonl \
+#         --temperature 0,0.7 --top-p 0.9,1.0 --max-new-tokens 128,512 --output /tmp/eval.csv
+
+# %%
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- Configuration ---
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "8"))
+EMBEDDING_MODEL = os.environ.get("EVAL_EMBEDDING_MODEL")  # sentence-transformers model; hashing embedder if unset
+COUNT_BUCKETS = 1 << 14  # Hashed vocabulary for token F1; collisions only inflate overlap slightly
+EMBEDDING_DIM = 512
+SCORES = ("exact", "f1", "embedding")
+
+# Small built-in prompt set with short reference answers
+BUILTIN_PROMPTS = [
+    {"prompt": "What does a SageMaker real-time endpoint do?",
+     "reference": "It hosts a model on managed instances and returns predictions for each request with low latency."},
+    {"prompt": "What is an inference component in SageMaker?",
+     "reference": "A model deployed onto a shared endpoint with its own accelerators, memory and copy count."},
+    {"prompt": "When should I use asynchronous inference?",
+     "reference": "For long-running requests or large payloads, where requests are queued and results written to S3."},
+    {"prompt": "What does Text Generation Inference (TGI) provide?",
+     "reference": "A server for large language models with continuous batching, token streaming and quantization."},
+    {"prompt": "Why set max_new_tokens on a request?",
+     "reference": "It caps how many tokens the model generates, which bounds latency and cost per request."},
+    {"prompt": "What does the temperature parameter change?",
+     "reference": "It scales the token probabilities; higher values make sampling more random, zero is greedy."},
+    {"prompt": "What is top_p sampling?",
+     "reference": "Sampling only from the smallest set of tokens whose cumulative probability exceeds p."},
+    {"prompt": "How do you avoid paying for idle endpoints?",
+     "reference": "Scale them to zero where supported, or delete them and redeploy from the saved configuration."},
+]
+
+
+def load_prompts(path=None):
+    """Prompt set from a JSONL file of `{"prompt", "reference"}` lines, or the built-in one."""
+    if not path:
+        return list(BUILTIN_PROMPTS)
+    with open(path) as f:
+        prompts = [json.loads(line) for line in f if line.strip()]
+    for i, item in enumerate(prompts):
+        if "prompt" not in item or "reference" not in item:
+            raise ValueError(f"{path}:{i + 1}: each line needs 'prompt' and 'reference'")
+    return prompts
+
+
+def parameter_grid(temperatures, top_ps, max_new_tokens):
+    return [{"temperature": t, "top_p": p, "max_new_tokens": n}
+            for t, p, n in itertools.product(temperatures, top_ps, max_new_tokens)]
+
+
+def build_payload(prompt, params, payload_format="tgi"):
+    if payload_format == "chat":
+        return {"messages": [{"role": "user", "content": prompt}], "max_tokens": params["max_new_tokens"],
+                "temperature": params["temperature"], "top_p": params["top_p"]}
+    parameters = {"max_new_tokens": params["max_new_tokens"], "do_sample": params["temperature"] > 0}
+    # TGI rejects temperature 0 and top_p 1.0; greedy decoding and "no top_p" are expressed by leaving them out
+    if params["temperature"] > 0:
+        parameters["temperature"] = params["temperature"]
+    if 0 < params["top_p"] < 1:
+        parameters["top_p"] = params["top_p"]
+    return {"inputs": prompt, "parameters": parameters}
+
+
+def parse_output(body):
+    if isinstance(body, list):
+        body = body[0] if body else {}
+    if "choices" in body:
+        return body["choices"][0]["message"]["content"]
+    return body.get("generated_text", "")
+
+
+# --- Execution ---
+
+def _target(endpoint):
+    """`endpoint` or `endpoint:component` (see inference_components.py) to invoke parameters."""
+    name, _, component = endpoint.partition(":")
+    return {"EndpointName": name, **({"InferenceComponentName": component} if component else {})}
+
+
+def run_grid(clients, endpoints, configs, prompts, payload_format="tgi", concurrency=EVAL_CONCURRENCY, seed=0):
+    """Invoke every (endpoint, config, prompt); returns one record per call, in grid order."""
+    jobs = list(itertools.product(range(len(endpoints)), range(len(configs)), range(len(prompts))))
+    order = list(range(len(jobs)))
+    random.Random(seed).shuffle(order)
+    records = [None] * len(jobs)
+
+    def run(index):
+        endpoint, config, prompt = jobs[index]
+        body = json.dumps(build_payload(prompts[prompt]["prompt"], configs[config], payload_format))
+        record = {"endpoint": endpoint, "config": config, "prompt": prompt, "output": "", "error": None}
+        started = time.perf_counter()
+        try:
+            response = clients[endpoints[endpoint]].invoke_endpoint(
+                ContentType="application/json", Body=body, **_target(endpoints[endpoint]))
+            record["output"] = parse_output(json.loads(response["Body"].read()))
+        except Exception as e:
+            record["error"] = getattr(e, "response", {}).get("Error", {}).get("Code") or type(e).__name__
+        record["latency_ms"] = (time.perf_counter() - started) * 1000
+        records[index] = record
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="eval") as executor:
+        list(executor.map(run, order))
+    return records
+
+
+# --- Metrics ---
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def hashed_counts(texts, buckets=COUNT_BUCKETS):
+    """Bag-of-words count matrix (one row per text) with words hashed into `buckets` columns."""
+    tokens = [normalize(text).split() for text in texts]
+    rows = np.repeat(np.arange(len(texts)), [len(t) for t in tokens])
+    columns = np.fromiter((zlib.crc32(word.encode()) % buckets for t in tokens for word in t), dtype=np.int64,
+                          count=len(rows))
+    counts = np.zeros((len(texts), buckets), dtype=np.float32)
+    np.add.at(counts, (rows, columns), 1.0)
+    return counts
+
+
+def token_f1(outputs, references):
+    predicted, expected = hashed_counts(outputs), hashed_counts(references)
+    overlap = np.minimum(predicted, expected).sum(axis=1)
+    precision = np.divide(overlap, predicted.sum(axis=1), out=np.zeros_like(overlap), where=overlap > 0)
+    recall = np.divide(overlap, expected.sum(axis=1), out=np.zeros_like(overlap), where=overlap > 0)
+    return np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(overlap), where=overlap > 0)
+
+
+def exact_match(outputs, references):
+    return (np.array([normalize(t) for t in outputs]) == np.array([normalize(t) for t in references])).astype(float)
+
+
+def hashing_embedder(texts, dim=EMBEDDING_DIM):
+    """Signed hashed unigram + bigram features, log-scaled and L2-normalized."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    rows, columns, signs = [], [], []
+    for row, text in enumerate(texts):
+        words = normalize(text).split()
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode())
+            rows.append(row)
+            columns.append(h % dim)
+            signs.append(1.0 if h >> 31 else -1.0)
+    np.add.at(vectors, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)),
+              np.array(signs, dtype=np.float32))
+    vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def embedder_from_env(model_name=EMBEDDING_MODEL):
+    """`texts -> unit vectors`; sentence-transformers when a model is configured."""
+    if not model_name:
+        return hashing_embedder
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+
+def score_records(records, prompts, embed=hashing_embedder):
+    """Per-call metric arrays, aligned with `records`."""
+    outputs = [r["output"] for r in records]
+    prompt_index = np.array([r["prompt"] for r in records])
+    references = [prompts[i]["reference"] for i in prompt_index]
+    ok = np.array([r["error"] is None for r in records])
+    # References are embedded once per prompt and gathered per call
+    reference_vectors = embed([p["reference"] for p in prompts])[prompt_index]
+    scores = {
+        "length": np.array([len(normalize(t).split()) for t in outputs], dtype=float),
+        "exact": exact_match(outputs, references),
+        "f1": token_f1(outputs, references),
+        "embedding": np.clip(np.einsum("ij,ij->i", embed(outputs), reference_vectors), 0.0, 1.0),
+    }
+    return {name: np.where(ok, values, 0.0) for name, values in scores.items()}
+
+
+# --- Aggregation ---
+
+def pareto_front(latency, score):
+    """Mask of points no other point beats on both axes (lower latency, higher score)."""
+    latency, score = np.asarray(latency)[:, None], np.asarray(score)[:, None]
+    no_worse = (latency.T <= latency) & (score.T >= score)
+    better = (latency.T < latency) | (score.T > score)
+    return ~(no_worse & better).any(axis=1)
+
+
+def summarize(records, scores, endpoints, configs, score="embedding"):
+    """One row per (endpoint, config) with latency percentiles, error rate and mean scores."""
+    groups = np.array([r["endpoint"] * len(configs) + r["config"] for r in records])
+    latency = np.array([r["latency_ms"] for r in records])
+    ok = np.array([r["error"] is None for r in records])
+    calls = np.bincount(groups, minlength=len(endpoints) * len(configs))
+    rows = []
+    for group in np.flatnonzero(calls):
+        member = groups == group
+        ok_latency = latency[member & ok]
+        rows.append({
+            "endpoint": endpoints[group // len(configs)], **configs[group % len(configs)],
+            "calls": int(calls[group]), "error_rate": 1 - (member & ok).sum() / calls[group],
+            "p50_ms": float(np.percentile(ok_latency, 50)) if ok_latency.size else float("nan"),
+            "p90_ms": float(np.percentile(ok_latency, 90)) if ok_latency.size else float("nan"),
+        })
+    # Group means of every metric at once
+    for name, values in scores.items():
+        means = np.bincount(groups, weights=values, minlength=len(calls)) / np.maximum(calls, 1)
+        for row, group in zip(rows, np.flatnonzero(calls)):
+            row[name] = float(means[group])
+    p90 = np.array([row["p90_ms"] for row in rows])
+    front = pareto_front(np.nan_to_num(p90, nan=np.inf), np.array([row[score] for row in rows]))
+    for row, on_front in zip(rows, front):
+        row["pareto"] = bool(on_front)
+    return sorted(rows, key=lambda row: (row["p90_ms"], -row[score]))
+
+
+def print_table(rows, score="embedding"):
+    print(f"{'endpoint':<28} {'temp':>5} {'top_p':>5} {'max_new':>7} {'err':>6} {'p50_ms':>8} {'p90_ms':>8} "
+          f"{'length':>7} {'exact':>6} {'f1':>6} {'embed':>6}  pareto({score} vs p90)")
+    for row in rows:
+        print(f"{row['endpoint']:<28} {row['temperature']:>5.2f} {row['top_p']:>5.2f} {row['max_new_tokens']:>7} "
+              f"{row['error_rate']:>6.1%} {row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['length']:>7.1f} "
+              f"{row['exact']:>6.3f} {row['f1']:>6.3f} {row['embedding']:>6.3f}  {'*' if row['pareto'] else ''}")
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# --- Local stand-ins ---
+
+# Two endpoint configurations for CI: quicker first token vs. quicker decode
+STANDIN_PROFILES = {
+    "standin-g5": {"latency_ms": 30.0, "token_ms": 1.0},
+    "standin-g6e": {"latency_ms": 60.0, "token_ms": 0.4},
+}
+
+
+def start_standins(endpoints, tokens):
+    """One in-process stand-in per endpoint; returns (servers, reference text of `tokens` words)."""
+    from local_endpoint_standin import WORDS, StandinSettings, serve
+
+    servers = {}
+    for i, endpoint in enumerate(endpoints):
+        profile = STANDIN_PROFILES.get(endpoint, {"latency_ms": 40.0 * (i + 1), "token_ms": 1.0})
+        servers[endpoint] = serve(port=0, settings=StandinSettings(tokens=tokens, seed=i, **profile))
+    return servers, " ".join(WORDS[i % len(WORDS)] for i in range(tokens))
+
+
+def _floats(value):
+    return [float(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate quality vs. latency across generation parameters.")
+    parser.add_argument("--endpoints", default=None,
+                        help="Comma-separated endpoint names, or endpoint:component for inference components")
+    parser.add_argument("--prompts", default=None, help='JSONL of {"prompt", "reference"} (default: built-in set)')
+    parser.add_argument("--temperature", type=_floats, default=[0.0, 0.4, 1.0])
+    parser.add_argument("--top-p", type=_floats, default=[0.9, 1.0])
+    parser.add_argument("--max-new-tokens", type=lambda v: [int(n) for n in v.split(",")], default=[32, 64, 128])
+    parser.add_argument("--format", default="tgi", choices=("tgi", "chat"), help="Request payload format")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="Max requests in flight")
+    parser.add_argument("--score", default="embedding", choices=SCORES, help="Score axis of the Pareto front")
+    parser.add_argument("--endpoint-url", default=os.environ.get("SAGEMAKER_RUNTIME_ENDPOINT_URL"))
+    parser.add_argument("--standin", action="store_true", help="Run against local stand-ins (no AWS needed)")
+    parser.add_argument("--output", default=None, help="Write the summary table as CSV")
+    parser.add_argument("--fail-under", type=float, default=None,
+                        help="Exit 1 unless some configuration reaches this score (for CI)")
+    args = parser.parse_args()
+
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.Session(region_name="us-east-1" if args.standin else None)
+    config = Config(max_pool_connections=args.concurrency, read_timeout=300, retries={"total_max_attempts": 1})
+    prompts = load_prompts(args.prompts)
+    if args.standin:
+        endpoints = args.endpoints.split(",") if args.endpoints else list(STANDIN_PROFILES)
+        servers, reference = start_standins(endpoints, max(args.max_new_tokens))
+        # The stand-in answers every prompt the same way; its greedy full-length answer is the reference
+        prompts = [dict(item, reference=reference) for item in prompts]
+        clients = {endpoint: session.client("sagemaker-runtime", config=config,
+                                            endpoint_url=f"http://127.0.0.1:{server.server_address[1]}")
+                   for endpoint, server in servers.items()}
+    else:
+        if not args.endpoints:
+            parser.error("--endpoints is required unless --standin is set")
+        endpoints = args.endpoints.split(",")
+        client = session.client("sagemaker-runtime", endpoint_url=args.endpoint_url, config=config)
+        clients = dict.fromkeys(endpoints, client)
+
+    configs = parameter_grid(args.temperature, args.top_p, args.max_new_tokens)
+    print(f"Evaluating {len(prompts)} prompts x {len(configs)} parameter sets x {len(endpoints)} endpoints "
+          f"({len(prompts) * len(configs) * len(endpoints)} calls, {args.concurrency} in flight)")
+    started = time.perf_counter()
+    records = run_grid(clients, endpoints, configs, prompts, args.format, args.concurrency)
+    print(f"Calls finished in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    scores = score_records(records, prompts, embedder_from_env())
+    print(f"Scored {len(records)} outputs in {(time.perf_counter() - started) * 1000:.1f}ms "
+          f"(embeddings: {EMBEDDING_MODEL or 'hashing'})\n")
+    rows = summarize(records, scores, endpoints, configs, args.score)
+    print_table(rows, args.score)
+    if args.output:
+        write_csv(rows, args.output)
+        print(f"\nWrote {args.output}")
+
+    if args.fail_under is not None:
+        best = max(row[args.score] for row in rows)
+        print(f"\nBest {args.score}: {best:.3f} (required: {args.fail_under:.3f})")
+        raise SystemExit(0 if best >= args.fail_under else 1)
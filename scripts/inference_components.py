@@ -0,0 +1,441 @@
+# %% [markdown]
+# ## Inference Components: Several Models on One Endpoint
+# Instead of one mostly idle single-model endpoint per model, deploys each model
+# as a SageMaker **inference component** on a shared endpoint. Every component
+# reserves its own accelerators, host memory and CPU cores and runs `CopyCount`
+# copies; SageMaker places the copies on the endpoint's instances.
+#
+# The planner sizes each component with `tgi_serving_params.py`: the fewest GPUs
+# whose memory holds the weights plus a `min_total_tokens` sequence of KV cache.
+# It then bin-packs the copies onto instances (first-fit decreasing on GPUs, host
+# memory and vCPUs) to find how many instances the endpoint needs.
+#
+#     python inference_components.py plan --instance-type ml.g5.12xlarge
+#     python inference_components.py plan --compare ml.g5.2xlarge ml.g5.12xlarge ml.g6e.12xlarge
+#     python inference_components.py deploy --endpoint-name shared-llms --dry-run
+#     python inference_components.py check   # planner and deploy/delete against a stubbed control plane
+#
+# The models come from `INFERENCE_COMPONENTS` (JSON list of {"name", "model_id",
+# "copies", "quantize", "min_total_tokens"}); the default is the Gemma 7B and
+# DeepSeek distill models of the deploy scripts. Callers pick a model with
+# `InferenceComponentName=<endpoint>-<name>` on every invocation (the agent reads
+# it from `SAGEMAKER_INFERENCE_COMPONENT`).
+
+# %%
+import argparse
+import json
+import math
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from tgi_serving_params import INSTANCE_CATALOG, load_model_config, plan_serving_params, serving_env
+
+# --- Configuration ---
+VARIANT_NAME = "AllTraffic"
+DEFAULT_COMPONENTS = [
+    {"name": "gemma-7b", "model_id": "google/gemma-7b", "copies": 1},
+    {"name": "deepseek-r1-distill-llama-8b", "model_id": "deepseek-ai/DeepSeek-R1-Distill-Llama-8B", "copies": 1},
+]
+MIN_TOTAL_TOKENS = int(os.environ.get("INFERENCE_COMPONENT_MIN_TOTAL_TOKENS", "2048"))  # Per sequence
+# Host memory per component: the weights (safetensors are read through host memory) plus the TGI router/server
+HOST_OVERHEAD_MIB = int(os.environ.get("INFERENCE_COMPONENT_HOST_OVERHEAD_MIB", "4096"))
+CPU_CORES_PER_GPU = float(os.environ.get("INFERENCE_COMPONENT_CPU_CORES_PER_GPU", "2"))
+HOST_RESERVED_FRACTION = 0.1  # Host memory kept for the OS and the SageMaker agents
+STARTUP_TIMEOUT_SECONDS = 3600
+
+# vCPUs per instance size; host memory is 4 GiB per vCPU (8 on g6e, 12 on p4d/p4de, ~10.7 on p5)
+VCPUS = {"xlarge": 4, "2xlarge": 8, "4xlarge": 16, "8xlarge": 32, "12xlarge": 48, "16xlarge": 64,
+         "24xlarge": 96, "48xlarge": 192}
+HOST_MEMORY_GIB = {"ml.p4d.24xlarge": 1152, "ml.p4de.24xlarge": 1152, "ml.p5.48xlarge": 2048}
+
+
+def host_resources(instance_type):
+    """(vCPUs, host memory GiB) of a catalog instance type."""
+    vcpus = VCPUS[instance_type.rsplit(".", 1)[1]]
+    per_vcpu = 8 if instance_type.startswith("ml.g6e.") else 4
+    return vcpus, HOST_MEMORY_GIB.get(instance_type, vcpus * per_vcpu)
+
+
+def components_from_env():
+    """Component specs from INFERENCE_COMPONENTS (JSON), or the repo's two models."""
+    if os.environ.get("INFERENCE_COMPONENTS"):
+        return json.loads(os.environ["INFERENCE_COMPONENTS"])
+    return DEFAULT_COMPONENTS
+
+
+def component_name(endpoint_name, name):
+    """Inference component (and model) name; unique per account and region, so scoped by endpoint."""
+    return f"{endpoint_name}-{name}"
+
+
+# --- Planning ---
+
+def size_component(spec, instance_type, token=None):
+    """Fewest GPUs of `instance_type` that serve the model, and the component's resource reservation."""
+    config = load_model_config(spec["model_id"], token)
+    instance_gpus = INSTANCE_CATALOG[instance_type][0]
+    min_total = spec.get("min_total_tokens", MIN_TOTAL_TOKENS)
+    num_gpus, error = 1, None
+    while num_gpus <= instance_gpus:
+        try:
+            plan = plan_serving_params(config, instance_type, num_gpus, spec.get("quantize"))
+            if plan["max_total_tokens"] >= min_total:
+                break
+            error = f"only {plan['max_total_tokens']} tokens per sequence on {num_gpus} GPU(s)"
+        except ValueError as e:
+            error = str(e)
+        num_gpus *= 2  # Tensor parallelism needs a power of two that divides the attention heads
+    else:
+        raise ValueError(f"{spec['name']} does not fit {instance_type} with {min_total} tokens per sequence: {error}")
+
+    return {
+        "name": spec["name"], "model_id": spec["model_id"], "copies": int(spec.get("copies", 1)), "plan": plan,
+        "requirements": {
+            "NumberOfAcceleratorDevicesRequired": num_gpus,
+            "MinMemoryRequiredInMb": math.ceil(plan["weights_gib"] * 1024) + HOST_OVERHEAD_MIB,
+            "NumberOfCpuCoresRequired": CPU_CORES_PER_GPU * num_gpus,
+        },
+    }
+
+
+def instance_capacity(instance_type):
+    vcpus, memory_gib = host_resources(instance_type)
+    return {"NumberOfAcceleratorDevicesRequired": INSTANCE_CATALOG[instance_type][0],
+            "MinMemoryRequiredInMb": int(memory_gib * 1024 * (1 - HOST_RESERVED_FRACTION)),
+            "NumberOfCpuCoresRequired": vcpus}
+
+
+def pack_components(components, instance_type):
+    """First-fit decreasing bin packing of every component copy onto instances of `instance_type`."""
+    capacity = instance_capacity(instance_type)
+    copies = [c for c in components for _ in range(c["copies"])]
+    copies.sort(key=lambda c: (c["requirements"]["NumberOfAcceleratorDevicesRequired"],
+                               c["requirements"]["MinMemoryRequiredInMb"]), reverse=True)
+    instances = []
+    for component in copies:
+        needs = component["requirements"]
+        if any(needs[k] > capacity[k] for k in capacity):
+            raise ValueError(f"One copy of {component['name']} ({needs}) exceeds a whole {instance_type} ({capacity})")
+        for instance in instances:
+            if all(instance["used"][k] + needs[k] <= capacity[k] for k in capacity):
+                break
+        else:
+            instance = {"components": [], "used": dict.fromkeys(capacity, 0)}
+            instances.append(instance)
+        instance["components"].append(component["name"])
+        for k in capacity:
+            instance["used"][k] += needs[k]
+    return {"instance_type": instance_type, "instance_count": len(instances), "capacity": capacity,
+            "instances": instances, "components": components}
+
+
+def plan_components(specs, instance_type, token=None):
+    """Size every component for `instance_type` and pack them; raises ValueError if one cannot fit."""
+    if instance_type not in INSTANCE_CATALOG:
+        raise ValueError(f"Unknown instance type {instance_type}; add it to INSTANCE_CATALOG")
+    return pack_components([size_component(spec, instance_type, token) for spec in specs], instance_type)
+
+
+def print_packing(packing):
+    capacity = packing["capacity"]
+    gpus = capacity["NumberOfAcceleratorDevicesRequired"]
+    print(f"{packing['instance_count']}x {packing['instance_type']} "
+          f"({gpus} GPU(s), {capacity['MinMemoryRequiredInMb'] // 1024} GiB host memory for components each)")
+    for component in packing["components"]:
+        needs, plan = component["requirements"], component["plan"]
+        print(f"  {component['name']}: {component['copies']} copy(ies) x {needs['NumberOfAcceleratorDevicesRequired']} "
+              f"GPU, {needs['MinMemoryRequiredInMb']} MiB, {needs['NumberOfCpuCoresRequired']:g} cores; "
+              f"MAX_TOTAL_TOKENS={plan['max_total_tokens']} (~{plan['full_length_sequences']} sequences in flight)")
+    for i, instance in enumerate(packing["instances"]):
+        used = instance["used"]["NumberOfAcceleratorDevicesRequired"]
+        print(f"  instance {i}: {', '.join(instance['components'])} ({used}/{gpus} GPUs reserved)")
+
+
+# --- Control plane ---
+
+def deployment_requests(packing, endpoint_name, role_arn, image_uri, hf_token=None, max_instance_count=None):
+    """SageMaker API requests for the endpoint config, the endpoint and each (model, inference component)."""
+    count = packing["instance_count"]
+    variant = {
+        "VariantName": VARIANT_NAME,
+        "InstanceType": packing["instance_type"],
+        "InitialInstanceCount": count,
+        # Lets SageMaker add instances when component copies are scaled beyond the packed plan
+        "ManagedInstanceScaling": {"Status": "ENABLED", "MinInstanceCount": count,
+                                   "MaxInstanceCount": max(count, max_instance_count or count)},
+        "RoutingConfig": {"RoutingStrategy": "LEAST_OUTSTANDING_REQUESTS"},
+    }
+    components = []
+    for component in packing["components"]:
+        name = component_name(endpoint_name, component["name"])
+        environment = {"HF_MODEL_ID": component["model_id"], **serving_env(component["plan"])}
+        if hf_token:
+            environment["HF_TOKEN"] = hf_token
+        model = {"ModelName": name, "ExecutionRoleArn": role_arn,
+                 "PrimaryContainer": {"Image": image_uri, "Environment": environment}}
+        inference_component = {
+            "InferenceComponentName": name,
+            "EndpointName": endpoint_name,
+            "VariantName": VARIANT_NAME,
+            "Specification": {
+                "ModelName": name,
+                "StartupParameters": {"ModelDataDownloadTimeoutInSeconds": STARTUP_TIMEOUT_SECONDS,
+                                      "ContainerStartupHealthCheckTimeoutInSeconds": STARTUP_TIMEOUT_SECONDS},
+                "ComputeResourceRequirements": dict(component["requirements"]),
+            },
+            "RuntimeConfig": {"CopyCount": component["copies"]},
+        }
+        components.append((model, inference_component))
+    return {
+        # No model in the variant: models arrive as inference components
+        "endpoint_config": {"EndpointConfigName": endpoint_name, "ExecutionRoleArn": role_arn,
+                            "ProductionVariants": [variant]},
+        "endpoint": {"EndpointName": endpoint_name, "EndpointConfigName": endpoint_name},
+        "components": components,
+    }
+
+
+def describe_or_none(describe, **kwargs):
+    """Describe response, or None when the resource does not exist."""
+    try:
+        return describe(**kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ValidationException" and "Could not find" in e.response["Error"]["Message"]:
+            return None
+        raise
+
+
+def wait_for_status(describe, status_key, poll_seconds, timeout_seconds, gone=False, **kwargs):
+    """Poll until InService (or, with `gone`, until the resource no longer exists)."""
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        response = describe_or_none(describe, **kwargs)
+        if gone and response is None:
+            return None
+        status = response and response.get(status_key)
+        if not gone and status == "InService":
+            return response
+        if status == "Failed":
+            raise RuntimeError(f"{kwargs} failed: {response.get('FailureReason')}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{kwargs} still {status} after {timeout_seconds}s")
+        time.sleep(poll_seconds)
+
+
+def deploy_components(packing, endpoint_name, role_arn, image_uri, sagemaker_client, hf_token=None,
+                      max_instance_count=None, poll_seconds=30, timeout_seconds=STARTUP_TIMEOUT_SECONDS):
+    """Create the shared endpoint and its components; re-running updates the copy counts.
+
+    The client is passed in so it can be stubbed (botocore's Stubber, see `check()`).
+    Returns the inference component names.
+    """
+    requests = deployment_requests(packing, endpoint_name, role_arn, image_uri, hf_token, max_instance_count)
+    if describe_or_none(sagemaker_client.describe_endpoint, EndpointName=endpoint_name) is None:
+        print(f"Creating endpoint {endpoint_name} on {packing['instance_count']}x {packing['instance_type']}...")
+        sagemaker_client.create_endpoint_config(**requests["endpoint_config"])
+        sagemaker_client.create_endpoint(**requests["endpoint"])
+    wait_for_status(sagemaker_client.describe_endpoint, "EndpointStatus", poll_seconds, timeout_seconds,
+                    EndpointName=endpoint_name)
+
+    names = []
+    for model, component in requests["components"]:
+        name, copies = component["InferenceComponentName"], component["RuntimeConfig"]["CopyCount"]
+        existing = describe_or_none(sagemaker_client.describe_inference_component, InferenceComponentName=name)
+        if existing is None:
+            print(f"Creating inference component {name} (CopyCount={copies})...")
+            sagemaker_client.create_model(**model)
+            sagemaker_client.create_inference_component(**component)
+        elif existing.get("RuntimeConfig", {}).get("DesiredCopyCount") != copies:
+            print(f"Setting {name} to {copies} copies...")
+            sagemaker_client.update_inference_component_runtime_config(
+                InferenceComponentName=name, DesiredRuntimeConfig={"CopyCount": copies})
+        names.append(name)
+    for name in names:
+        wait_for_status(sagemaker_client.describe_inference_component, "InferenceComponentStatus", poll_seconds,
+                        timeout_seconds, InferenceComponentName=name)
+    print(f"Endpoint {endpoint_name} serves: {', '.join(names)}")
+    return names
+
+
+def delete_components(endpoint_name, names, sagemaker_client, poll_seconds=30, timeout_seconds=1800):
+    """Delete the components (the endpoint cannot go while they exist), then the endpoint, config and models."""
+    models = []
+    for name in names:
+        existing = describe_or_none(sagemaker_client.describe_inference_component, InferenceComponentName=name)
+        if existing is not None:
+            models.append(existing["Specification"]["ModelName"])
+            sagemaker_client.delete_inference_component(InferenceComponentName=name)
+    for name in names:
+        wait_for_status(sagemaker_client.describe_inference_component, "InferenceComponentStatus", poll_seconds,
+                        timeout_seconds, gone=True, InferenceComponentName=name)
+    endpoint = describe_or_none(sagemaker_client.describe_endpoint, EndpointName=endpoint_name)
+    if endpoint is not None:
+        sagemaker_client.delete_endpoint(EndpointName=endpoint_name)
+        sagemaker_client.delete_endpoint_config(EndpointConfigName=endpoint["EndpointConfigName"])
+    for model in models:
+        sagemaker_client.delete_model(ModelName=model)
+    print(f"Deleted {endpoint_name} and {len(models)} component(s).")
+
+
+# --- Check ---
+
+def check():
+    """Planner sizes, and deploy/redeploy/delete against botocore's Stubber (which validates every request)."""
+    import datetime
+
+    import boto3
+    from botocore.stub import Stubber
+
+    specs = DEFAULT_COMPONENTS
+    # One A10G per model, so one-GPU instances need an instance per model; a 4-GPU instance takes both
+    single = plan_components(specs, "ml.g5.2xlarge")
+    assert single["instance_count"] == 2, single
+    shared = plan_components(specs, "ml.g5.12xlarge")
+    assert shared["instance_count"] == 1 and shared["instances"][0]["used"]["NumberOfAcceleratorDevicesRequired"] == 2
+    gemma = shared["components"][0]
+    assert gemma["requirements"]["NumberOfAcceleratorDevicesRequired"] == 1, gemma
+    assert gemma["requirements"]["MinMemoryRequiredInMb"] > 16 * 1024, gemma  # 8.5B bf16 parameters
+    # Copies fill free GPUs before a second instance is added, then spill over
+    assert plan_components([dict(s, copies=2) for s in specs], "ml.g5.12xlarge")["instance_count"] == 1
+    assert plan_components([dict(s, copies=3) for s in specs], "ml.g5.12xlarge")["instance_count"] == 2
+    # A sequence length one GPU can't hold takes two (tensor parallel); too long for the instance is rejected
+    long_context = size_component(dict(specs[0], min_total_tokens=4096), "ml.g5.12xlarge")
+    assert long_context["requirements"]["NumberOfAcceleratorDevicesRequired"] == 2, long_context
+    try:
+        size_component(specs[0], "ml.g4dn.xlarge")
+        raise AssertionError("gemma-7b should not fit a T4 unquantized")
+    except ValueError:
+        pass
+
+    client = boto3.client("sagemaker", region_name="us-east-1", aws_access_key_id="stub", aws_secret_access_key="stub")
+    stubber = Stubber(client)
+    now = datetime.datetime(2026, 1, 1)
+    endpoint, role, image = "shared-llms", "arn:aws:iam::123456789012:role/sm", "763104351884.dkr.ecr/tgi:2.2.0"
+    names = [component_name(endpoint, s["name"]) for s in specs]
+    arn = "arn:aws:sagemaker:us-east-1:123456789012:"
+    not_found = {"service_error_code": "ValidationException", "service_message": "Could not find it."}
+
+    def endpoint_response(status):
+        return {"EndpointName": endpoint, "EndpointArn": arn + "endpoint/" + endpoint, "EndpointStatus": status,
+                "EndpointConfigName": endpoint, "CreationTime": now, "LastModifiedTime": now}
+
+    def component_response(name, status, copies):
+        return {"InferenceComponentName": name, "InferenceComponentArn": arn + "inference-component/" + name,
+                "EndpointName": endpoint, "EndpointArn": arn + "endpoint/" + endpoint, "CreationTime": now,
+                "LastModifiedTime": now, "InferenceComponentStatus": status, "Specification": {"ModelName": name},
+                "RuntimeConfig": {"DesiredCopyCount": copies, "CurrentCopyCount": copies}}
+
+    requests = deployment_requests(shared, endpoint, role, image, "hf_token")
+    variant = requests["endpoint_config"]["ProductionVariants"][0]
+    assert "ModelName" not in variant and variant["InitialInstanceCount"] == 1, variant
+    assert requests["components"][0][0]["PrimaryContainer"]["Environment"]["SM_NUM_GPUS"] == "1"
+
+    # 1. Fresh deploy: endpoint, then a model and a component per model, then wait for each
+    stubber.add_client_error("describe_endpoint", **not_found)
+    stubber.add_response("create_endpoint_config", {"EndpointConfigArn": arn + "endpoint-config/x"},
+                         requests["endpoint_config"])
+    stubber.add_response("create_endpoint", {"EndpointArn": arn + "endpoint/x"}, requests["endpoint"])
+    stubber.add_response("describe_endpoint", endpoint_response("Creating"), {"EndpointName": endpoint})
+    stubber.add_response("describe_endpoint", endpoint_response("InService"), {"EndpointName": endpoint})
+    for model, component in requests["components"]:
+        stubber.add_client_error("describe_inference_component", **not_found)
+        stubber.add_response("create_model", {"ModelArn": arn + "model/x"}, model)
+        stubber.add_response("create_inference_component", {"InferenceComponentArn": arn + "ic/x"}, component)
+    for name in names:
+        stubber.add_response("describe_inference_component", component_response(name, "InService", 1))
+    with stubber:
+        assert deploy_components(shared, endpoint, role, image, client, "hf_token", poll_seconds=0) == names
+        stubber.assert_no_pending_responses()
+
+    # 2. Re-run with two Gemma copies: only the copy count changes
+    scaled = plan_components([dict(specs[0], copies=2), specs[1]], "ml.g5.12xlarge")
+    stubber.add_response("describe_endpoint", endpoint_response("InService"))
+    stubber.add_response("describe_endpoint", endpoint_response("InService"))
+    stubber.add_response("describe_inference_component", component_response(names[0], "InService", 1))
+    stubber.add_response("update_inference_component_runtime_config", {"InferenceComponentArn": arn + "ic/x"},
+                         {"InferenceComponentName": names[0], "DesiredRuntimeConfig": {"CopyCount": 2}})
+    stubber.add_response("describe_inference_component", component_response(names[1], "InService", 1))
+    stubber.add_response("describe_inference_component", component_response(names[0], "Updating", 2))
+    stubber.add_response("describe_inference_component", component_response(names[0], "InService", 2))
+    stubber.add_response("describe_inference_component", component_response(names[1], "InService", 1))
+    with stubber:
+        deploy_components(scaled, endpoint, role, image, client, "hf_token", poll_seconds=0)
+        stubber.assert_no_pending_responses()
+
+    # 3. Delete: components first, then the endpoint, its config and the models
+    for name in names:
+        stubber.add_response("describe_inference_component", component_response(name, "InService", 1))
+        stubber.add_response("delete_inference_component", {}, {"InferenceComponentName": name})
+    for name in names:
+        stubber.add_response("describe_inference_component", component_response(name, "Deleting", 1))
+        stubber.add_client_error("describe_inference_component", **not_found)
+    stubber.add_response("describe_endpoint", endpoint_response("InService"))
+    stubber.add_response("delete_endpoint", {}, {"EndpointName": endpoint})
+    stubber.add_response("delete_endpoint_config", {}, {"EndpointConfigName": endpoint})
+    for name in names:
+        stubber.add_response("delete_model", {}, {"ModelName": name})
+    with stubber:
+        delete_components(endpoint, names, client, poll_seconds=0)
+        stubber.assert_no_pending_responses()
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack several models onto one endpoint as inference components.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser("plan", help="Size the components and pack them onto instances")
+    plan_parser.add_argument("--instance-type", default="ml.g5.12xlarge")
+    plan_parser.add_argument("--compare", nargs="+", default=None, metavar="INSTANCE_TYPE",
+                             help="Plan for each of these instance types instead")
+
+    deploy_parser = commands.add_parser("deploy", help="Create or update the shared endpoint")
+    deploy_parser.add_argument("--endpoint-name", required=True)
+    deploy_parser.add_argument("--instance-type", default="ml.g5.12xlarge")
+    deploy_parser.add_argument("--max-instance-count", type=int, default=None)
+    deploy_parser.add_argument("--image-uri", default=os.environ.get("TGI_IMAGE_URI"),
+                               help="Default: the Hugging Face TGI 2.2.0 image from the SageMaker SDK")
+    deploy_parser.add_argument("--dry-run", action="store_true", help="Print the requests without sending them")
+
+    delete_parser = commands.add_parser("delete", help="Delete the endpoint and its components")
+    delete_parser.add_argument("--endpoint-name", required=True)
+
+    commands.add_parser("check", help="Verify the planner and the control-plane calls against a stub")
+    args = parser.parse_args()
+
+    specs = components_from_env()
+    hf_token = os.environ.get("HF_TOKEN")
+    if args.command == "check":
+        check()
+    elif args.command == "plan":
+        for instance_type in args.compare or [args.instance_type]:
+            try:
+                print_packing(plan_components(specs, instance_type, hf_token))
+            except ValueError as e:
+                print(f"{instance_type}: {e}")
+    else:
+        import boto3
+
+        session = boto3.Session()
+        names = [component_name(args.endpoint_name, spec["name"]) for spec in specs]
+        if args.command == "delete":
+            delete_components(args.endpoint_name, names, session.client("sagemaker"))
+        else:
+            packing = plan_components(specs, args.instance_type, hf_token)
+            print_packing(packing)
+            image_uri = args.image_uri
+            if not image_uri:
+                from sagemaker.huggingface import get_huggingface_llm_image_uri
+
+                image_uri = get_huggingface_llm_image_uri("huggingface", version="2.2.0",
+                                                          region=session.region_name)
+            role_arn = os.environ.get("SAGEMAKER_ROLE_ARN")
+            if args.dry_run:
+                requests = deployment_requests(packing, args.endpoint_name, role_arn, image_uri,
+                                               "<HF_TOKEN>" if hf_token else None, args.max_instance_count)
+                print(json.dumps(requests, indent=2))
+            else:
+                deploy_components(packing, args.endpoint_name, role_arn, image_uri, session.client("sagemaker"),
+                                  hf_token, args.max_instance_count)
@@ -0,0 +1,371 @@
+# %% [markdown]
+# ## Local SageMaker Endpoint Stand-in
+# A small HTTP server that speaks the SageMaker Runtime REST API
+# (`InvokeEndpoint` and `InvokeEndpointWithResponseStream`), so the agent, the
+# HTTP serving layer and the benchmarks can run without a deployed endpoint.
+#
+# Point any boto3 `sagemaker-runtime` client at it with `endpoint_url`:
+#
+#     python local_endpoint_standin.py --port 8081 --latency-ms 200 --token-ms 20
+#
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     client = boto3.client("sagemaker-runtime", region_name="us-east-1",
+#                           endpoint_url="http://127.0.0.1:8081")
+#
+# Chat-style payloads (`{"messages": [...]}`) get OpenAI-compatible responses,
+# TGI-style payloads (`{"inputs": ...}`) get `[{"generated_text": ...}]`.
+# A sampling `temperature` swaps a `temperature / 2` fraction of the words at
+# random, so evaluation scores drop as it rises (see eval_harness.py).
+#
+# Behaviour can be changed while running, e.g. to inject an outage:
+#
+#     curl -X POST localhost:8081/admin/settings -d '{"error_rate": 1.0}'
+#
+# To mimic a freshly deployed endpoint, the first `--cold-requests` requests
+# take up to `--cold-ms` longer, decaying linearly to zero.
+#
+# With `--async-output s3://bucket/prefix` it also serves `InvokeEndpointAsync`:
+# inputs are read from S3 (e.g. moto), results are written to
+# `{output}/{inference id}.out` and optionally announced on SNS topics.
+#
+# With `--inference-components a,b` it behaves like an endpoint hosting inference
+# components: every invocation must name one of them in `InferenceComponentName`.
+
+# %%
+import argparse
+import datetime
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+DEFAULT_PORT = 8081
+WORDS = (
+    "SageMaker hosts the model on managed GPU instances and scales the endpoint "
+    "with traffic while LangGraph keeps the conversation state between turns"
+).split()
+
+ROUTE = re.compile(
+    r"^/endpoints/(?P<endpoint>[^/]+)/(?P<action>invocations|invocations-response-stream|async-invocations)$"
+)
+
+
+class StandinSettings:
+    """Behaviour of the stand-in; shared by all handler threads."""
+
+    ADJUSTABLE = ("latency_ms", "token_ms", "tokens", "error_rate", "cold_requests", "cold_ms")
+
+    def __init__(self, latency_ms=100.0, token_ms=10.0, tokens=64, error_rate=0.0, seed=None, cold_requests=0,
+                 cold_ms=0.0):
+        self.latency_ms = latency_ms  # Time to first token
+        self.token_ms = token_ms  # Time per generated token
+        self.tokens = tokens  # Tokens generated unless the request asks for fewer
+        self.error_rate = error_rate  # Fraction of requests answered with a 5xx
+        self.cold_requests = cold_requests  # Requests slowed down after startup, like a fresh TGI endpoint
+        self.cold_ms = cold_ms  # Extra latency of the first request, decaying to 0 over cold_requests
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def update(self, changes):
+        with self.lock:
+            for name, value in changes.items():
+                if name not in self.ADJUSTABLE:
+                    raise ValueError(f"Unknown setting: {name}")
+                setattr(self, name, type(getattr(self, name))(value))
+            return self.snapshot()
+
+    def snapshot(self):
+        return {name: getattr(self, name) for name in self.ADJUSTABLE}
+
+    def next_request(self):
+        with self.lock:
+            self.requests += 1
+            return self.requests, self.random.random() < self.error_rate
+
+    def cold_penalty_ms(self, request_number):
+        if request_number > self.cold_requests:
+            return 0.0
+        return self.cold_ms * (self.cold_requests - request_number + 1) / self.cold_requests
+
+
+def encode_event(payload, event_type="PayloadPart"):
+    """Encode one AWS event-stream message (as parsed by botocore's EventStream)."""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":message-type", "event"),
+                        (":content-type", "application/octet-stream")):
+        name, value = name.encode(), value.encode()
+        headers += struct.pack(">B", len(name)) + name + b"\x07" + struct.pack(">H", len(value)) + value
+    prelude = struct.pack(">II", 12 + len(headers) + len(payload) + 4, len(headers))
+    message = prelude + struct.pack(">I", zlib.crc32(prelude)) + headers + payload
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+def _requested_tokens(request, default):
+    parameters = request.get("parameters") or {}
+    limit = request.get("max_tokens") or parameters.get("max_new_tokens") or default
+    return max(1, min(int(limit), default))
+
+
+def _temperature(request):
+    parameters = request.get("parameters") or {}
+    if parameters.get("do_sample") is False:
+        return 0.0
+    return float(request.get("temperature") or parameters.get("temperature") or 0.0)
+
+
+def _generate(count, temperature=0.0, rng=None):
+    noise = min(1.0, temperature / 2) if rng else 0.0
+    words = [rng.choice(WORDS) if noise and rng.random() < noise else WORDS[i % len(WORDS)] for i in range(count)]
+    return [(" " if i else "") + word for i, word in enumerate(words)]
+
+
+def _chat_response(tokens):
+    return {
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "length",
+                     "message": {"role": "assistant", "content": "".join(tokens)}}],
+        "usage": {"completion_tokens": len(tokens)},
+    }
+
+
+def _response_body(request, tokens):
+    if "messages" in request:
+        return _chat_response(tokens)
+    return [{"generated_text": "".join(tokens)}]
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class AsyncStandin:
+    """`InvokeEndpointAsync` side of the stand-in: S3 in, S3 out, optional SNS notifications."""
+
+    def __init__(self, s3_client, output_path, failure_path=None, max_concurrent=4, sns_client=None,
+                 success_topic=None, error_topic=None):
+        self.s3 = s3_client
+        self.output_path = output_path.rstrip("/")
+        self.failure_path = (failure_path or output_path).rstrip("/")
+        # Like MaxConcurrentInvocationsPerInstance: the rest waits in the internal queue
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="async-standin")
+        self.sns = sns_client
+        self.success_topic = success_topic
+        self.error_topic = error_topic
+
+    def accept(self, settings, endpoint, headers):
+        """Queue one invocation; returns (inference id, output location, failure location)."""
+        inference_id = headers.get("X-Amzn-SageMaker-Inference-Id") or str(uuid.uuid4())
+        output = f"{self.output_path}/{inference_id}.out"
+        failure = f"{self.failure_path}/{inference_id}-error.out"
+        request_parameters = {
+            "endpointName": endpoint,
+            "inputLocation": headers["X-Amzn-SageMaker-InputLocation"],
+            "contentType": headers.get("X-Amzn-SageMaker-Content-Type", "application/json"),
+        }
+        self.executor.submit(self._process, settings, inference_id, request_parameters, output, failure)
+        return inference_id, output, failure
+
+    def _process(self, settings, inference_id, request_parameters, output, failure):
+        received = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        try:
+            bucket, key = _split_s3_uri(request_parameters["inputLocation"])
+            request = json.loads(self.s3.get_object(Bucket=bucket, Key=key)["Body"].read() or b"{}")
+            _, failed = settings.next_request()
+            time.sleep(settings.latency_ms / 1000.0)
+            if failed:
+                raise RuntimeError("Injected failure from local stand-in")
+            tokens = _generate(_requested_tokens(request, settings.tokens))
+            time.sleep(len(tokens) * settings.token_ms / 1000.0)
+            bucket, key = _split_s3_uri(output)
+            self.s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(_response_body(request, tokens)).encode())
+            self._notify(self.success_topic, inference_id, received, request_parameters, {
+                "invocationStatus": "Completed",
+                "responseParameters": {"contentType": "application/json", "outputLocation": output},
+            })
+        except Exception as e:
+            bucket, key = _split_s3_uri(failure)
+            self.s3.put_object(Bucket=bucket, Key=key, Body=str(e).encode())
+            self._notify(self.error_topic, inference_id, received, request_parameters,
+                         {"invocationStatus": "Failed", "failureReason": str(e)})
+
+    def _notify(self, topic, inference_id, received, request_parameters, status):
+        if not (self.sns and topic):
+            return
+        message = {
+            "eventVersion": "1.0", "eventSource": "aws:sagemaker", "eventName": "InferenceResult",
+            "eventTime": datetime.datetime.now(datetime.timezone.utc).isoformat(), "receivedTime": received,
+            "inferenceId": inference_id, "requestParameters": request_parameters, **status,
+        }
+        self.sns.publish(TopicArn=topic, Message=json.dumps(message))
+
+
+def _stream_record(request, token):
+    if "messages" in request:
+        record = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": token}}]}
+    else:
+        record = {"token": {"text": token, "special": False}}
+    return b"data: " + json.dumps(record).encode() + b"\n\n"
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real runtime endpoint
+    settings = StandinSettings()
+    async_backend = None
+    inference_components = None
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, error_type, message):
+        self._send_json(status, {"message": message}, {"x-amzn-ErrorType": error_type})
+
+    def do_GET(self):
+        if self.path == "/admin/settings":
+            self._send_json(200, self.settings.snapshot())
+        else:
+            self._send_error(404, "ValidationError", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        match = ROUTE.match(self.path.split("?")[0])
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/admin/settings":
+            try:
+                self._send_json(200, self.settings.update(json.loads(body or b"{}")))
+            except (ValueError, TypeError) as e:
+                self._send_error(400, "ValidationError", str(e))
+            return
+        if not match:
+            self._send_error(404, "ValidationError", f"Unknown path {self.path}")
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "ValidationError", "Body is not valid JSON")
+            return
+
+        component = self.headers.get("X-Amzn-SageMaker-Inference-Component")
+        if self.inference_components is not None and component not in self.inference_components:
+            self._send_error(400, "ValidationError", f"Inference Component {component} not found on endpoint"
+                             if component else "Inference Component Name header is required for endpoints "
+                                               "to which you plan to deploy inference components")
+            return
+
+        settings = self.settings
+        if match.group("action") == "async-invocations":
+            if not self.async_backend:
+                self._send_error(400, "ValidationError", "Start the stand-in with --async-output for async inference")
+            elif "X-Amzn-SageMaker-InputLocation" not in self.headers:
+                self._send_error(400, "ValidationError", "InputLocation is required")
+            else:
+                inference_id, output, failure = self.async_backend.accept(settings, match.group("endpoint"),
+                                                                          self.headers)
+                self._send_json(202, {"InferenceId": inference_id}, {
+                    "X-Amzn-SageMaker-OutputLocation": output, "X-Amzn-SageMaker-FailureLocation": failure,
+                })
+            return
+
+        request_number, failed = settings.next_request()
+        time.sleep((settings.latency_ms + settings.cold_penalty_ms(request_number)) / 1000.0)
+        if failed:
+            self._send_error(503, "ServiceUnavailable", "Injected failure from local stand-in")
+            return
+
+        tokens = _generate(_requested_tokens(request, settings.tokens), _temperature(request),
+                           random.Random(request_number))
+        if match.group("action") == "invocations":
+            time.sleep(len(tokens) * settings.token_ms / 1000.0)
+            try:
+                self._send_json(200, _response_body(request, tokens))
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # Client timed out first
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("X-Amzn-SageMaker-Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(settings.token_ms / 1000.0)
+                event = encode_event(_stream_record(request, token))
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream (e.g. turn deadline reached)
+            self.close_connection = True
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, settings=None, async_backend=None, inference_components=None):
+    """Start the stand-in on a background thread and return the server."""
+    handler = type("ConfiguredStandinHandler", (StandinHandler,), {
+        "settings": settings or StandinSettings(), "async_backend": async_backend,
+        "inference_components": set(inference_components) if inference_components is not None else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for a SageMaker real-time endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Time to first token")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Time per generated token")
+    parser.add_argument("--tokens", type=int, default=64, help="Max tokens generated per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--cold-requests", type=int, default=0, help="Slow requests after startup")
+    parser.add_argument("--cold-ms", type=float, default=0.0, help="Extra latency of the first cold request")
+    parser.add_argument("--async-output", default=None, help="s3:// output path; enables InvokeEndpointAsync")
+    parser.add_argument("--async-failure", default=None, help="s3:// failure path (default: the output path)")
+    parser.add_argument("--async-concurrency", type=int, default=4, help="Concurrent async invocations")
+    parser.add_argument("--aws-endpoint-url", default=None, help="S3/SNS stand-in for async mode, e.g. moto")
+    parser.add_argument("--sns-success-topic", default=None)
+    parser.add_argument("--sns-error-topic", default=None)
+    parser.add_argument("--inference-components", default=None,
+                        help="Comma-separated component names; invocations must target one of them")
+    args = parser.parse_args()
+
+    settings = StandinSettings(args.latency_ms, args.token_ms, args.tokens, args.error_rate, args.seed,
+                               args.cold_requests, args.cold_ms)
+    async_backend = None
+    if args.async_output:
+        import boto3
+
+        session = boto3.Session(region_name="us-east-1")
+        async_backend = AsyncStandin(
+            session.client("s3", endpoint_url=args.aws_endpoint_url), args.async_output, args.async_failure,
+            args.async_concurrency, session.client("sns", endpoint_url=args.aws_endpoint_url),
+            args.sns_success_topic, args.sns_error_topic,
+        )
+    components = args.inference_components.split(",") if args.inference_components else None
+    server = serve(args.host, args.port, settings, async_backend, components)
+    print(f"Local endpoint stand-in listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("Shutting down stand-in...")
+        server.shutdown()
@@ -0,0 +1,309 @@
+# %% [markdown]
+# ## Streaming Model Packaging and Parallel Multipart Upload
+# Packages a saved model directory straight into S3 without writing a local
+# `model.tar.gz` first: the tar stream is cut into parts that are uploaded in
+# parallel while the next parts are still being produced. Memory stays bounded
+# at roughly `(workers + 1) * part_size`.
+#
+# Output formats:
+# - `tar.gz`: tar compressed with parallel gzip (one gzip member per block,
+#   which `tar`, Python's `tarfile` and SageMaker all read as a normal .tar.gz)
+# - `tar`: uncompressed tar, no compression cost at all (for hosts that untar
+#   the artifact themselves; SageMaker's `ModelDataUrl` expects a .tar.gz)
+# - `prefix`: the files uploaded one by one under an S3 prefix, for
+#   `ModelDataSource` with `CompressionType: None` (no extraction on the
+#   endpoint, fastest container load)
+#
+# Run against a local S3 stand-in with `--endpoint-url`, e.g. moto:
+#
+#     moto_server -p 5000 &
+#     export AWS_ACCESS_KEY_ID=testing AWS_SECRET_ACCESS_KEY=testing
+#     python stream_model_artifacts.py --model-dir /tmp/model --bucket my-bucket \
+#         --key model-artifacts/dialogpt/model.tar.gz --endpoint-url http://127.0.0.1:5000
+
+# %%
+import argparse
+import gzip
+import os
+import shutil
+import tarfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+# --- Configuration ---
+MiB = 1024 * 1024
+DEFAULT_PART_SIZE = 32 * MiB
+MIN_PART_SIZE = 5 * MiB  # S3 minimum for every part but the last
+MAX_PARTS = 10000
+DEFAULT_WORKERS = 8
+GZIP_BLOCK_SIZE = 16 * MiB
+FORMATS = ("tar.gz", "tar", "prefix")
+
+
+class MultipartUploadWriter:
+    """Write-only file object that uploads to S3 as parallel multipart parts.
+
+    Objects smaller than one part are sent with a single `put_object`. Use as a
+    context manager: the upload is completed on success and aborted on error.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=DEFAULT_PART_SIZE, executor=None,
+                 max_workers=DEFAULT_WORKERS, extra_args=None):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.extra_args = extra_args or {}
+        self.bytes_written = 0
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-part")
+        # Bounds buffered parts (and so memory) to the number of upload workers
+        self._slots = threading.Semaphore(max_workers)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+        return len(data)
+
+    def _submit(self, data):
+        if self._upload_id is None:
+            response = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.extra_args)
+            self._upload_id = response["UploadId"]
+        part_number = len(self._futures) + 1
+        if part_number > MAX_PARTS:
+            raise ValueError(f"More than {MAX_PARTS} parts; increase part_size")
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+        self._slots.acquire()
+        future = self._executor.submit(self._upload_part, part_number, data)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number, data):
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=data
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        """Upload what is left and complete the multipart upload."""
+        if self._closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self.extra_args)
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                self.s3.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": parts}
+                )
+        except Exception:
+            self.abort()
+            raise
+        self._closed = True
+        self._buffer = bytearray()
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """Cancel the upload so no orphaned parts are left (and billed) in the bucket."""
+        self._closed = True
+        for future in self._futures:
+            future.cancel()
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+        if self._upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                print(f"Could not abort multipart upload {self._upload_id}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ParallelGzipWriter:
+    """Compresses fixed-size blocks on a thread pool (zlib releases the GIL) and
+    writes them, in order, to `raw` as concatenated gzip members."""
+
+    def __init__(self, raw, level=6, block_size=GZIP_BLOCK_SIZE, workers=None):
+        self.raw = raw
+        self.level = level
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 4
+        self.bytes_written = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gzip")
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._pending.append(self._executor.submit(gzip.compress, block, self.level, mtime=0))
+            self._drain(self.workers * 2)
+        return len(data)
+
+    def _drain(self, keep):
+        while self._pending and (len(self._pending) > keep or self._pending[0].done()):
+            self.raw.write(self._pending.popleft().result())
+
+    def close(self):
+        """Flush the last block; does not close `raw`."""
+        if self._closed:
+            return
+        try:
+            if self._buffer or not self.bytes_written:
+                self._pending.append(self._executor.submit(gzip.compress, bytes(self._buffer), self.level, mtime=0))
+                self._buffer = bytearray()
+            self._drain(0)
+        except BaseException:
+            self.abort()
+            raise
+        self._closed = True
+        self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """Drop pending blocks and stop the workers, e.g. when the tar stream or the upload failed."""
+        self._closed = True
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._buffer = bytearray()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def make_s3_client(endpoint_url=None, region_name=None, max_workers=DEFAULT_WORKERS):
+    session = boto3.Session(region_name=region_name)
+    return session.client("s3", endpoint_url=endpoint_url,
+                          config=Config(max_pool_connections=max_workers + 2, retries={"mode": "adaptive"}))
+
+
+def _report(label, source_bytes, uploaded_bytes, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats = {
+        "source_bytes": source_bytes,
+        "uploaded_bytes": uploaded_bytes,
+        "seconds": elapsed,
+        "source_bytes_per_second": source_bytes / elapsed,
+        "uploaded_bytes_per_second": uploaded_bytes / elapsed,
+    }
+    print(f"{label}: {source_bytes / MiB:.1f} MiB -> {uploaded_bytes / MiB:.1f} MiB in {elapsed:.2f}s "
+          f"({stats['source_bytes_per_second'] / MiB:.1f} MiB/s packaged, "
+          f"{stats['uploaded_bytes_per_second'] / MiB:.1f} MiB/s uploaded)")
+    return stats
+
+
+def _tar_filter(include):
+    if include is None:
+        return None
+    return lambda info: info if info.isdir() or include(os.path.normpath(info.name).replace(os.sep, "/")) else None
+
+
+def package_model_dir(model_dir, s3_client, bucket, key, fmt="tar.gz", part_size=DEFAULT_PART_SIZE,
+                      workers=DEFAULT_WORKERS, compression_level=6, compression_workers=None, include=None):
+    """Stream `model_dir` to `s3://bucket/key` as tar / tar.gz, or as files under the prefix `key`.
+
+    Returns byte counts and throughput. For `prefix`, `key` is the S3 prefix.
+    `include(relative_path)` can restrict which files are packaged.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+    started = time.perf_counter()
+
+    if fmt == "prefix":
+        prefix = key.rstrip("/") + "/"
+        source_bytes = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-part") as executor:
+            for root, _, files in os.walk(model_dir):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, model_dir).replace(os.sep, "/")
+                    if include and not include(relative):
+                        continue
+                    with open(path, "rb") as source, \
+                            MultipartUploadWriter(s3_client, bucket, prefix + relative, part_size, executor,
+                                                  max_workers=workers) as sink:
+                        shutil.copyfileobj(source, sink, MiB)
+                    source_bytes += sink.bytes_written
+        return _report(f"s3://{bucket}/{prefix}", source_bytes, source_bytes, started)
+
+    with MultipartUploadWriter(s3_client, bucket, key, part_size, max_workers=workers) as sink:
+        compressor = None
+        stream = sink
+        if fmt == "tar.gz":
+            compressor = stream = ParallelGzipWriter(sink, compression_level, workers=compression_workers)
+        try:
+            # "w|" writes a pure stream: no seeking, nothing staged on disk
+            with tarfile.open(fileobj=stream, mode="w|") as tar:
+                tar.add(model_dir, arcname=".", filter=_tar_filter(include))
+            source_bytes = compressor.bytes_written if compressor else sink.bytes_written
+            if compressor:
+                compressor.close()
+        except BaseException:
+            # The sink aborts its multipart upload on the way out; the compressor's workers stop here
+            if compressor:
+                compressor.abort()
+            raise
+    return _report(f"s3://{bucket}/{key}", source_bytes, sink.bytes_written, started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a model directory into S3 as tar, tar.gz or a file prefix.")
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--key", required=True, help="Object key (tar, tar.gz) or key prefix (prefix)")
+    parser.add_argument("--format", choices=FORMATS, default="tar.gz")
+    parser.add_argument("--part-size-mb", type=int, default=DEFAULT_PART_SIZE // MiB)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel part uploads")
+    parser.add_argument("--compression-level", type=int, default=6)
+    parser.add_argument("--compression-workers", type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument("--endpoint-url", default=os.environ.get("S3_ENDPOINT_URL"), help="e.g. a moto server")
+    parser.add_argument("--region", default=None)
+    args = parser.parse_args()
+
+    s3 = make_s3_client(args.endpoint_url, args.region, args.workers)
+    package_model_dir(args.model_dir, s3, args.bucket, args.key, args.format, args.part_size_mb * MiB,
+                      args.workers, args.compression_level, args.compression_workers)
@@ -0,0 +1,288 @@
+# %% [markdown]
+# ## TGI Serving Parameters
+# Sizes Text Generation Inference token limits from a model's `config.json` and
+# the GPU memory of the instance type, instead of hard-coding them per model:
+#
+#     weights   = parameters x bytes per parameter (after quantization)
+#     kv/token  = 2 (K and V) x layers x KV heads x head dim x bytes per element
+#     budget    = GPU memory x (1 - safety margin) - runtime overhead - weights
+#     budget   >= max batch total tokens x kv/token
+#                 + max batch prefill tokens x (activations/token + vocab x 4)
+#                 + max concurrent requests x vocab x 4
+#
+# Logits are float32. TGI's warmup and prefill can materialize them for every
+# prefill token, and decoding needs them for each sequence's last token; with
+# Gemma's 256k vocabulary that is 1 MB per prefill token.
+#
+# The largest `MAX_TOTAL_TOKENS` (up to the model's context) is chosen whose
+# prefill fits the budget and whose KV cache holds one full-length sequence and
+# `TGI_MIN_SEQUENCES` full-length prompts at once, so requests still batch. `MAX_BATCH_TOTAL_TOKENS` is reported, not set:
+# TGI measures it during warmup for flash-attention models and ignores the variable.
+#
+#     python tgi_serving_params.py --model-id google/gemma-7b --instance-type ml.g5.2xlarge
+#     python tgi_serving_params.py --check   # bundled configs against hand-computed values
+#
+# Callers size `max_new_tokens` with `fit_max_new_tokens()`: TGI answers 422 when
+# prompt + max_new_tokens exceeds `MAX_TOTAL_TOKENS`.
+
+# %%
+import argparse
+import json
+import math
+import os
+
+# --- Configuration ---
+GiB = 1024 ** 3
+SAFETY_MARGIN = float(os.environ.get("TGI_SAFETY_MARGIN", "0.10"))  # Fraction of GPU memory left unused
+RUNTIME_OVERHEAD_GIB = float(os.environ.get("TGI_RUNTIME_OVERHEAD_GIB", "1.5"))  # CUDA context, NCCL, allocator, per GPU
+MAX_TOTAL_TOKENS_CAP = int(os.environ.get("TGI_MAX_TOTAL_TOKENS", "8192"))  # Don't size for the full 128k context
+MAX_NEW_TOKENS = int(os.environ.get("TGI_MAX_NEW_TOKENS", "1024"))  # Room kept for generation in MAX_TOTAL_TOKENS
+PREFILL_TOKENS_TARGET = int(os.environ.get("TGI_MAX_BATCH_PREFILL_TOKENS", "4096"))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("TGI_MAX_CONCURRENT_REQUESTS", "128"))  # TGI's default
+CHARS_PER_TOKEN = 3  # Tokenizer-free prompt estimate; English runs ~4 characters/token, so this over-counts
+TEMPLATE_TOKENS_PER_MESSAGE = 8  # Role markers and separators added by a chat template
+MIN_SEQUENCES = int(os.environ.get("TGI_MIN_SEQUENCES", "2"))  # Full-length prompts the KV cache must hold
+MIN_TOTAL_TOKENS = 256
+BLOCK_SIZE = 16  # Paged-attention block size; batch token budgets are whole blocks
+
+DTYPE_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2}
+# Bytes per weight for TGI's `QUANTIZE` options (None keeps the config dtype)
+QUANTIZE_BYTES = {"fp8": 1, "eetq": 1, "bitsandbytes": 1, "awq": 0.5, "gptq": 0.5, "bitsandbytes-nf4": 0.5,
+                  "bitsandbytes-fp4": 0.5}
+
+# GPUs per instance and usable memory per GPU in GiB (nvidia-smi total, rounded down)
+GPUS = {"T4": 14.5, "A10G": 22.0, "L4": 22.0, "L40S": 44.5, "A100-40GB": 39.4, "A100-80GB": 79.1, "H100": 79.1}
+INSTANCE_CATALOG = {
+    **{f"ml.g4dn.{size}": (1, "T4") for size in ("xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge")},
+    "ml.g4dn.12xlarge": (4, "T4"),
+    **{f"ml.g5.{size}": (1, "A10G") for size in ("xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge")},
+    "ml.g5.12xlarge": (4, "A10G"),
+    "ml.g5.24xlarge": (4, "A10G"),
+    "ml.g5.48xlarge": (8, "A10G"),
+    **{f"ml.g6.{size}": (1, "L4") for size in ("xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge")},
+    "ml.g6.12xlarge": (4, "L4"),
+    "ml.g6.24xlarge": (4, "L4"),
+    "ml.g6.48xlarge": (8, "L4"),
+    **{f"ml.g6e.{size}": (1, "L40S") for size in ("xlarge", "2xlarge", "4xlarge", "8xlarge", "16xlarge")},
+    "ml.g6e.12xlarge": (4, "L40S"),
+    "ml.g6e.24xlarge": (4, "L40S"),
+    "ml.g6e.48xlarge": (8, "L40S"),
+    "ml.p4d.24xlarge": (8, "A100-40GB"),
+    "ml.p4de.24xlarge": (8, "A100-80GB"),
+    "ml.p5.48xlarge": (8, "H100"),
+}
+
+# The fields of config.json the calculator uses, for models deployed by this repo
+BUNDLED_CONFIGS = {
+    "google/gemma-7b": {
+        "model_type": "gemma", "hidden_size": 3072, "intermediate_size": 24576, "num_hidden_layers": 28,
+        "num_attention_heads": 16, "num_key_value_heads": 16, "head_dim": 256, "vocab_size": 256000,
+        "max_position_embeddings": 8192, "tie_word_embeddings": True, "torch_dtype": "bfloat16",
+    },
+    "deepseek-ai/DeepSeek-R1-Distill-Llama-8B": {
+        "model_type": "llama", "hidden_size": 4096, "intermediate_size": 14336, "num_hidden_layers": 32,
+        "num_attention_heads": 32, "num_key_value_heads": 8, "vocab_size": 128256,
+        "max_position_embeddings": 131072, "tie_word_embeddings": False, "torch_dtype": "bfloat16",
+    },
+}
+
+
+def load_model_config(model, token=None):
+    """`config.json` from a local file or directory, the bundled configs, or the Hugging Face Hub."""
+    path = os.path.join(model, "config.json") if os.path.isdir(model) else model
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+    if model in BUNDLED_CONFIGS:
+        return dict(BUNDLED_CONFIGS[model])
+    try:
+        from huggingface_hub import hf_hub_download
+    except ImportError:
+        raise ValueError(f"No bundled config for {model}; install huggingface_hub or pass a config.json path")
+    with open(hf_hub_download(model, "config.json", token=token)) as f:
+        return json.load(f)
+
+
+def model_shape(config):
+    """Normalized dimensions, parameter count and per-token sizes for a decoder-only config."""
+    hidden = config["hidden_size"]
+    heads = config["num_attention_heads"]
+    head_dim = config.get("head_dim") or hidden // heads
+    kv_heads = config.get("num_key_value_heads") or heads
+    layers = config["num_hidden_layers"]
+    intermediate = config.get("intermediate_size") or 4 * hidden
+    vocab = config["vocab_size"]
+    dtype = config.get("torch_dtype") or "float16"
+    if dtype not in DTYPE_BYTES:
+        raise ValueError(f"Unsupported torch_dtype {dtype}")
+
+    attention = hidden * (heads + 2 * kv_heads) * head_dim + heads * head_dim * hidden
+    mlp = 3 * hidden * intermediate  # Gated MLP: gate, up and down projections
+    embeddings = vocab * hidden * (1 if config.get("tie_word_embeddings") else 2)
+    return {
+        "hidden": hidden, "heads": heads, "head_dim": head_dim, "kv_heads": kv_heads, "layers": layers,
+        "intermediate": intermediate, "vocab": vocab, "dtype": dtype, "dtype_bytes": DTYPE_BYTES[dtype],
+        "max_position_embeddings": config.get("max_position_embeddings") or MAX_TOTAL_TOKENS_CAP,
+        "parameters": layers * (attention + mlp) + embeddings,
+        "kv_bytes_per_token": 2 * layers * kv_heads * head_dim * DTYPE_BYTES[dtype],
+        # Peak temporaries of one layer during prefill: gate/up outputs, QKV, residual and norm buffers
+        "prefill_bytes_per_token": DTYPE_BYTES[dtype] * (2 * intermediate + (heads + 2 * kv_heads) * head_dim + 4 * hidden),
+    }
+
+
+def _round_down(value, multiple):
+    return int(value // multiple * multiple)
+
+
+def plan_serving_params(config, instance_type, num_gpus=None, quantize=None, safety_margin=SAFETY_MARGIN,
+                        max_total_tokens=MAX_TOTAL_TOKENS_CAP, max_new_tokens=MAX_NEW_TOKENS,
+                        prefill_tokens=PREFILL_TOKENS_TARGET, max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+                        min_sequences=MIN_SEQUENCES):
+    """Largest TGI token limits that fit `instance_type`; raises ValueError if the weights don't fit."""
+    if instance_type not in INSTANCE_CATALOG:
+        raise ValueError(f"Unknown instance type {instance_type}; add it to INSTANCE_CATALOG")
+    instance_gpus, gpu = INSTANCE_CATALOG[instance_type]
+    num_gpus = num_gpus or instance_gpus
+    shape = model_shape(config)
+    weight_bytes = shape["parameters"] * (QUANTIZE_BYTES[quantize] if quantize else shape["dtype_bytes"])
+
+    # Tensor parallelism shards weights, KV heads and activations evenly across GPUs
+    usable = num_gpus * (GPUS[gpu] * (1 - safety_margin) - RUNTIME_OVERHEAD_GIB) * GiB
+    # Decode computes float32 logits for the last token of each sequence; prefill ones are budgeted below
+    budget = usable - weight_bytes - max_concurrent_requests * shape["vocab"] * 4
+    if budget <= 0:
+        raise ValueError(f"{shape['parameters'] / 1e9:.1f}B parameters ({weight_bytes / GiB:.1f} GiB) do not fit "
+                         f"{num_gpus}x {gpu} on {instance_type} with a {safety_margin:.0%} margin")
+
+    total = min(max_total_tokens, shape["max_position_embeddings"])
+    total = 2 ** int(math.log2(total)) if total >= MIN_TOTAL_TOKENS else total
+    while total >= MIN_TOTAL_TOKENS:
+        max_input = total - min(max_new_tokens, total // 2)
+        prefill = max(max_input, prefill_tokens)
+        needed = max(total, min_sequences * max_input, prefill)
+        # Shrink the prefill batch (not below one full prompt) until the rest holds `min_sequences` prompts
+        while True:
+            activations = prefill * (shape["prefill_bytes_per_token"] + shape["vocab"] * 4)
+            batch_total = _round_down((budget - activations) / shape["kv_bytes_per_token"], BLOCK_SIZE)
+            if batch_total >= needed or prefill <= max_input:
+                break
+            prefill = max(max_input, prefill // 2)
+            needed = max(total, min_sequences * max_input, prefill)
+        if batch_total >= needed:
+            break
+        total //= 2
+    else:
+        raise ValueError(f"Weights fit {instance_type} but not the KV cache and prefill of {min_sequences} "
+                         f"{MIN_TOTAL_TOKENS}-token sequences")
+
+    return {
+        "model_type": config.get("model_type"), "instance_type": instance_type, "gpus": f"{num_gpus}x {gpu}",
+        "num_gpus": num_gpus, "quantize": quantize, "parameters_b": round(shape["parameters"] / 1e9, 2),
+        "weights_gib": round(weight_bytes / GiB, 2), "kv_bytes_per_token": shape["kv_bytes_per_token"],
+        "max_input_tokens": max_input, "max_total_tokens": total, "max_batch_prefill_tokens": prefill,
+        "max_batch_total_tokens": batch_total, "full_length_sequences": batch_total // total,
+        "max_concurrent_requests": max_concurrent_requests, "cuda_memory_fraction": round(1 - safety_margin, 2),
+    }
+
+
+def serving_env(plan):
+    """TGI container environment variables for a plan."""
+    env = {
+        "SM_NUM_GPUS": json.dumps(plan["num_gpus"]),
+        "MAX_INPUT_TOKENS": str(plan["max_input_tokens"]),
+        "MAX_TOTAL_TOKENS": str(plan["max_total_tokens"]),
+        "MAX_BATCH_PREFILL_TOKENS": str(plan["max_batch_prefill_tokens"]),
+        "MAX_CONCURRENT_REQUESTS": str(plan["max_concurrent_requests"]),
+        "CUDA_MEMORY_FRACTION": str(plan["cuda_memory_fraction"]),
+    }
+    if plan["quantize"]:
+        env["HF_MODEL_QUANTIZE"] = plan["quantize"]
+    return env
+
+
+def estimate_prompt_tokens(prompt):
+    """Generous token count of a prompt string or a list of chat messages, without loading a tokenizer."""
+    if isinstance(prompt, str):
+        return math.ceil(len(prompt) / CHARS_PER_TOKEN)
+    return sum(estimate_prompt_tokens(m["content"]) + TEMPLATE_TOKENS_PER_MESSAGE for m in prompt)
+
+
+def fit_max_new_tokens(plan, prompt, requested):
+    """`requested` clamped so that prompt + new tokens stay within the plan's MAX_TOTAL_TOKENS."""
+    return max(1, min(requested, plan["max_total_tokens"] - estimate_prompt_tokens(prompt)))
+
+
+def print_plan(plan):
+    print(f"{plan['instance_type']} ({plan['gpus']}): {plan['parameters_b']}B parameters, "
+          f"{plan['weights_gib']} GiB weights, {plan['kv_bytes_per_token'] / 1024:.0f} KiB KV cache per token")
+    print(f"  MAX_INPUT_TOKENS={plan['max_input_tokens']} MAX_TOTAL_TOKENS={plan['max_total_tokens']} "
+          f"MAX_BATCH_PREFILL_TOKENS={plan['max_batch_prefill_tokens']}")
+    print(f"  expected max batch total tokens {plan['max_batch_total_tokens']} "
+          f"(~{plan['full_length_sequences']} full-length sequences in flight)")
+
+
+def check():
+    """Bundled configs against hand-computed sizes and the limits the deploy scripts relied on."""
+    gemma = model_shape(BUNDLED_CONFIGS["google/gemma-7b"])
+    assert gemma["kv_bytes_per_token"] == 2 * 28 * 16 * 256 * 2 == 458752, gemma
+    assert abs(gemma["parameters"] / 1e9 - 8.54) < 0.01, gemma["parameters"]
+    llama = model_shape(BUNDLED_CONFIGS["deepseek-ai/DeepSeek-R1-Distill-Llama-8B"])
+    assert llama["head_dim"] == 128 and llama["kv_bytes_per_token"] == 2 * 32 * 8 * 128 * 2 == 131072, llama
+    assert abs(llama["parameters"] / 1e9 - 8.03) < 0.01, llama["parameters"]
+
+    # Gemma on ml.g5.2xlarge stays within the hand-tuned, OOM-safe limits (1024/1024/2048) until higher
+    # ones are validated on hardware: its prefill logits alone take 1 GiB at 1024 tokens
+    plan = plan_serving_params(BUNDLED_CONFIGS["google/gemma-7b"], "ml.g5.2xlarge")
+    assert plan["max_input_tokens"] <= 1024 and plan["max_total_tokens"] <= 2048, plan
+    assert plan["max_batch_prefill_tokens"] <= 1024, plan
+    # The KV cache left after prefill still holds two full prompts, so requests batch
+    assert plan["max_batch_total_tokens"] >= 2 * plan["max_input_tokens"], plan
+    # GQA and a 128k vocabulary leave the 8B Llama room for longer sequences in the same memory,
+    # enough for the agent's 2048-token replies after a prompt of the same length
+    llama_plan = plan_serving_params(BUNDLED_CONFIGS["deepseek-ai/DeepSeek-R1-Distill-Llama-8B"], "ml.g5.2xlarge")
+    assert llama_plan["max_batch_total_tokens"] > 2 * plan["max_batch_total_tokens"], llama_plan
+    assert llama_plan["max_total_tokens"] >= 4096, llama_plan
+    assert llama_plan["max_batch_total_tokens"] >= 2 * llama_plan["max_input_tokens"], llama_plan
+    # max_new_tokens is clamped to what's left of MAX_TOTAL_TOKENS after the prompt
+    history = [{"role": "user", "content": "x" * 3 * 3000}]
+    assert (fit_max_new_tokens(llama_plan, history, 2048)
+            == llama_plan["max_total_tokens"] - 3000 - TEMPLATE_TOKENS_PER_MESSAGE)
+    assert fit_max_new_tokens(llama_plan, "what is aws sagemaker", 2048) == 2048
+    # More GPUs never shrink the limits, and weights that don't fit are rejected
+    for model_id, config in BUNDLED_CONFIGS.items():
+        small, large = (plan_serving_params(config, t) for t in ("ml.g5.2xlarge", "ml.g5.12xlarge"))
+        assert large["max_batch_total_tokens"] > small["max_batch_total_tokens"], model_id
+        assert large["max_total_tokens"] >= small["max_total_tokens"], model_id
+        try:
+            plan_serving_params(config, "ml.g4dn.xlarge")
+            raise AssertionError(f"{model_id} should not fit a 16 GB T4 unquantized")
+        except ValueError:
+            pass
+        assert plan_serving_params(config, "ml.g4dn.xlarge", quantize="awq")["max_total_tokens"] >= 1024
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size TGI token limits for a model and instance type.")
+    parser.add_argument("--model-id", default="google/gemma-7b", help="Hub id, bundled id, or config.json path")
+    parser.add_argument("--instance-type", default="ml.g5.2xlarge")
+    parser.add_argument("--num-gpus", type=int, default=None, help="Default: every GPU on the instance")
+    parser.add_argument("--quantize", default=None, choices=sorted(QUANTIZE_BYTES))
+    parser.add_argument("--safety-margin", type=float, default=SAFETY_MARGIN)
+    parser.add_argument("--all-instances", action="store_true", help="Plan for every instance in the catalog")
+    parser.add_argument("--check", action="store_true", help="Verify the calculator against the bundled configs")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+    else:
+        config = load_model_config(args.model_id, os.environ.get("HF_TOKEN"))
+        for instance_type in (INSTANCE_CATALOG if args.all_instances else [args.instance_type]):
+            try:
+                plan = plan_serving_params(config, instance_type, args.num_gpus, args.quantize, args.safety_margin)
+            except ValueError as e:
+                print(f"{instance_type}: {e}")
+                continue
+            print_plan(plan)
+            if not args.all_instances:
+                print(json.dumps(serving_env(plan), indent=2))
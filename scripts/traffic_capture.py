@@ -0,0 +1,409 @@
+# %% [markdown]
+# ## Traffic Capture and Replay
+# Records real endpoint traffic and replays it against another endpoint
+# configuration (instance type, TGI env, image version), so the two can be
+# compared on the same requests.
+#
+# **Capture** hooks the `sagemaker-runtime` client's event system, so any code
+# path that calls `invoke_endpoint` or `invoke_endpoint_with_response_stream`
+# is recorded without changes. That includes the agent, the HTTP server and the
+# benchmarks. One gzip JSON line per call holds:
+# - the payload and invoke parameters
+# - the arrival time
+# - latency and time to first token
+# - status and response size
+#
+# Payloads can be redacted:
+# - `secrets` (default): masks keys, tokens and e-mail addresses
+# - `content`: also replaces every word of text with filler. The word counts
+#   stay the same, so prompt lengths survive
+# - `drop`: keeps only sizes and parameters
+#
+# **Replay** reissues a log at the original inter-arrival times, or `--speed`
+# times faster, open-loop: a slow target doesn't delay later arrivals.
+# **Diff** prints latency and throughput side by side:
+#
+#     export TRAFFIC_CAPTURE_PATH=/tmp/capture.jsonl.gz    # picked up by capture_from_env()
+#     python traffic_capture.py replay --log /tmp/capture.jsonl.gz --endpoint-name candidate \
+#         --output /tmp/candidate.jsonl.gz --speed 2
+#     python traffic_capture.py diff /tmp/capture.jsonl.gz /tmp/candidate.jsonl.gz
+
+# %%
+import argparse
+import atexit
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH")  # Capture is off unless set
+CAPTURE_REDACTION = os.environ.get("TRAFFIC_CAPTURE_REDACT", "secrets")
+CAPTURE_SAMPLE = float(os.environ.get("TRAFFIC_CAPTURE_SAMPLE", "1.0"))  # Fraction of calls recorded
+REDACTION_MODES = ("none", "secrets", "content", "drop")
+OPERATIONS = ("InvokeEndpoint", "InvokeEndpointWithResponseStream")
+# Invoke parameters kept besides the body (routing and container options)
+CAPTURED_PARAMS = ("EndpointName", "ContentType", "Accept", "TargetVariant", "TargetModel",
+                   "TargetContainerHostname", "InferenceComponentName", "SessionId")
+LOG_VERSION = 1
+
+SECRET_PATTERNS = [
+    (re.compile(r"\b(AKIA|ASIA)[A-Z0-9]{16}\b"), "[AWS_KEY]"),
+    (re.compile(r"\bhf_[A-Za-z0-9]{20,}\b"), "[HF_TOKEN]"),
+    (re.compile(r"\b(sk|pk)-[A-Za-z0-9_-]{16,}\b"), "[API_KEY]"),
+    (re.compile(r"(?i)\bbearer\s+[A-Za-z0-9._~+/-]+=*"), "Bearer [TOKEN]"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "[EMAIL]"),
+    (re.compile(r"(?i)\b(password|passwd|secret|api[_-]?key|token)\b(\s*[:=]\s*)\S+"), r"\1\2[REDACTED]"),
+]
+# Keys whose string values are structure rather than content, kept under `content` redaction
+STRUCTURAL_KEYS = {"role", "type", "name", "model", "stop", "tool_choice", "response_format"}
+FILLER = "lorem"
+
+
+# --- Redaction ---
+
+def redact_text(text, mode):
+    if mode == "content":
+        return re.sub(r"\S+", FILLER, text)
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact_payload(value, mode, key=None):
+    """Copy of a JSON payload with string values redacted; numbers, booleans and structure are kept."""
+    if mode == "none":
+        return value
+    if isinstance(value, dict):
+        return {k: redact_payload(v, mode, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_payload(v, mode, key) for v in value]
+    if isinstance(value, str) and not (mode == "content" and key in STRUCTURAL_KEYS):
+        return redact_text(value, mode)
+    return value
+
+
+def _encode_body(body, content_type, mode):
+    if isinstance(body, str):
+        body = body.encode()
+    record = {"request_bytes": len(body)}
+    if mode == "drop":
+        return record
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        # Not JSON: only secret masking applies to raw text; binary bodies are dropped
+        try:
+            record["body_text"] = redact_text(body.decode("utf-8"), mode) if mode != "none" else body.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+        return record
+    record["body"] = redact_payload(payload, mode)
+    return record
+
+
+def _decode_body(record):
+    if "body" in record:
+        return json.dumps(record["body"]).encode()
+    if "body_text" in record:
+        return record["body_text"].encode()
+    # Dropped payloads replay as a prompt of the same byte size
+    return json.dumps({"inputs": "x" * max(0, record["request_bytes"] - 14)}).encode()
+
+
+# --- Log files ---
+
+class TrafficLog:
+    """Append-only gzip JSON lines: a header, then one record per call."""
+
+    def __init__(self, path, header=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = 0
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write(dict({"version": LOG_VERSION, "created": time.time()}, **(header or {})))
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def append(self, record):
+        with self.lock:
+            self._write(record)
+            self.records += 1
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        with self.lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def load_log(path):
+    """(header, records) of a capture or replay log, records sorted by arrival."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, sorted(records, key=lambda r: r["ts"])
+
+
+# --- Capture ---
+
+class _MeasuredStream:
+    """Wraps a response EventStream to time the first and last event and count bytes."""
+
+    def __init__(self, stream, on_done):
+        self._stream = stream
+        self._on_done = on_done
+        self._done = False
+
+    def _finish(self, first, size, completed):
+        if not self._done:
+            self._done = True
+            self._on_done(first, size, completed)
+
+    def __iter__(self):
+        first, size, completed = None, 0, False
+        try:
+            for event in self._stream:
+                part = event.get("PayloadPart")
+                if part:
+                    first = first or time.perf_counter()
+                    size += len(part["Bytes"])
+                yield event
+            completed = True
+        finally:
+            self._finish(first, size, completed)
+
+    def close(self):
+        self._stream.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class TrafficCapture:
+    """Records every InvokeEndpoint(WithResponseStream) call made by hooked clients."""
+
+    def __init__(self, path, redaction=CAPTURE_REDACTION, sample=CAPTURE_SAMPLE):
+        if redaction not in REDACTION_MODES:
+            raise ValueError(f"redaction must be one of {REDACTION_MODES}")
+        self.log = TrafficLog(path, {"kind": "capture", "redaction": redaction})
+        self.redaction = redaction
+        self.sample = sample
+        self.random = random.Random()
+
+    def attach(self, target):
+        """Hook a boto3 Session (clients created afterwards) or an existing client."""
+        events = target.meta.events if hasattr(target, "meta") else target.events
+        for operation in OPERATIONS:
+            events.register(f"provide-client-params.sagemaker-runtime.{operation}", self._before)
+            events.register(f"after-call.sagemaker-runtime.{operation}", self._after)
+            events.register(f"after-call-error.sagemaker-runtime.{operation}", self._error)
+        return target
+
+    def _before(self, params, model, context, **kwargs):
+        if self.sample < 1.0 and self.random.random() >= self.sample:
+            return
+        record = {"ts": time.time(), "op": model.name}
+        record.update({key: params[key] for key in CAPTURED_PARAMS if key in params})
+        record.update(_encode_body(params.get("Body", b""), params.get("ContentType"), self.redaction))
+        context["traffic_capture"] = (record, time.perf_counter())
+
+    def _after(self, http_response, parsed, model, context, **kwargs):
+        captured = context.pop("traffic_capture", None)
+        if not captured:
+            return
+        record, started = captured
+        now = time.perf_counter()
+        record["status"] = http_response.status_code
+        if "Error" in parsed:
+            record["error"] = parsed["Error"].get("Code")
+        if model.name == "InvokeEndpoint" or "Error" in parsed or "Body" not in parsed:
+            # The non-streaming response arrives in one piece, when generation has finished
+            record["latency_ms"] = round((now - started) * 1000, 1)
+            record["response_bytes"] = int(http_response.headers.get("Content-Length") or 0)
+            self.log.append(record)
+            return
+
+        def on_done(first, size, completed):
+            end = time.perf_counter()
+            record["ttft_ms"] = round((first - started) * 1000, 1) if first else None
+            record["latency_ms"] = round((end - started) * 1000, 1)
+            record["response_bytes"] = size
+            if not completed:
+                record["cancelled"] = True  # Caller stopped reading (e.g. turn deadline)
+            self.log.append(record)
+
+        parsed["Body"] = _MeasuredStream(parsed["Body"], on_done)
+
+    def _error(self, exception, context, **kwargs):
+        captured = context.pop("traffic_capture", None)
+        if not captured:
+            return
+        record, started = captured
+        record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        record["status"] = 0
+        record["error"] = type(exception).__name__
+        self.log.append(record)
+
+    def close(self):
+        if not self.log.closed:
+            self.log.close()
+            print(f"Captured {self.log.records} calls to {self.log.path}")
+
+
+def capture_from_env(boto_session):
+    """Attach a TrafficCapture to `boto_session` if TRAFFIC_CAPTURE_PATH is set; returns it or None."""
+    if not CAPTURE_PATH:
+        return None
+    capture = TrafficCapture(CAPTURE_PATH)
+    capture.attach(boto_session)
+    atexit.register(capture.close)  # Writes the gzip trailer
+    print(f"Capturing endpoint traffic to {CAPTURE_PATH} (redaction: {capture.redaction})")
+    return capture
+
+
+# --- Replay ---
+
+def _reissue(runtime_client, record, endpoint_name):
+    params = {key: record[key] for key in CAPTURED_PARAMS if key in record}
+    if endpoint_name:
+        params["EndpointName"] = endpoint_name
+    params["Body"] = _decode_body(record)
+    result = {"status": 200}
+    started = time.perf_counter()
+    try:
+        if record["op"] == "InvokeEndpoint":
+            response = runtime_client.invoke_endpoint(**params)
+            result["response_bytes"] = len(response["Body"].read())
+        else:
+            response = runtime_client.invoke_endpoint_with_response_stream(**params)
+            size = 0
+            for event in response["Body"]:
+                part = event.get("PayloadPart")
+                if part:
+                    if not size:
+                        result["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    size += len(part["Bytes"])
+            result["response_bytes"] = size
+    except Exception as e:
+        error = getattr(e, "response", {}).get("Error", {})
+        result["status"] = getattr(e, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        result["error"] = error.get("Code") or type(e).__name__
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def replay(records, runtime_client, endpoint_name=None, speed=1.0, workers=64, output_path=None):
+    """Reissue `records` at their original inter-arrival times divided by `speed`; returns replayed records."""
+    output = TrafficLog(output_path, {"kind": "replay", "speed": speed, "target": endpoint_name}) if output_path else None
+    results = [None] * len(records)
+    origin = records[0]["ts"] if records else 0.0
+    started = time.perf_counter()
+    wall_start = time.time()
+
+    def run(index, record):
+        result = {key: record[key] for key in ("op",) + CAPTURED_PARAMS if key in record}
+        if endpoint_name:
+            result["EndpointName"] = endpoint_name
+        result["request_bytes"] = record.get("request_bytes")
+        issued = time.perf_counter()
+        result["ts"] = wall_start + (issued - started)
+        # How late the request left compared to its schedule (a saturated client shows up here)
+        result["lag_ms"] = round((issued - started - (record["ts"] - origin) / speed) * 1000, 1)
+        result.update(_reissue(runtime_client, record, endpoint_name))
+        results[index] = result
+        if output:
+            output.append(result)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay") as executor:
+        for index, record in enumerate(records):
+            delay = (record["ts"] - origin) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, index, record)
+    if output:
+        output.close()
+    return results
+
+
+# --- Comparison ---
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def summarize(records):
+    ok = [r for r in records if not r.get("error")]
+    latencies = [r["latency_ms"] for r in ok]
+    ttfts = [r["ttft_ms"] for r in ok if r.get("ttft_ms") is not None]
+    span = max(r["ts"] + r["latency_ms"] / 1000 for r in records) - min(r["ts"] for r in records) if records else 0
+    return {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "error_rate": (len(records) - len(ok)) / len(records) if records else 0.0,
+        "p50_ms": _percentile(latencies, 50), "p90_ms": _percentile(latencies, 90),
+        "p99_ms": _percentile(latencies, 99), "ttft_p50_ms": _percentile(ttfts, 50),
+        "ttft_p90_ms": _percentile(ttfts, 90),
+        "throughput_rps": len(ok) / span if span else 0.0,
+        "response_kib_s": sum(r.get("response_bytes") or 0 for r in ok) / 1024 / span if span else 0.0,
+        "max_lag_ms": max((r.get("lag_ms", 0.0) for r in records), default=0.0),
+    }
+
+
+def print_diff(baseline, candidate, labels=("baseline", "candidate")):
+    """Side-by-side summary of two logs' records with the relative change."""
+    a, b = summarize(baseline), summarize(candidate)
+    print(f"{'metric':>16} {labels[0]:>12} {labels[1]:>12} {'change':>9}")
+    for key in ("requests", "errors", "error_rate", "p50_ms", "p90_ms", "p99_ms", "ttft_p50_ms", "ttft_p90_ms",
+                "throughput_rps", "response_kib_s", "max_lag_ms"):
+        left, right = a[key], b[key]
+        change = f"{(right - left) / left:+.1%}" if left and right is not None else ""
+        fmt = (lambda v: "-" if v is None else str(v) if isinstance(v, int) else
+               f"{v:.3f}" if key == "error_rate" else f"{v:.1f}")
+        print(f"{key:>16} {fmt(left):>12} {fmt(right):>12} {change:>9}")
+    return a, b
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured endpoint traffic and compare results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="Reissue a capture log against an endpoint")
+    replay_parser.add_argument("--log", required=True)
+    replay_parser.add_argument("--endpoint-name", default=None, help="Target endpoint (default: as captured)")
+    replay_parser.add_argument("--endpoint-url", default=os.environ.get("SAGEMAKER_RUNTIME_ENDPOINT_URL"))
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="2 replays twice as fast")
+    replay_parser.add_argument("--workers", type=int, default=64, help="Max requests in flight")
+    replay_parser.add_argument("--limit", type=int, default=None, help="Replay only the first N records")
+    replay_parser.add_argument("--output", default=None, help="Log file for the replayed results")
+
+    diff_parser = commands.add_parser("diff", help="Compare two capture/replay logs")
+    diff_parser.add_argument("baseline")
+    diff_parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        import boto3
+        from botocore.config import Config
+
+        header, records = load_log(args.log)
+        records = records[:args.limit] if args.limit else records
+        client = boto3.Session().client("sagemaker-runtime", endpoint_url=args.endpoint_url, config=Config(
+            max_pool_connections=args.workers, read_timeout=300, retries={"total_max_attempts": 1}))
+        print(f"Replaying {len(records)} calls (captured with redaction={header.get('redaction')}) "
+              f"at {args.speed}x")
+        results = replay(records, client, args.endpoint_name, args.speed, args.workers, args.output)
+        print_diff(records, results, ("captured", "replayed"))
+    else:
+        print_diff(load_log(args.baseline)[1], load_log(args.candidate)[1], ("baseline", "candidate"))
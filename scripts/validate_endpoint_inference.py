@@ -4,6 +4,8 @@
 
 
 # %%
+import os
+
 # --- Configuration ---
 # Use the same profile as in the deployment script
 PROFILE_NAME = os.environ.get('AWS_PROFILE', 'default') 
@@ -17,7 +19,7 @@ import boto3
 import sagemaker
 from sagemaker.huggingface import HuggingFacePredictor
 from sagemaker.session import Session
-import os
+from endpoint_warmup import deployed_max_input_tokens, warmup_from_env
 
 # --- Session Initialization ---
 try:
@@ -43,6 +45,19 @@ predictor = HuggingFacePredictor(
     sagemaker_session=sess
 )
 
+# --- Warmup (Readiness Gate) ---
+# Send the synthetic warmup workload until latency is stable, so the test below measures a warm endpoint.
+# Set SAGEMAKER_RUNTIME_ENDPOINT_URL to run against local_endpoint_standin.py, ENABLE_WARMUP=false to skip.
+# Warmup prompts are capped below the endpoint's MAX_INPUT_TOKENS (1024 for Gemma on ml.g5.2xlarge), which TGI enforces.
+# On an endpoint hosting inference components, SAGEMAKER_INFERENCE_COMPONENT names the model to warm.
+INFERENCE_COMPONENT = os.environ.get('SAGEMAKER_INFERENCE_COMPONENT')
+max_input_tokens = None if os.environ.get('SAGEMAKER_RUNTIME_ENDPOINT_URL') else deployed_max_input_tokens(
+    boto_session.client("sagemaker"), ENDPOINT_NAME, INFERENCE_COMPONENT)
+warmup = warmup_from_env(ENDPOINT_NAME, boto_session, max_input_tokens=max_input_tokens,
+                         inference_component=INFERENCE_COMPONENT)
+if warmup and not warmup["ready"]:
+    print("Warning: latency had not stabilized during warmup.")
+
 # --- Inference Parameters ---
 # These parameters control the generation behavior
 parameters = {